@@ -0,0 +1,108 @@
+"""
+Outils communs sur les adresses de livraison
+"""
+
+import math
+import re
+import unicodedata
+
+# Coordonnées du restaurant Chicken Hot Dreux
+RESTAURANT_COORDS = (48.7333, 1.3667)  # Dreux, France
+
+VILLE_PAR_DEFAUT = 'Dreux'
+
+RAYON_TERRE_KM = 6371.0088
+
+# Villes reconnues dans une adresse dictée (sinon on ajoute la ville par défaut)
+VILLES_RECONNUES = ('dreux', 'vernouillet')
+
+# Abréviations courantes (dictées ou transcrites) -> forme complète
+ABREVIATIONS = {
+    'r': 'rue',
+    'av': 'avenue',
+    'ave': 'avenue',
+    'bd': 'boulevard',
+    'bld': 'boulevard',
+    'blvd': 'boulevard',
+    'boul': 'boulevard',
+    'pl': 'place',
+    'all': 'allee',
+    'imp': 'impasse',
+    'ch': 'chemin',
+    'rte': 'route',
+    'fg': 'faubourg',
+    'sq': 'square',
+    'res': 'residence',
+    'st': 'saint',
+    'ste': 'sainte',
+}
+
+_CODE_POSTAL = re.compile(r'\b\d{5}\b')
+_NON_ALPHANUM = re.compile(r'[^a-z0-9]+')
+
+
+def ajouter_ville_par_defaut(adresse):
+    """Ajoute ", Dreux" si aucune ville connue n'est mentionnée"""
+    adresse_lower = adresse.lower()
+    if not any(ville in adresse_lower for ville in VILLES_RECONNUES):
+        adresse += f', {VILLE_PAR_DEFAUT}'
+    return adresse
+
+
+def extraire_adresse_manuel(transcript):
+    """Extraction manuelle d'adresse (regex) si OpenAI échoue"""
+    transcript_lower = transcript.lower()
+    
+    # Patterns d'adresse
+    patterns = [
+        r'(\d+\s+(?:rue|avenue|boulevard|av|bd|place)\s+[^,\.]+(?:,\s*\w+)?)',
+        r'(au\s+\d+\s+[^,\.]+(?:,\s*\w+)?)',
+        r'(\d+\s+[^,\.]+(?:dreux|vernouillet|cherisy))',
+    ]
+    
+    for pattern in patterns:
+        match = re.search(pattern, transcript_lower, re.IGNORECASE)
+        if match:
+            adresse = match.group(1).strip()
+            # Ajouter Dreux si pas de ville
+            return ajouter_ville_par_defaut(adresse)
+    
+    return ''
+
+
+def sans_accents(texte):
+    """Supprime les accents ("Chérisy" -> "Cherisy")"""
+    decompose = unicodedata.normalize('NFKD', texte)
+    return ''.join(c for c in decompose if not unicodedata.combining(c))
+
+
+def normaliser_texte(texte):
+    """Minuscules, sans accents, ponctuation, code postal ni "France", abréviations développées"""
+    texte = _CODE_POSTAL.sub(' ', sans_accents(texte.lower()))
+    mots = _NON_ALPHANUM.sub(' ', texte).split()
+
+    # "au 15 rue ..." -> "15 rue ..."
+    if mots and mots[0] == 'au':
+        mots = mots[1:]
+
+    # "15 rue de la gare à Dreux" et "15 rue de la Gare, Dreux" donnent la même clé
+    return ' '.join(ABREVIATIONS.get(mot, mot) for mot in mots if mot not in ('france', 'a'))
+
+
+def normaliser_adresse(adresse):
+    """
+    Forme canonique d'une adresse, utilisée comme clé de cache :
+    texte normalisé et ville ajoutée comme dans extraire_adresse_manuel
+    """
+    if not adresse:
+        return ''
+    return normaliser_texte(ajouter_ville_par_defaut(adresse.strip()))
+
+
+def distance_haversine(coords1, coords2):
+    """Distance approchée en km (sphère) entre deux points (lat, lon)"""
+    lat1, lon1 = map(math.radians, coords1)
+    lat2, lon2 = map(math.radians, coords2)
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,198 @@
+"""
+Archivage des commandes terminées ou anciennes (stockage chaud / froid)
+
+Le nœud `orders` ne garde que le service en cours : les commandes terminées
+depuis ARCHIVE_DONE_AGE_HOURS, ou créées depuis plus de ARCHIVE_MAX_AGE_HOURS
+quel que soit leur statut, sont déplacées vers `orders_archive/AAAA-MM-JJ`.
+Les totaux du jour (`archive_totals/AAAA-MM-JJ`) sont incrémentés dans la même
+écriture multi-chemins que le déplacement : une commande n'est jamais comptée
+sans être archivée, ni archivée sans être comptée. Ses détails
+(`order_details/<id>`) passent dans `order_details_archive/AAAA-MM-JJ` dans
+la même écriture.
+
+Les commandes candidates sont lues par intervalle de clés push (les plus
+anciennes d'abord), par lots : le coût d'un passage ne dépend pas du volume
+total de l'historique.
+
+Usage en ligne de commande (un passage d'archivage) :
+    python archive.py
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from firebase_setup import db
+
+from push_ids import borne_id_push, horodatage_id_push
+from orders_api import fuseau_restaurant
+from order_details import DETAILS_NODE, DETAILS_ARCHIVE_NODE
+
+ARCHIVE_NODE = 'orders_archive'
+TOTALS_NODE = 'archive_totals'
+LEASE_PATH = 'archive_meta/lease'
+
+ARCHIVE_DONE_AGE_HOURS = float(os.environ.get('ARCHIVE_DONE_AGE_HOURS', 2))
+ARCHIVE_MAX_AGE_HOURS = float(os.environ.get('ARCHIVE_MAX_AGE_HOURS', 24))
+ARCHIVE_STATUSES = set(os.environ.get('ARCHIVE_STATUSES', 'completed,cancelled').split(','))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 200))
+# Intervalle entre deux passages automatiques (0 = désactivé)
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 600))
+
+_ID_INSTANCE = uuid.uuid4().hex[:8]
+
+
+def jour_commande(order_id):
+    """Date (AAAA-MM-JJ, heure du restaurant) de création d'une commande, d'après sa clé"""
+    instant = datetime.fromtimestamp(horodatage_id_push(order_id) / 1000, tz=fuseau_restaurant())
+    return instant.strftime('%Y-%m-%d')
+
+
+def increment(valeur):
+    return {'.sv': {'increment': valeur}}
+
+
+def chemins_archivage(commandes, details=None):
+    """Update() multi-chemins qui déplace les commandes (et leurs détails) et incrémente les totaux de leur jour"""
+    updates = {}
+    totaux = defaultdict(lambda: defaultdict(float))
+    details = details or {}
+
+    for order_id, commande in commandes.items():
+        jour = jour_commande(order_id)
+        updates[f'orders/{order_id}'] = None
+        updates[f'{ARCHIVE_NODE}/{jour}/{order_id}'] = commande
+        if order_id in details:
+            updates[f'{DETAILS_NODE}/{order_id}'] = None
+            updates[f'{DETAILS_ARCHIVE_NODE}/{jour}/{order_id}'] = details[order_id]
+
+        t = totaux[jour]
+        t['commandes'] += 1
+        t['chiffre_affaires'] += float(commande.get('total', 0) or 0)
+        t['frais_livraison'] += float(commande.get('delivery_fee', 0) or 0)
+        t[f"par_type/{commande.get('type_service') or 'Non spécifié'}"] += 1
+        t[f"par_statut/{commande.get('status') or 'pending'}"] += 1
+
+    for jour, t in totaux.items():
+        for champ, valeur in t.items():
+            valeur = round(valeur, 2) if champ in ('chiffre_affaires', 'frais_livraison') else int(valeur)
+            updates[f'{TOTALS_NODE}/{jour}/{champ}'] = increment(valeur)
+    return updates
+
+
+def _lire_details(order_ids):
+    """Détails des commandes d'un lot, en une lecture de l'intervalle de clés du lot"""
+    cles = sorted(order_ids)
+    trouves = db.reference(DETAILS_NODE).order_by_key().start_at(cles[0]).end_at(cles[-1]).get() or {}
+    return {order_id: d for order_id, d in trouves.items() if order_id in order_ids}
+
+
+def _doit_archiver(commande, age_h):
+    if not isinstance(commande, dict):
+        return True
+    if age_h >= ARCHIVE_MAX_AGE_HOURS:
+        return True
+    return commande.get('status') in ARCHIVE_STATUSES and age_h >= ARCHIVE_DONE_AGE_HOURS
+
+
+def _prendre_bail(duree_s):
+    """Un seul archiveur à la fois entre les instances (bail Firebase avec expiration)"""
+    maintenant = time.time()
+
+    def prendre(bail):
+        if bail and bail.get('proprietaire') != _ID_INSTANCE and bail.get('expire', 0) > maintenant:
+            return bail
+        return {'proprietaire': _ID_INSTANCE, 'expire': maintenant + duree_s}
+
+    try:
+        bail = db.reference(LEASE_PATH).transaction(prendre)
+    except Exception as e:
+        print(f"⚠️ Bail d'archivage indisponible: {e}")
+        return False
+    return bail.get('proprietaire') == _ID_INSTANCE
+
+
+def _rendre_bail():
+    try:
+        db.reference(LEASE_PATH).transaction(
+            lambda bail: None if bail and bail.get('proprietaire') == _ID_INSTANCE else bail
+        )
+    except Exception:
+        pass
+
+
+def archiver(now_ms=None, taille_lot=ARCHIVE_BATCH_SIZE):
+    """Un passage d'archivage ; retourne le nombre de commandes archivées par jour"""
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    if not _prendre_bail(duree_s=300):
+        print("⏭️ Archivage déjà en cours sur une autre instance")
+        return {}
+
+    archives = defaultdict(int)
+    try:
+        # Seules les commandes plus anciennes que le délai minimal sont lues
+        cle_max = borne_id_push(now_ms - int(ARCHIVE_DONE_AGE_HOURS * 3_600_000))
+        depart = None
+        while True:
+            requete = db.reference('orders').order_by_key().end_at(cle_max)
+            if depart:
+                requete = requete.start_at(depart)
+            lot = requete.limit_to_first(taille_lot + 1).get() or {}
+            cles = [cle for cle in lot if cle != depart]
+            if not cles:
+                break
+
+            a_deplacer = {}
+            for cle in cles:
+                age_h = (now_ms - horodatage_id_push(cle)) / 3_600_000
+                if _doit_archiver(lot[cle], age_h):
+                    a_deplacer[cle] = lot[cle] if isinstance(lot[cle], dict) else {'valeur': lot[cle]}
+
+            if a_deplacer:
+                db.reference().update(chemins_archivage(a_deplacer, _lire_details(a_deplacer)))
+                for cle in a_deplacer:
+                    archives[jour_commande(cle)] += 1
+
+            if len(lot) <= taille_lot:
+                break
+            depart = cles[-1]
+    finally:
+        _rendre_bail()
+
+    total = sum(archives.values())
+    if total:
+        print(f"🗄️ {total} commande(s) archivée(s) : {dict(archives)}")
+    return dict(archives)
+
+
+def demarrer_archivage_periodique(intervalle=ARCHIVE_INTERVAL):
+    """Thread d'arrière-plan qui lance archiver() toutes les `intervalle` secondes"""
+    if intervalle <= 0:
+        return None
+
+    def boucle():
+        while True:
+            time.sleep(intervalle)
+            try:
+                archiver()
+            except Exception as e:
+                print(f"⚠️ Erreur d'archivage: {e}")
+
+    thread = threading.Thread(target=boucle, name='archivage', daemon=True)
+    thread.start()
+    return thread
+
+
+def totaux_jour(jour):
+    """Totaux pré-calculés d'un jour archivé"""
+    return db.reference(f'{TOTALS_NODE}/{jour}').get() or {}
+
+
+if __name__ == '__main__':
+    from firebase_setup import initialiser_firebase
+    initialiser_firebase()
+    print(archiver())
@@ -0,0 +1,170 @@
+"""
+Mode de service asynchrone (ASGI) pour le webhook Retell
+
+En mode synchrone (server:app sous gunicorn --threads 8), chaque appel en
+cours occupe un thread pendant qu'il attend GPT-4o ou Nominatim : au-delà de
+8 appels simultanés, les suivants attendent un thread libre. Ici, le webhook
+est une coroutine : les attentes réseau (AsyncOpenAI, file Nominatim
+partagée) ne tiennent plus de thread, et un seul worker peut suivre des centaines
+d'appels en même temps.
+
+Seules les étapes courtes et bloquantes passent par le pool de threads
+d'asyncio : déduplication, cache/gazetteer, enregistrement de la commande.
+Le flux SSE des écrans (/orders/stream) est lui aussi une coroutine, sans
+limite de connexions. Toutes les autres routes (tableau de bord, API,
+administration) restent servies par l'application Flask, montée en WSGI.
+
+Lancement :
+    gunicorn --bind :$PORT --workers 1 -k uvicorn.workers.UvicornWorker asgi_app:app
+    uvicorn asgi_app:app --port 5000
+"""
+
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+# Les singletons (déduplication, cache, boîte d'envoi, réplique...) sont ceux du serveur
+import server
+from dedup import EN_COURS
+from logging_setup import obtenir_logger, evenement, contexte_appel
+from metrics import Chronometre, duree_webhook, deduplication
+from order_analyzer import analyser_commande_async
+from order_feed import flux_sse_async
+from prefetch import GeocodageAnticipeAsync
+from startup import demarrage
+
+logger = obtenir_logger('asgi')
+
+
+async def verify_address_async(address, priorite, abonnement=None):
+    """Version non bloquante de server.verify_address() : attend la file Nominatim partagée sans thread"""
+    if not address or address == '':
+        return {'valid': False, 'error': 'Pas d\'adresse'}
+
+    local = await asyncio.to_thread(server.geocodage_local, address)
+    if local is not None:
+        return local
+
+    try:
+        # shield : annuler la tâche ne doit pas annuler la future partagée avec d'autres commandes
+        # (le retrait de la file passe par client_nominatim.abandonner)
+        return await asyncio.shield(asyncio.wrap_future(server.demande_nominatim(address, priorite, abonnement)))
+    except Exception as e:
+        return server.erreur_geocodage(e)
+
+
+async def localiser_adresse_async(address, origine='direct', abonnement=None):
+    """Vérifie l'adresse et ajoute la distance au restaurant"""
+    with Chronometre('geocode'):
+        address_info = await verify_address_async(address, server.priorite_geocodage(origine), abonnement)
+    return server.ajouter_distance(address_info)
+
+
+async def traiter_commande_async(call_id, transcript, from_number):
+    """Même pipeline que server.traiter_commande(), sans bloquer la boucle pendant les appels réseau"""
+    debut = time.perf_counter()
+    timings = {}
+
+    anticipation = GeocodageAnticipeAsync(localiser_adresse_async, server.client_nominatim.abandonner)
+    server.lancer_geocodage_regex(anticipation, transcript)
+
+    def on_champs(type_service, adresse):
+        if type_service == 'Livraison' and adresse:
+            anticipation.lancer(adresse, 'stream')
+
+    etape = time.perf_counter()
+    analysis = await analyser_commande_async(transcript, on_champs=on_champs)
+    timings['analyse'] = round((time.perf_counter() - etape) * 1000, 1)
+
+    if not analysis:
+        anticipation.annuler()
+        logger.error("❌ Analyse impossible")
+        return {'status': 'error', 'message': 'Analyse impossible'}, 500
+
+    address_info = None
+    delivery_address = server.adresse_a_geocoder(analysis)
+    if delivery_address:
+        server.client_nominatim.prioriser(delivery_address)
+        address_info = await anticipation.resultat(delivery_address)
+        timings['geocodage'] = anticipation.mesure
+    else:
+        anticipation.annuler()
+
+    return await asyncio.to_thread(
+        server.finaliser_commande, call_id, transcript, from_number, analysis, address_info, timings, debut)
+
+
+async def traiter_appel_async(call_id, transcript, from_number):
+    """Dédoublonne puis traite un appel (voir server.traiter_appel)"""
+    with Chronometre('dedup') as mesure:
+        existing_order_id = await asyncio.to_thread(server.dedup.reserver, call_id)
+
+    if existing_order_id == EN_COURS:
+        deduplication.inc('en_cours')
+        evenement(logger, 'doublon', "⚠️ Appel déjà en cours de traitement", resultat='en_cours', duree_ms=mesure.ms)
+        return {'status': 'duplicate', 'call_id': call_id}, 200
+    if existing_order_id:
+        deduplication.inc('doublon')
+        evenement(logger, 'doublon', "⚠️ Appel déjà traité", resultat='doublon',
+                  order_id=existing_order_id, duree_ms=mesure.ms)
+        return {'status': 'duplicate', 'call_id': call_id, 'order_id': existing_order_id}, 200
+
+    deduplication.inc('nouveau')
+
+    try:
+        return await traiter_commande_async(call_id, transcript, from_number)
+    finally:
+        server.dedup.liberer(call_id)
+
+
+async def retell_webhook(request):
+    """Webhook pour recevoir les appels de Retell AI (coroutine)"""
+    debut = time.perf_counter()
+    try:
+        data = await request.json()
+
+        call_data = data.get('call', {})
+        call_id = call_data.get('call_id')
+        transcript = call_data.get('transcript', '')
+        from_number = call_data.get('from_number', 'Non fourni')
+
+        evenement(logger, 'webhook_recu', "📞 Webhook Retell reçu", call_id=call_id,
+                  telephone=from_number, longueur_transcription=len(transcript))
+
+        if not transcript:
+            logger.warning("❌ Pas de transcription", extra={'call_id': call_id})
+            result, status_code = {'status': 'error', 'message': 'Pas de transcription'}, 400
+        else:
+            # Le contexte (contextvars) suit la coroutine et les appels asyncio.to_thread
+            with contexte_appel(call_id=call_id):
+                result, status_code = await traiter_appel_async(call_id, transcript, from_number)
+    except Exception as e:
+        logger.exception("❌ Erreur critique du webhook: %s", e)
+        result, status_code = {'status': 'error', 'message': str(e)}, 500
+
+    duree_webhook.observer(time.perf_counter() - debut, str(status_code))
+    demarrage.requete_servie('webhook')
+    return JSONResponse(result, status_code=status_code)
+
+
+async def orders_stream(request):
+    """Flux SSE des commandes (voir server.orders_stream), sans occuper de thread par écran"""
+    curseur = request.headers.get('last-event-id') or request.query_params.get('cursor')
+    return StreamingResponse(
+        flux_sse_async(curseur),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+routes = [Route('/orders/stream', orders_stream, methods=['GET'])]
+# En WEBHOOK_MODE=async (file + workers), la route Flask répond déjà sans attendre : on la garde
+if server.WEBHOOK_MODE == 'sync':
+    routes.append(Route('/webhook/retell', retell_webhook, methods=['POST']))
+routes.append(Mount('/', app=WSGIMiddleware(server.app)))
+
+app = Starlette(routes=routes)
@@ -0,0 +1,375 @@
+"""
+Faux services pour le banc d'essai : OpenAI, Nominatim et Realtime Database
+
+Chaque faux service répond après une latence configurable ("moyenne:écart"
+en ms, tirage normal tronqué à 0), pour reproduire un vendredi soir chargé
+sans appeler les vrais services ni payer GPT-4o.
+
+- OpenAI : POST /v1/chat/completions (avec ou sans stream), GET /v1/models.
+  La réponse JSON est construite par l'analyse rapide du dépôt à partir de
+  la transcription du prompt, pour que la suite du pipeline ait des données
+  réalistes.
+- Nominatim : GET /search, coordonnées autour de Dreux (une part configurable
+  des adresses est introuvable, toujours les mêmes).
+- Realtime Database : sous-ensemble de l'API REST utilisé par firebase_admin
+  via FIREBASE_DATABASE_EMULATOR_HOST : get/set/update multi-chemins (avec
+  incréments .sv), requêtes par clé (orderBy="$key", startAt, endAt,
+  limitToFirst) et écouteurs (text/event-stream).
+
+Usage autonome :
+    python bench/fakes.py --openai 800:200 --nominatim 150:50 --firebase 40:15
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quick_parser import analyser_commande_rapide  # noqa: E402
+
+_PROMPT_TRANSCRIPTION = re.compile(r"TRANSCRIPTION DE L'APPEL :\n(.*?)\n\nMENU :", re.DOTALL)
+
+
+def lire_latence(texte):
+    """'800:200' -> (800.0, 200.0)"""
+    moyenne, _, ecart = str(texte).partition(':')
+    return float(moyenne or 0), float(ecart or 0)
+
+
+class _Latence:
+    def __init__(self, spec):
+        self.moyenne, self.ecart = lire_latence(spec)
+
+    def attendre(self):
+        if self.moyenne or self.ecart:
+            time.sleep(max(0.0, random.gauss(self.moyenne, self.ecart)) / 1000)
+
+
+class _Base(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latence = _Latence('0')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _corps(self):
+        taille = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(taille) if taille else b''
+
+    def _json(self, donnees, code=200, entetes=None):
+        corps = json.dumps(donnees).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corps)))
+        for cle, valeur in (entetes or {}).items():
+            self.send_header(cle, valeur)
+        self.end_headers()
+        self.wfile.write(corps)
+
+
+# --- OpenAI ------------------------------------------------------------------
+
+def reponse_commande(prompt):
+    """JSON de commande "comme GPT-4o", à partir de la transcription contenue dans le prompt"""
+    m = _PROMPT_TRANSCRIPTION.search(prompt)
+    resultat, _, _ = analyser_commande_rapide(m.group(1) if m else prompt)
+    return json.dumps({
+        'type_appel': resultat['type_appel'],
+        'type_service': resultat['type_service'] if resultat['type_service'] != 'Non spécifié' else 'À emporter',
+        'adresse_livraison': resultat['adresse_livraison'],
+        'articles': [
+            {'nom': a['nom'], 'prix': a['prix'], 'quantite': a['quantite']}
+            for a in resultat['articles_detailles']
+        ],
+        'prix_total': resultat['prix_total'],
+        'notes': ''
+    }, ensure_ascii=False)
+
+
+class FauxOpenAI(_Base):
+    def do_GET(self):
+        self.latence.attendre()
+        self._json({'object': 'list', 'data': [{'id': 'gpt-4o', 'object': 'model'}]})
+
+    def do_POST(self):
+        requete = json.loads(self._corps() or b'{}')
+        prompt = requete.get('messages', [{}])[-1].get('content', '')
+        contenu = reponse_commande(prompt)
+        usage = {
+            'prompt_tokens': len(prompt) // 4,
+            'completion_tokens': len(contenu) // 4,
+            'total_tokens': (len(prompt) + len(contenu)) // 4
+        }
+        base = {'id': 'chatcmpl-bench', 'created': int(time.time()), 'model': requete.get('model', 'gpt-4o')}
+
+        if not requete.get('stream'):
+            self.latence.attendre()
+            self._json(dict(base, object='chat.completion', usage=usage, choices=[{
+                'index': 0, 'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': contenu}
+            }]))
+            return
+
+        # Streaming : la latence est répartie entre le premier token et la suite
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        debut = time.monotonic()
+        self.latence.attendre()
+        duree = time.monotonic() - debut
+        time.sleep(duree * 0.3)
+        morceaux = [contenu[i:i + 12] for i in range(0, len(contenu), 12)]
+        for morceau in morceaux:
+            chunk = dict(base, object='chat.completion.chunk', choices=[{
+                'index': 0, 'finish_reason': None, 'delta': {'content': morceau}
+            }])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(duree * 0.7 / max(1, len(morceaux)))
+        if (requete.get('stream_options') or {}).get('include_usage'):
+            chunk = dict(base, object='chat.completion.chunk', choices=[], usage=usage)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+# --- Nominatim ---------------------------------------------------------------
+
+class FauxNominatim(_Base):
+    taux_echec = 0.1
+
+    def do_GET(self):
+        self.latence.attendre()
+        adresse = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        graine = int(hashlib.md5(adresse.encode()).hexdigest()[:8], 16)
+        rng = random.Random(graine)
+        if rng.random() < self.taux_echec:
+            self._json([])
+            return
+        self._json([{
+            'lat': str(48.7333 + rng.uniform(-0.06, 0.06)),
+            'lon': str(1.3667 + rng.uniform(-0.08, 0.08)),
+            'display_name': f"{adresse}, Eure-et-Loir, Centre-Val de Loire, France métropolitaine, France"
+        }])
+
+
+# --- Realtime Database -------------------------------------------------------
+
+class BaseMemoire:
+    """Arbre JSON en mémoire + écouteurs, avec la sémantique d'écriture de la RTDB"""
+
+    def __init__(self):
+        self.racine = {}
+        self._lock = threading.RLock()
+        self._ecouteurs = []
+
+    @staticmethod
+    def _parties(chemin):
+        return [p for p in chemin.split('/') if p]
+
+    def lire(self, chemin):
+        """Copie de la valeur au chemin (les requêtes concurrentes ne la modifient pas)"""
+        with self._lock:
+            noeud = self.racine
+            for partie in self._parties(chemin):
+                if not isinstance(noeud, dict) or partie not in noeud:
+                    return None
+                noeud = noeud[partie]
+            return copy.deepcopy(noeud)
+
+    def _ecrire(self, parties, valeur):
+        if not parties:
+            self.racine = valeur if isinstance(valeur, dict) else {}
+            return
+        noeud = self.racine
+        pile = []
+        for partie in parties[:-1]:
+            if not isinstance(noeud.get(partie), dict):
+                noeud[partie] = {}
+            pile.append((noeud, partie))
+            noeud = noeud[partie]
+        if isinstance(valeur, dict) and '.sv' in valeur:
+            ancien = noeud.get(parties[-1]) or 0
+            valeur = ancien + valeur['.sv'].get('increment', 0)
+        if valeur is None or valeur == {}:
+            noeud.pop(parties[-1], None)
+            # Comme la RTDB : les nœuds vides disparaissent
+            for parent, cle in reversed(pile):
+                if parent[cle]:
+                    break
+                parent.pop(cle)
+        else:
+            noeud[parties[-1]] = valeur
+
+    def ecrire(self, chemin, valeur):
+        with self._lock:
+            self._ecrire(self._parties(chemin), valeur)
+            self._notifier([chemin])
+
+    def mettre_a_jour(self, chemin, valeurs):
+        with self._lock:
+            base = self._parties(chemin)
+            for sous_chemin, valeur in valeurs.items():
+                self._ecrire(base + self._parties(sous_chemin), valeur)
+            self._notifier(['/'.join(base + self._parties(c)) for c in valeurs])
+
+    def _notifier(self, chemins):
+        for chemin_ecoute, file in self._ecouteurs:
+            ecoute = self._parties(chemin_ecoute)
+            for chemin in chemins:
+                ecrit = self._parties(chemin)
+                if ecrit[:len(ecoute)] == ecoute:
+                    relatif = '/' + '/'.join(ecrit[len(ecoute):])
+                    file.put({'path': relatif, 'data': self.lire(chemin)})
+                elif ecoute[:len(ecrit)] == ecrit:
+                    file.put({'path': '/', 'data': self.lire(chemin_ecoute)})
+
+    def ecouter(self, chemin):
+        file = queue.Queue()
+        with self._lock:
+            file.put({'path': '/', 'data': self.lire(chemin)})
+            self._ecouteurs.append((chemin, file))
+        return file
+
+    def arreter_ecoute(self, file):
+        with self._lock:
+            self._ecouteurs = [(c, f) for c, f in self._ecouteurs if f is not file]
+
+
+def _requete_par_cle(valeur, params):
+    """orderBy="$key" + startAt/endAt/limitToFirst/limitToLast"""
+    if not isinstance(valeur, dict) or 'orderBy' not in params:
+        return valeur
+    cles = sorted(valeur)
+    if 'startAt' in params:
+        debut = json.loads(params['startAt'][0])
+        cles = [c for c in cles if c >= debut]
+    if 'endAt' in params:
+        fin = json.loads(params['endAt'][0])
+        cles = [c for c in cles if c <= fin]
+    if 'limitToFirst' in params:
+        cles = cles[:int(params['limitToFirst'][0])]
+    if 'limitToLast' in params:
+        cles = cles[-int(params['limitToLast'][0]):]
+    return {c: valeur[c] for c in cles}
+
+
+class FauxFirebase(_Base):
+    base = BaseMemoire()
+
+    def _chemin(self):
+        url = urlparse(self.path)
+        return url.path[:-len('.json')] if url.path.endswith('.json') else url.path, parse_qs(url.query)
+
+    def _etag(self, valeur):
+        return hashlib.md5(json.dumps(valeur, sort_keys=True).encode()).hexdigest()
+
+    def do_GET(self):
+        chemin, params = self._chemin()
+        if 'text/event-stream' in self.headers.get('Accept', ''):
+            self._ecouter(chemin)
+            return
+        self.latence.attendre()
+        valeur = self.base.lire(chemin)
+        self._json(_requete_par_cle(valeur, params), entetes={'ETag': self._etag(valeur)})
+
+    def do_PUT(self):
+        chemin, _ = self._chemin()
+        valeur = json.loads(self._corps() or b'null')
+        self.latence.attendre()
+        attendu = self.headers.get('if-match')
+        with self.base._lock:
+            actuelle = self.base.lire(chemin)
+            if attendu and attendu != self._etag(actuelle):
+                self._json(actuelle, 412, {'ETag': self._etag(actuelle)})
+                return
+            self.base.ecrire(chemin, valeur)
+        self._json(valeur, entetes={'ETag': self._etag(valeur)})
+
+    def do_PATCH(self):
+        chemin, _ = self._chemin()
+        valeurs = json.loads(self._corps() or b'{}')
+        self.latence.attendre()
+        self.base.mettre_a_jour(chemin, valeurs)
+        self._json(valeurs)
+
+    def do_DELETE(self):
+        chemin, _ = self._chemin()
+        self.latence.attendre()
+        self.base.ecrire(chemin, None)
+        self._json(None)
+
+    def _ecouter(self, chemin):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        file = self.base.ecouter(chemin)
+        try:
+            while True:
+                try:
+                    evenement = file.get(timeout=15)
+                    message = f"event: put\ndata: {json.dumps(evenement)}\n\n"
+                except queue.Empty:
+                    message = "event: keep-alive\ndata: null\n\n"
+                self.wfile.write(message.encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.base.arreter_ecoute(file)
+
+
+def demarrer_serveur(classe, port, latence, **attributs):
+    """Démarre un faux service dans un thread ; retourne le serveur (port réel dans server_address)"""
+    gestionnaire = type(classe.__name__, (classe,), dict(attributs, latence=_Latence(latence)))
+    serveur = ThreadingHTTPServer(('127.0.0.1', port), gestionnaire)
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, name=classe.__name__, daemon=True).start()
+    return serveur
+
+
+def demarrer_faux_services(openai='800:200', nominatim='150:50', firebase='40:15',
+                           taux_echec_nominatim=0.1, ports=(0, 0, 0)):
+    """Démarre les trois faux services ; retourne les variables d'environnement du serveur testé"""
+    s_openai = demarrer_serveur(FauxOpenAI, ports[0], openai)
+    s_nominatim = demarrer_serveur(FauxNominatim, ports[1], nominatim, taux_echec=taux_echec_nominatim)
+    s_firebase = demarrer_serveur(FauxFirebase, ports[2], firebase, base=BaseMemoire())
+    return {
+        'OPENAI_API_KEY': 'sk-bench',
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{s_openai.server_address[1]}/v1',
+        'NOMINATIM_URL': f'http://127.0.0.1:{s_nominatim.server_address[1]}/search',
+        'FIREBASE_DATABASE_EMULATOR_HOST': f'127.0.0.1:{s_firebase.server_address[1]}',
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Faux services OpenAI / Nominatim / Firebase")
+    parser.add_argument('--openai', default='800:200', help="latence ms 'moyenne:écart'")
+    parser.add_argument('--nominatim', default='150:50')
+    parser.add_argument('--firebase', default='40:15')
+    parser.add_argument('--ports', default='8101,8102,8103')
+    args = parser.parse_args()
+
+    env = demarrer_faux_services(args.openai, args.nominatim, args.firebase,
+                                 ports=tuple(int(p) for p in args.ports.split(',')))
+    for cle, valeur in env.items():
+        print(f"export {cle}={valeur}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,302 @@
+"""
+Banc d'essai du webhook : rejoue un corpus d'appels Retell contre le serveur
+
+Pour chaque configuration gunicorn (workers x threads) et chaque mode de
+service (sync : Flask en threads ; async : asgi_app sous uvicorn), le serveur
+est lancé dans un sous-processus, branché sur les faux services de bench/fakes.py
+(OpenAI, Nominatim, Firebase avec latences configurables). Le corpus est
+ensuite rejoué à chaque niveau de concurrence, avec des call_id uniques pour
+ne pas déclencher la déduplication.
+
+Rapport : requêtes/s, latence p50/p95/p99, erreurs, et détail par étape
+(analyse, attente du géocodage, sauvegarde) à partir de `timings_ms` des
+réponses. Le rapport JSON peut servir de référence pour détecter une
+régression lors d'un changement suivant.
+
+Exemples :
+    python bench/replay.py --configs 1x8,2x8 --concurrence 1,4,16 --requetes 200
+    python bench/replay.py --modes sync,async --concurrence 16,64,256
+    python bench/replay.py --sortie avant.json
+    python bench/replay.py --reference avant.json --tolerance 0.15
+    python bench/replay.py --url http://127.0.0.1:8080   # serveur déjà lancé
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from bench.fakes import demarrer_faux_services  # noqa: E402
+from metrics import percentile  # noqa: E402
+
+CORPUS_DEFAUT = os.path.join(RACINE, 'bench', 'corpus.jsonl')
+
+
+def charger_corpus(path):
+    """Payloads Retell, un objet JSON par ligne"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(ligne) for ligne in f if ligne.strip()]
+
+
+def etapes(timings):
+    """Aplatit `timings_ms` d'une réponse en {étape: ms}"""
+    resultat = {}
+    for nom, valeur in (timings or {}).items():
+        if isinstance(valeur, dict):
+            if 'attente_ms' in valeur:
+                resultat['geocodage_attente'] = valeur['attente_ms']
+                resultat['geocodage_masque'] = valeur.get('gain_ms', 0.0)
+        elif isinstance(valeur, (int, float)):
+            resultat[nom] = valeur
+    return resultat
+
+
+class Client:
+    """Une connexion HTTP keep-alive par thread client"""
+
+    def __init__(self, url):
+        self.url = urlparse(url)
+        self._local = threading.local()
+
+    def _connexion(self):
+        if getattr(self._local, 'conn', None) is None:
+            self._local.conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=120)
+        return self._local.conn
+
+    def post(self, chemin, donnees):
+        corps = json.dumps(donnees).encode()
+        for essai in (1, 2):
+            conn = self._connexion()
+            try:
+                conn.request('POST', chemin, corps, {'Content-Type': 'application/json'})
+                reponse = conn.getresponse()
+                return reponse.status, reponse.read()
+            except (http.client.HTTPException, ConnectionError, OSError):
+                conn.close()
+                self._local.conn = None
+                if essai == 2:
+                    raise
+
+    def get(self, chemin):
+        conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=5)
+        try:
+            conn.request('GET', chemin)
+            reponse = conn.getresponse()
+            return reponse.status, reponse.read()
+        finally:
+            conn.close()
+
+
+def attendre_serveur(client, delai=90):
+    fin = time.time() + delai
+    while time.time() < fin:
+        try:
+            if client.get('/health')[0] == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def lancer_gunicorn(workers, threads, port, env_services, env_extra, mode='sync'):
+    """Démarre le serveur dans un sous-processus gunicorn ; retourne (processus, dossier temporaire)"""
+    dossier = tempfile.mkdtemp(prefix='chicken-bench-')
+    env = dict(os.environ)
+    env.update(env_services)
+    env.update({
+        'WEBHOOK_MODE': 'sync',
+        'ARCHIVE_INTERVAL': '0',
+        'OUTBOX_PATH': os.path.join(dossier, 'outbox.sqlite3'),
+        'JOB_QUEUE_PATH': os.path.join(dossier, 'jobs.sqlite3'),
+        'GEOCACHE_PATH': os.path.join(dossier, 'geocache.sqlite3'),
+        'PYTHONUNBUFFERED': '1',
+    })
+    env.update(env_extra)
+    if mode == 'async':
+        # Worker uvicorn : les threads ne servent plus qu'aux étapes bloquantes (asyncio.to_thread)
+        application = ['-k', 'uvicorn.workers.UvicornWorker', 'asgi_app:app']
+    else:
+        application = ['--threads', str(threads), 'server:app']
+    journal = open(os.path.join(dossier, 'serveur.log'), 'w')
+    processus = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--timeout', '0'] + application,
+        cwd=RACINE, env=env, stdout=journal, stderr=subprocess.STDOUT
+    )
+    return processus, dossier
+
+
+def rejouer(client, corpus, concurrence, nb_requetes, prefixe):
+    """Envoie nb_requetes appels avec `concurrence` clients ; retourne les mesures brutes"""
+    mesures = []
+    lock = threading.Lock()
+
+    def une_requete(i):
+        payload = json.loads(json.dumps(corpus[i % len(corpus)]))
+        payload['call']['call_id'] = f"{payload['call']['call_id']}-{prefixe}-{i}"
+        debut = time.perf_counter()
+        try:
+            statut, corps = client.post('/webhook/retell', payload)
+            reponse = json.loads(corps or b'{}')
+        except Exception as e:
+            statut, reponse = 0, {'message': str(e)}
+        duree_ms = (time.perf_counter() - debut) * 1000
+        with lock:
+            mesures.append({
+                'statut': statut,
+                'ms': duree_ms,
+                'etapes': etapes(reponse.get('timings_ms'))
+            })
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrence) as pool:
+        list(pool.map(une_requete, range(nb_requetes)))
+    return mesures, time.perf_counter() - debut
+
+
+def resumer(mesures, duree_s):
+    ok = sorted(m['ms'] for m in mesures if m['statut'] == 200)
+    par_etape = {}
+    for m in mesures:
+        for nom, ms in m['etapes'].items():
+            par_etape.setdefault(nom, []).append(ms)
+    return {
+        'requetes': len(mesures),
+        'erreurs': sum(1 for m in mesures if m['statut'] != 200),
+        'rps': round(len(mesures) / duree_s, 2) if duree_s else 0.0,
+        'p50_ms': round(percentile(ok, 50), 1),
+        'p95_ms': round(percentile(ok, 95), 1),
+        'p99_ms': round(percentile(ok, 99), 1),
+        'etapes': {
+            nom: {'p50': round(percentile(sorted(v), 50), 1), 'p95': round(percentile(sorted(v), 95), 1)}
+            for nom, v in sorted(par_etape.items())
+        }
+    }
+
+
+def afficher(resultats):
+    print(f"\n{'config':<14} {'conc':>5} {'req':>5} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  étapes p50/p95 (ms)")
+    for r in resultats:
+        detail = '  '.join(f"{nom} {v['p50']:.0f}/{v['p95']:.0f}" for nom, v in r['etapes'].items())
+        print(f"{r['config']:<14} {r['concurrence']:>5} {r['requetes']:>5} {r['erreurs']:>4} {r['rps']:>8.2f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}  {detail}")
+
+
+def comparer(resultats, reference, tolerance):
+    """Régressions de p95 ou de débit au-delà de la tolérance, par (config, concurrence)"""
+    anciens = {(r['config'], r['concurrence']): r for r in reference}
+    regressions = []
+    for r in resultats:
+        ancien = anciens.get((r['config'], r['concurrence']))
+        if ancien is None:
+            continue
+        if ancien['p95_ms'] and r['p95_ms'] > ancien['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{r['config']} c={r['concurrence']} : p95 {ancien['p95_ms']} → {r['p95_ms']} ms")
+        if ancien['rps'] and r['rps'] < ancien['rps'] * (1 - tolerance):
+            regressions.append(f"{r['config']} c={r['concurrence']} : {ancien['rps']} → {r['rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du webhook Retell")
+    parser.add_argument('--corpus', default=CORPUS_DEFAUT)
+    parser.add_argument('--configs', default='1x8', help="configurations gunicorn workers x threads, ex. 1x8,2x8")
+    parser.add_argument('--modes', default='sync', help="modes de service à comparer : sync, async ou sync,async")
+    parser.add_argument('--concurrence', default='1,4,16', help="niveaux de concurrence des clients")
+    parser.add_argument('--requetes', type=int, default=100, help="requêtes par niveau de concurrence")
+    parser.add_argument('--openai', default='800:200', help="latence du faux OpenAI 'moyenne:écart' (ms)")
+    parser.add_argument('--nominatim', default='150:50')
+    parser.add_argument('--firebase', default='40:15')
+    parser.add_argument('--env', action='append', default=[], help="variable du serveur testé, ex. OPENAI_STREAMING=1")
+    parser.add_argument('--url', help="serveur déjà lancé (pas de gunicorn ni de faux services)")
+    parser.add_argument('--port', type=int, default=8199)
+    parser.add_argument('--sortie', help="fichier JSON des résultats")
+    parser.add_argument('--reference', help="résultats JSON précédents à comparer")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--objectif-demarrage', type=float, help="temps max (ms) entre le lancement de gunicorn et le premier /health")
+    args = parser.parse_args()
+
+    corpus = charger_corpus(args.corpus)
+    niveaux = [int(c) for c in args.concurrence.split(',')]
+    env_extra = dict(e.split('=', 1) for e in args.env)
+    print(f"📼 {len(corpus)} appels dans le corpus, {args.requetes} requêtes par niveau")
+
+    if args.url:
+        configs = [('externe', None)]
+        env_services = {}
+    else:
+        # Le mode sync garde le nom seul ("1x8") pour rester comparable aux anciens rapports
+        configs = [
+            (c if mode == 'sync' else f'{mode}-{c}', (*(int(x) for x in c.split('x')), mode))
+            for mode in args.modes.split(',') for c in args.configs.split(',')
+        ]
+        env_services = demarrer_faux_services(args.openai, args.nominatim, args.firebase)
+        print(f"🎭 Faux services : OpenAI {args.openai} ms, Nominatim {args.nominatim} ms, Firebase {args.firebase} ms")
+
+    resultats = []
+    demarrages_lents = []
+    for nom, config in configs:
+        processus = None
+        url = args.url
+        lancement = time.perf_counter()
+        if config is not None:
+            processus, dossier = lancer_gunicorn(*config, args.port, env_services, env_extra)
+            url = f'http://127.0.0.1:{args.port}'
+        client = Client(url)
+        try:
+            if not attendre_serveur(client):
+                print(f"❌ Serveur {nom} non démarré" + (f" (voir {dossier}/serveur.log)" if processus else ''))
+                continue
+            demarrage_ms = round((time.perf_counter() - lancement) * 1000, 1) if processus else None
+            if demarrage_ms is not None:
+                print(f"   {nom} : premier /health en {demarrage_ms} ms")
+                if args.objectif_demarrage and demarrage_ms > args.objectif_demarrage:
+                    demarrages_lents.append(f"{nom} : démarrage {demarrage_ms} ms > {args.objectif_demarrage} ms")
+            # Préchauffage : connexions, imports paresseux, caches
+            rejouer(client, corpus, 2, min(10, len(corpus)), f'{nom}-chauffe')
+            for concurrence in niveaux:
+                mesures, duree = rejouer(client, corpus, concurrence, args.requetes, f'{nom}-{concurrence}-{int(time.time())}')
+                resultat = dict(resumer(mesures, duree), config=nom, concurrence=concurrence, demarrage_ms=demarrage_ms)
+                resultats.append(resultat)
+                print(f"   {nom} c={concurrence} : {resultat['rps']} req/s, p95 {resultat['p95_ms']} ms, {resultat['erreurs']} erreur(s)")
+        finally:
+            if processus is not None:
+                processus.terminate()
+                try:
+                    processus.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    processus.kill()
+
+    afficher(resultats)
+
+    if args.sortie:
+        with open(args.sortie, 'w') as f:
+            json.dump({'parametres': vars(args), 'resultats': resultats}, f, indent=2)
+        print(f"\n💾 Résultats enregistrés dans {args.sortie}")
+
+    regressions = list(demarrages_lents)
+    if args.reference:
+        with open(args.reference) as f:
+            regressions += comparer(resultats, json.load(f)['resultats'], args.tolerance)
+    if args.reference or args.objectif_demarrage:
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} régression(s) (tolérance {args.tolerance:.0%}) :")
+            for r in regressions:
+                print(f"   - {r}")
+            sys.exit(1)
+        print(f"\n✅ Pas de régression (tolérance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Déduplication des appels Retell par call_id
+
+Trois niveaux, tous en O(1) quel que soit le nombre de commandes :
+- un ensemble borné des call_id récents, en mémoire du processus
+- la réplique locale des commandes (index call_id tenu par l'écouteur Firebase)
+- un index Firebase `orders_by_call_id/<call_id> -> order_id`, écrit dans le
+  même update() multi-chemins que la commande elle-même, lu quand la réplique
+  ne connaît pas l'appel (réplique non amorcée, commande évincée ou archivée)
+
+Usage en ligne de commande (reconstruit l'index à partir des commandes existantes) :
+    python dedup.py
+"""
+
+from firebase_setup import db
+from collections import OrderedDict
+import os
+import re
+import threading
+
+INDEX_NODE = 'orders_by_call_id'
+TAILLE_RECENTS = int(os.environ.get('DEDUP_RECENT_SIZE', 2000))
+
+# Valeur retournée quand un autre thread traite déjà le même appel
+EN_COURS = 'en_cours'
+
+# Caractères interdits dans une clé Firebase
+_CARACTERES_INTERDITS = re.compile(r'[.$#\[\]/]')
+
+
+def cle_index(call_id):
+    """Transforme un call_id en clé Firebase valide"""
+    return _CARACTERES_INTERDITS.sub('_', str(call_id))
+
+
+class DeduplicateurAppels:
+    """Registre des appels déjà traités ou en cours de traitement"""
+
+    def __init__(self, taille_max=TAILLE_RECENTS, replique=None):
+        self.taille_max = taille_max
+        self.replique = replique
+        self._recents = OrderedDict()
+        self._en_cours = set()
+        self._lock = threading.Lock()
+
+    def reserver(self, call_id):
+        """
+        Réserve un call_id pour le thread courant.
+        Retourne None si l'appel est nouveau, sinon l'ID de la commande
+        existante (ou EN_COURS si l'appel est déjà en traitement).
+        """
+        if not call_id:
+            return None
+
+        with self._lock:
+            if call_id in self._recents:
+                self._recents.move_to_end(call_id)
+                return self._recents[call_id]
+            if call_id in self._en_cours:
+                return EN_COURS
+            self._en_cours.add(call_id)
+
+        try:
+            order_id = None
+            if self.replique is not None and self.replique.pret:
+                order_id = self.replique.order_id_pour_call(call_id)
+            if not order_id:
+                # La réplique ne garde que les commandes récentes de `orders` : une relance
+                # Retell d'un appel évincé ou archivé n'est visible que dans l'index
+                order_id = db.reference(f'{INDEX_NODE}/{cle_index(call_id)}').get()
+        except Exception:
+            self.liberer(call_id)
+            raise
+
+        if order_id:
+            self.confirmer(call_id, order_id)
+            return order_id
+        return None
+
+    def liberer(self, call_id):
+        """Libère la réservation (à appeler en fin de traitement, même en cas d'erreur)"""
+        with self._lock:
+            self._en_cours.discard(call_id)
+
+    def confirmer(self, call_id, order_id):
+        """Mémorise un appel dont la commande est enregistrée"""
+        if not call_id:
+            return
+        with self._lock:
+            self._en_cours.discard(call_id)
+            self._recents[call_id] = order_id
+            self._recents.move_to_end(call_id)
+            while len(self._recents) > self.taille_max:
+                self._recents.popitem(last=False)
+
+    def chemins_index(self, call_id, order_id):
+        """Chemins à ajouter à l'update() multi-chemins qui enregistre la commande"""
+        if not call_id:
+            return {}
+        return {f'{INDEX_NODE}/{cle_index(call_id)}': order_id}
+
+
+def reconstruire_index():
+    """Reconstruit l'index call_id -> order_id à partir des commandes existantes (une seule fois)"""
+    all_orders = dict(db.reference('orders').get() or {})
+    # Commandes déjà archivées (orders_archive/AAAA-MM-JJ/<order_id>)
+    for jour in (db.reference('orders_archive').get() or {}).values():
+        all_orders.update(jour or {})
+    index = {}
+    for order_id, order_data in all_orders.items():
+        call_id = (order_data or {}).get('call_id')
+        if call_id:
+            index.setdefault(cle_index(call_id), order_id)
+
+    if index:
+        db.reference(INDEX_NODE).update(index)
+    print(f"✅ Index reconstruit : {len(index)} call_id pour {len(all_orders)} commandes")
+    return len(index)
+
+
+if __name__ == '__main__':
+    from firebase_setup import initialiser_firebase
+    initialiser_firebase()
+    reconstruire_index()
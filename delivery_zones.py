@@ -0,0 +1,299 @@
+"""
+Zones de livraison : paliers de frais configurables, grille précalculée, recalcul par lots
+
+- Paliers : DELIVERY_FEE_TIERS="3:2,5:3,8:4,*:5" (jusqu'à 3 km : 2 €, jusqu'à
+  5 km : 3 €... au-delà : 5 €), livraison gratuite au-dessus de
+  FREE_DELIVERY_THRESHOLD (€)
+- Grille : le carré de DELIVERY_GRID_RADIUS_KM autour du restaurant est
+  découpé en cellules de DELIVERY_GRID_CELL_M mètres ; chaque cellule
+  entièrement dans un palier donne son numéro en O(1). Seules les cellules
+  traversées par une limite de palier (et les points hors de la grille)
+  demandent un calcul de distance.
+- Recalcul par lots (NumPy) des distances et des frais des commandes
+  enregistrées, après un changement de paliers ou de seuil :
+    python delivery_zones.py recalculer --paliers "3:2,6:3,*:4" --seuil 25
+    python delivery_zones.py recalculer --appliquer
+  Les statistiques de ventes (sales_stats) sont corrigées dans la même écriture.
+"""
+
+import bisect
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+
+from addresses import RESTAURANT_COORDS, RAYON_TERRE_KM, distance_haversine
+from metrics import registre
+
+DELIVERY_FEE_TIERS = os.environ.get('DELIVERY_FEE_TIERS', '3:2,5:3,8:4,*:5')
+FREE_DELIVERY_THRESHOLD = float(os.environ.get('FREE_DELIVERY_THRESHOLD', 20))
+DELIVERY_GRID_CELL_M = float(os.environ.get('DELIVERY_GRID_CELL_M', 250))
+DELIVERY_GRID_RADIUS_KM = float(os.environ.get('DELIVERY_GRID_RADIUS_KM', 12))
+
+lectures_zones = registre.compteur(
+    'delivery_zone_lookups_total', "Palier de livraison trouvé par la grille ou par calcul de distance", ('method',))
+
+# Cellule à cheval sur une limite de palier : distance calculée à chaque fois
+LIMITE = 255
+# Marge (km) autour des limites, pour les approximations de distance min/max d'une cellule
+MARGE_KM = 0.01
+
+
+class Paliers:
+    """Frais de livraison par distance (bornes croissantes, bornes incluses)"""
+
+    def __init__(self, bornes, frais, frais_au_dela, seuil_gratuit=FREE_DELIVERY_THRESHOLD):
+        if list(bornes) != sorted(bornes) or len(bornes) != len(frais):
+            raise ValueError("Paliers invalides : bornes croissantes, un tarif par borne")
+        self.bornes = list(bornes)
+        self.frais_paliers = list(frais) + [frais_au_dela]
+        self.seuil_gratuit = seuil_gratuit
+
+    @classmethod
+    def depuis_texte(cls, texte=DELIVERY_FEE_TIERS, seuil_gratuit=FREE_DELIVERY_THRESHOLD):
+        """"3:2,5:3,8:4,*:5" -> bornes [3, 5, 8], frais [2, 3, 4], au-delà 5"""
+        bornes, frais, frais_au_dela = [], [], None
+        for partie in filter(None, (p.strip() for p in texte.split(','))):
+            borne, _, montant = partie.partition(':')
+            if borne.strip() == '*':
+                frais_au_dela = float(montant)
+            else:
+                bornes.append(float(borne))
+                frais.append(float(montant))
+        if frais_au_dela is None:
+            raise ValueError(f"Paliers sans tarif au-delà ('*:montant') : {texte}")
+        return cls(bornes, frais, frais_au_dela, seuil_gratuit)
+
+    def indice(self, distance_km):
+        """Numéro du palier (len(bornes) = au-delà de la dernière borne)"""
+        return bisect.bisect_left(self.bornes, distance_km)
+
+    def frais_palier(self, indice, order_total):
+        """Frais de livraison - GRATUIT si commande > seuil"""
+        if order_total > self.seuil_gratuit:
+            return 0.00
+        return self.frais_paliers[indice]
+
+    def frais(self, distance_km, order_total):
+        return self.frais_palier(self.indice(distance_km), order_total)
+
+    def decrire(self):
+        return {
+            'paliers': [{'jusqua_km': b, 'frais': f} for b, f in zip(self.bornes, self.frais_paliers)],
+            'au_dela': self.frais_paliers[-1],
+            'gratuit_au_dessus_de': self.seuil_gratuit
+        }
+
+
+class GrilleZones:
+    """Table précalculée (cellule -> palier) autour du restaurant"""
+
+    def __init__(self, paliers, centre=RESTAURANT_COORDS, rayon_km=DELIVERY_GRID_RADIUS_KM,
+                 cellule_m=DELIVERY_GRID_CELL_M):
+        debut = time.perf_counter()
+        self.paliers = paliers
+        self.centre = centre
+        self.cellule_m = cellule_m
+        # Pas de la grille en degrés (même taille en mètres dans les deux directions)
+        self.pas_lat = math.degrees(cellule_m / 1000 / RAYON_TERRE_KM)
+        self.pas_lon = self.pas_lat / math.cos(math.radians(centre[0]))
+        self.taille = 2 * math.ceil(rayon_km * 1000 / cellule_m)
+        self.lat0 = centre[0] - self.pas_lat * self.taille / 2
+        self.lon0 = centre[1] - self.pas_lon * self.taille / 2
+        self._cellules = bytearray(self.taille * self.taille)
+        limites = 0
+        for i in range(self.taille):
+            for j in range(self.taille):
+                palier = self._classer(i, j)
+                limites += palier == LIMITE
+                self._cellules[i * self.taille + j] = palier
+        self.limites = limites
+        self.construction_ms = round((time.perf_counter() - debut) * 1000, 1)
+
+    def _classer(self, i, j):
+        """Palier commun à toute la cellule, ou LIMITE si une borne la traverse"""
+        lat_min, lon_min = self.lat0 + i * self.pas_lat, self.lon0 + j * self.pas_lon
+        lat_max, lon_max = lat_min + self.pas_lat, lon_min + self.pas_lon
+        # Point de la cellule le plus proche du restaurant, et coin le plus éloigné
+        proche = (min(max(self.centre[0], lat_min), lat_max), min(max(self.centre[1], lon_min), lon_max))
+        d_min = distance_haversine(self.centre, proche)
+        d_max = max(distance_haversine(self.centre, coin)
+                    for coin in ((lat_min, lon_min), (lat_min, lon_max), (lat_max, lon_min), (lat_max, lon_max)))
+        palier = self.paliers.indice(max(0.0, d_min - MARGE_KM))
+        if palier != self.paliers.indice(d_max + MARGE_KM) or palier >= LIMITE:
+            return LIMITE
+        return palier
+
+    def indice(self, coords):
+        """Palier de ces coordonnées : lecture de la grille, calcul de distance seulement près d'une limite"""
+        lat, lon = coords
+        i = int((lat - self.lat0) // self.pas_lat)
+        j = int((lon - self.lon0) // self.pas_lon)
+        if 0 <= i < self.taille and 0 <= j < self.taille:
+            palier = self._cellules[i * self.taille + j]
+            if palier != LIMITE:
+                lectures_zones.inc('grid')
+                return palier
+        lectures_zones.inc('distance')
+        return self.paliers.indice(distance_haversine(self.centre, coords))
+
+    def frais(self, coords, order_total):
+        """Frais de livraison pour une adresse géocodée"""
+        if order_total > self.paliers.seuil_gratuit:
+            return 0.00
+        return self.paliers.frais_palier(self.indice(coords), order_total)
+
+    def stats(self):
+        return dict(
+            self.paliers.decrire(),
+            cellules=self.taille * self.taille,
+            cellules_limites=self.limites,
+            cellule_m=self.cellule_m,
+            construction_ms=self.construction_ms
+        )
+
+
+def distances_haversine(lats, lons, centre=RESTAURANT_COORDS):
+    """Distances (km) de tableaux NumPy de latitudes/longitudes au centre"""
+    import numpy as np
+    lat1, lon1 = np.radians(centre[0]), np.radians(centre[1])
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(a))
+
+
+def recalculer_frais(coordonnees, sous_totaux, paliers, centre=RESTAURANT_COORDS):
+    """
+    Distances et frais de livraison d'un lot de commandes, en une passe vectorisée.
+    coordonnees : liste de (lat, lon) ; retourne (distances_km, frais) en tableaux NumPy
+    """
+    import numpy as np
+    points = np.asarray(coordonnees, dtype=float).reshape(-1, 2)
+    sous_totaux = np.asarray(sous_totaux, dtype=float)
+    distances = distances_haversine(points[:, 0], points[:, 1], centre)
+    indices = np.searchsorted(np.asarray(paliers.bornes, dtype=float), distances, side='left')
+    frais = np.asarray(paliers.frais_paliers, dtype=float)[indices]
+    frais[sous_totaux > paliers.seuil_gratuit] = 0.0
+    return np.round(distances, 2), frais
+
+
+def coordonnees_commande(commande, geocache=None):
+    """Coordonnées enregistrées avec la commande ; sinon celles du cache de géocodage (anciennes commandes)"""
+    coords = commande.get('delivery_coordinates')
+    if coords:
+        return tuple(coords)
+    if geocache is not None and commande.get('delivery_address'):
+        resultat = geocache.lire(commande['delivery_address'])
+        if resultat and resultat.get('valid'):
+            return tuple(resultat['coordinates'])
+    return None
+
+
+def recalculer_commandes(commandes, paliers, geocache=None):
+    """
+    Recalcule les commandes livrées d'un nœud ({order_id: commande}) ;
+    retourne (modifications {order_id: champs}, rapport)
+    """
+    ids, coordonnees, sous_totaux = [], [], []
+    sans_coordonnees = 0
+    for order_id, commande in commandes.items():
+        if not isinstance(commande, dict) or commande.get('type_service') != 'Livraison':
+            continue
+        coords = coordonnees_commande(commande, geocache)
+        if coords is None:
+            sans_coordonnees += 1
+            continue
+        ids.append(order_id)
+        coordonnees.append(coords)
+        sous_totaux.append(float(commande.get('subtotal', 0) or 0))
+
+    debut = time.perf_counter()
+    distances, frais = recalculer_frais(coordonnees, sous_totaux, paliers) if ids else ([], [])
+    calcul_ms = round((time.perf_counter() - debut) * 1000, 2)
+
+    modifications = {}
+    ecart = 0.0
+    for order_id, distance_km, montant, sous_total in zip(ids, distances, frais, sous_totaux):
+        commande = commandes[order_id]
+        ancien = float(commande.get('delivery_fee', 0) or 0)
+        montant, distance_km = float(montant), float(distance_km)
+        if abs(montant - ancien) < 0.005 and abs(distance_km - float(commande.get('distance_km', 0) or 0)) < 0.005:
+            continue
+        ecart += montant - ancien
+        modifications[order_id] = {
+            'distance_km': distance_km,
+            'delivery_fee': montant,
+            'delivery_fee_waived': montant == 0 and sous_total > paliers.seuil_gratuit,
+            'total': round(sous_total + montant, 2)
+        }
+
+    rapport = {
+        'livraisons': len(ids) + sans_coordonnees,
+        'recalculees': len(ids),
+        'sans_coordonnees': sans_coordonnees,
+        'modifiees': len(modifications),
+        'ecart_frais': round(ecart, 2),
+        'calcul_ms': calcul_ms
+    }
+    return modifications, rapport
+
+
+def appliquer(noeud, modifications, commandes, taille_lot=200):
+    """
+    Écrit les champs recalculés par lots d'update() multi-chemins ; chaque lot contient
+    aussi les écarts des statistiques de ventes de ses commandes (cumulés par chemin)
+    """
+    from firebase_setup import db
+    from sales_stats import ecarts_statistiques, chemins_ecarts
+    ids = list(modifications)
+    for i in range(0, len(ids), taille_lot):
+        updates = {}
+        ecarts = defaultdict(float)
+        for order_id in ids[i:i + taille_lot]:
+            champs = modifications[order_id]
+            updates.update({f'{noeud}/{order_id}/{champ}': valeur for champ, valeur in champs.items()})
+            ancienne = commandes[order_id]
+            for chemin, ecart in ecarts_statistiques(order_id, ancienne, dict(ancienne, **champs)).items():
+                ecarts[chemin] += ecart
+        updates.update(chemins_ecarts(ecarts))
+        db.reference().update(updates)
+    return len(modifications)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Zones et frais de livraison")
+    sub = parser.add_subparsers(dest='commande', required=True)
+
+    recalcul = sub.add_parser('recalculer', help="Recalcule distances et frais des commandes enregistrées")
+    recalcul.add_argument('--noeud', default='orders', help="nœud lu (orders, orders_archive/AAAA-MM-JJ)")
+    recalcul.add_argument('--paliers', default=DELIVERY_FEE_TIERS, help='ex. "3:2,5:3,8:4,*:5"')
+    recalcul.add_argument('--seuil', type=float, default=FREE_DELIVERY_THRESHOLD, help="livraison gratuite au-dessus (€)")
+    recalcul.add_argument('--appliquer', action='store_true', help="écrit les nouveaux frais (sinon simulation)")
+
+    sub.add_parser('grille', help="Construit la grille et affiche ses caractéristiques")
+
+    args = parser.parse_args()
+
+    if args.commande == 'grille':
+        print(json.dumps(GrilleZones(Paliers.depuis_texte()).stats(), ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    if args.appliquer and args.noeud != 'orders':
+        parser.error("--appliquer n'est possible que sur 'orders' (les totaux d'archive ne sont pas recalculés ; "
+                     "après une correction manuelle, lancer python sales_stats.py reconstruire)")
+
+    from firebase_setup import initialiser_firebase, db
+    from geocache import CacheGeocodage
+    initialiser_firebase()
+    paliers = Paliers.depuis_texte(args.paliers, args.seuil)
+    commandes = db.reference(args.noeud).get() or {}
+    modifications, rapport = recalculer_commandes(commandes, paliers, CacheGeocodage())
+    print(json.dumps(dict(rapport, **paliers.decrire()), ensure_ascii=False, indent=2))
+    if args.appliquer and modifications:
+        print(f"✅ {appliquer(args.noeud, modifications, commandes)} commande(s) mises à jour")
+    elif modifications:
+        print("ℹ️ Simulation : relancer avec --appliquer pour enregistrer")
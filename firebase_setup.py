@@ -0,0 +1,68 @@
+"""
+Initialisation de Firebase partagée par le serveur et les outils en ligne de commande
+
+Les modules utilisent `from firebase_setup import db` : firebase_admin n'est
+importé, et l'application initialisée, qu'au premier accès à la base (et non
+à l'import du serveur, ce qui raccourcit le démarrage à froid).
+"""
+
+import os
+import json
+import threading
+
+FIREBASE_URL = os.environ.get('FIREBASE_URL')
+
+_lock = threading.Lock()
+
+
+def initialiser_firebase():
+    """Initialise l'application Firebase une seule fois par processus"""
+    import firebase_admin
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+    with _lock:
+        if firebase_admin._apps:
+            return firebase_admin.get_app()
+        return _initialiser(firebase_admin)
+
+
+def _initialiser(firebase_admin):
+    from firebase_admin import credentials
+
+    # Émulateur Realtime Database (ou faux serveur du banc d'essai) : pas de clé de service
+    emulateur = os.environ.get('FIREBASE_DATABASE_EMULATOR_HOST')
+    if emulateur:
+        return firebase_admin.initialize_app(options={
+            'databaseURL': FIREBASE_URL or f'http://{emulateur}?ns=chicken-hot-dreux',
+            'projectId': 'chicken-hot-dreux'
+        })
+
+    firebase_key = os.environ.get('FIREBASE_KEY')
+    if firebase_key:
+        if isinstance(firebase_key, str):
+            cred_dict = json.loads(firebase_key)
+        else:
+            cred_dict = firebase_key
+        cred = credentials.Certificate(cred_dict)
+    else:
+        cred = credentials.Certificate('firebase-key.json')
+
+    return firebase_admin.initialize_app(cred, {
+        'databaseURL': FIREBASE_URL
+    })
+
+
+class _BaseParesseuse:
+    """Remplace le module firebase_admin.db : import et initialisation au premier attribut lu"""
+
+    _module = None
+
+    def __getattr__(self, nom):
+        if _BaseParesseuse._module is None:
+            initialiser_firebase()
+            from firebase_admin import db as module_db
+            _BaseParesseuse._module = module_db
+        return getattr(_BaseParesseuse._module, nom)
+
+
+db = _BaseParesseuse()
@@ -0,0 +1,290 @@
+"""
+Gazetteer local des rues de la zone de livraison
+
+Index précalculé (rues + numéros avec coordonnées) construit à partir de la
+Base Adresse Nationale, interrogé en mémoire avec une recherche floue par
+trigrammes pour tolérer les noms de rue mal transcrits ("rue de la républic",
+"avenu du général leclerc"...). Nominatim n'est appelé que si aucune rue ne
+correspond avec assez de confiance.
+
+Construction de l'index (une fois, ou à chaque build Docker) :
+    python gazetteer.py build --telecharger
+    python gazetteer.py build adresses-28.csv.gz --rayon 12
+"""
+
+import bisect
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+
+from addresses import RESTAURANT_COORDS, distance_haversine, normaliser_texte
+
+GAZETTEER_PATH = os.environ.get(
+    'GAZETTEER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.json')
+)
+GAZETTEER_MIN_SCORE = float(os.environ.get('GAZETTEER_MIN_SCORE', 0.72))
+RAYON_ZONE_KM = 12
+
+# Base Adresse Nationale, département d'Eure-et-Loir
+BAN_URL = 'https://adresse.data.gouv.fr/data/ban/adresses/latest/csv/adresses-28.csv.gz'
+
+_NUMERO = re.compile(r'^(\d{1,4})\s*(?:bis|ter|quater|[a-d])?\b')
+_CODE_POSTAL = re.compile(r'\b\d{5}\b')
+
+
+def trigrammes(texte):
+    """Ensemble des trigrammes d'un texte (avec marqueurs de début/fin de mot)"""
+    resultat = set()
+    for mot in texte.split():
+        mot = f'  {mot} '
+        for i in range(len(mot) - 2):
+            resultat.add(mot[i:i + 3])
+    return resultat
+
+
+class Gazetteer:
+    """Index en mémoire des rues de la zone, avec recherche floue"""
+
+    def __init__(self, voies):
+        # voies : liste de {'nom', 'commune', 'code_postal', 'numeros': [[num, lat, lon], ...]}
+        self.voies = voies
+        self._tri_tailles = []
+        self._index = defaultdict(list)
+        self._communes = {}
+        self._communes_voies = []
+        self._codes_postaux = set()
+
+        for i, voie in enumerate(voies):
+            nom = normaliser_texte(voie['nom'])
+            tri = trigrammes(nom)
+            self._tri_tailles.append(len(tri))
+            for t in tri:
+                self._index[t].append(i)
+            commune = normaliser_texte(voie['commune'])
+            self._communes_voies.append(commune)
+            self._communes.setdefault(commune, voie['commune'])
+            self._codes_postaux.add(voie['code_postal'])
+            voie['numeros'].sort()
+            voie['_nums'] = [n[0] for n in voie['numeros']]
+
+        # Les noms de commune les plus longs d'abord ("saint remy sur avre" avant "remy")
+        self._communes_triees = sorted(self._communes, key=len, reverse=True)
+
+    @classmethod
+    def depuis_fichier(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['voies'])
+
+    def analyser(self, adresse):
+        """Découpe une adresse en (numéro, rue normalisée, commune normalisée ou None)"""
+        texte = normaliser_texte(adresse)
+        numero = None
+        match = _NUMERO.match(texte)
+        if match:
+            numero = int(match.group(1))
+            texte = texte[match.end():].strip()
+
+        commune = None
+        for nom in self._communes_triees:
+            if texte.endswith(' ' + nom) or texte == nom:
+                commune = nom
+                texte = texte[:-len(nom)].strip()
+                break
+        return numero, texte, commune
+
+    def hors_zone(self, adresse):
+        """
+        Adresse dans une commune que l'index ne couvre pas : code postal hors zone,
+        ou dernière partie après une virgule qui n'est pas une commune connue
+        """
+        if any(code not in self._codes_postaux for code in _CODE_POSTAL.findall(adresse)):
+            return True
+        parties = [p for p in (normaliser_texte(partie) for partie in adresse.split(',')) if p]
+        return len(parties) > 1 and parties[-1] not in self._communes
+
+    def rechercher(self, adresse, score_min=GAZETTEER_MIN_SCORE):
+        """
+        Retourne un résultat au format de verify_address, ou None si aucune
+        rue ne correspond avec un score suffisant, ou si l'adresse est hors zone
+        """
+        # Commune inconnue de l'index : ne pas la rapprocher d'une rue homonyme de la zone
+        if self.hors_zone(adresse):
+            return None
+
+        numero, rue, commune = self.analyser(adresse)
+
+        # "12 rue de cherisy" : le nom de commune peut aussi faire partie du nom de rue
+        essais = [(rue, commune)]
+        if commune:
+            essais.append((f'{rue} {commune}'.strip(), None))
+
+        meilleur, meilleur_score = None, 0.0
+        for texte, ville in essais:
+            i, score = self._meilleure_voie(texte, ville)
+            if score > meilleur_score:
+                meilleur, meilleur_score = i, score
+
+        if meilleur is None or meilleur_score < score_min:
+            return None
+
+        voie = self.voies[meilleur]
+        lat, lon, exact = self._position(voie, numero)
+        libelle = f"{voie['nom']}, {voie['code_postal']} {voie['commune']}"
+        if numero is not None:
+            libelle = f"{numero} {libelle}"
+
+        return {
+            'valid': True,
+            'coordinates': (lat, lon),
+            'formatted_address': libelle,
+            'source': 'gazetteer',
+            'score': round(meilleur_score, 3),
+            'numero_exact': exact
+        }
+
+    def _meilleure_voie(self, rue, commune):
+        """Rue la plus proche (coefficient de Dice sur les trigrammes) et son score"""
+        tri = trigrammes(rue)
+        if not tri:
+            return None, 0.0
+
+        communs = defaultdict(int)
+        for t in tri:
+            for i in self._index.get(t, ()):
+                communs[i] += 1
+
+        meilleur, meilleur_score = None, 0.0
+        for i, n in communs.items():
+            score = 2.0 * n / (len(tri) + self._tri_tailles[i])
+            # Légère pénalité si la commune dictée ne correspond pas
+            if commune and self._communes_voies[i] != commune:
+                score *= 0.85
+            if score > meilleur_score:
+                meilleur, meilleur_score = i, score
+        return meilleur, meilleur_score
+
+    def _position(self, voie, numero):
+        """Coordonnées du numéro (exact, interpolé entre voisins, ou milieu de la rue)"""
+        points = voie['numeros']
+        nums = voie['_nums']
+
+        if numero is None:
+            _, lat, lon = points[len(points) // 2]
+            return lat, lon, False
+
+        i = bisect.bisect_left(nums, numero)
+        if i < len(nums) and nums[i] == numero:
+            return points[i][1], points[i][2], True
+        if i == 0:
+            return points[0][1], points[0][2], False
+        if i == len(nums):
+            return points[-1][1], points[-1][2], False
+
+        (n1, lat1, lon1), (n2, lat2, lon2) = points[i - 1], points[i]
+        f = (numero - n1) / (n2 - n1)
+        return round(lat1 + f * (lat2 - lat1), 6), round(lon1 + f * (lon2 - lon1), 6), False
+
+    def stats(self):
+        """Taille de l'index"""
+        return {
+            'voies': len(self.voies),
+            'numeros': sum(len(v['numeros']) for v in self.voies),
+            'communes': sorted(self._communes.values())
+        }
+
+
+def charger_gazetteer(path=GAZETTEER_PATH):
+    """Charge l'index s'il existe ; retourne None sinon (géocodage via Nominatim uniquement)"""
+    if not os.path.exists(path):
+        print(f"ℹ️ Pas de gazetteer local ({path}) - géocodage via Nominatim")
+        return None
+    try:
+        gazetteer = Gazetteer.depuis_fichier(path)
+    except Exception as e:
+        print(f"⚠️ Gazetteer illisible ({path}): {e}")
+        return None
+    stats = gazetteer.stats()
+    print(f"🗺️ Gazetteer chargé : {stats['voies']} rues, {stats['numeros']} numéros")
+    return gazetteer
+
+
+def construire_index(lignes, centre=RESTAURANT_COORDS, rayon_km=RAYON_ZONE_KM):
+    """Construit l'index à partir des lignes du CSV de la BAN (séparateur ';')"""
+    voies = {}
+    for row in csv.DictReader(lignes, delimiter=';'):
+        try:
+            lat, lon = float(row['lat']), float(row['lon'])
+            numero = int(row['numero'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if distance_haversine(centre, (lat, lon)) > rayon_km:
+            continue
+
+        cle = (row['nom_commune'], row['nom_voie'])
+        voie = voies.setdefault(cle, {
+            'nom': row['nom_voie'],
+            'commune': row['nom_commune'],
+            'code_postal': row['code_postal'],
+            'numeros': {}
+        })
+        # Un seul point par numéro (on ignore bis/ter)
+        voie['numeros'].setdefault(numero, [numero, round(lat, 6), round(lon, 6)])
+
+    resultat = []
+    for voie in voies.values():
+        voie['numeros'] = sorted(voie['numeros'].values())
+        resultat.append(voie)
+    resultat.sort(key=lambda v: (v['commune'], v['nom']))
+    return {'source': 'BAN', 'centre': list(centre), 'rayon_km': rayon_km, 'voies': resultat}
+
+
+def _ouvrir_csv(source, telecharger):
+    if telecharger:
+        import requests
+        print(f"⬇️ Téléchargement {BAN_URL}...")
+        response = requests.get(BAN_URL, timeout=120)
+        response.raise_for_status()
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=io.BytesIO(response.content)), encoding='utf-8')
+    if source.endswith('.gz'):
+        return gzip.open(source, 'rt', encoding='utf-8')
+    return open(source, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gazetteer local de la zone de livraison")
+    sub = parser.add_subparsers(dest='commande', required=True)
+
+    build = sub.add_parser('build', help="Construit l'index à partir d'un CSV de la BAN")
+    build.add_argument('source', nargs='?', help="Fichier adresses-28.csv(.gz)")
+    build.add_argument('--telecharger', action='store_true', help="Télécharge le CSV de la BAN")
+    build.add_argument('--rayon', type=float, default=RAYON_ZONE_KM, help="Rayon autour du restaurant (km)")
+    build.add_argument('-o', '--output', default=GAZETTEER_PATH)
+
+    chercher = sub.add_parser('chercher', help="Teste une recherche d'adresse")
+    chercher.add_argument('adresse')
+
+    args = parser.parse_args()
+
+    if args.commande == 'build':
+        if not args.source and not args.telecharger:
+            parser.error("indiquer un fichier CSV ou --telecharger")
+        with _ouvrir_csv(args.source, args.telecharger) as f:
+            index = construire_index(f, rayon_km=args.rayon)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+        nb_numeros = sum(len(v['numeros']) for v in index['voies'])
+        print(f"✅ {len(index['voies'])} rues, {nb_numeros} numéros -> {args.output}")
+    else:
+        gazetteer = charger_gazetteer()
+        if gazetteer is None:
+            sys.exit(1)
+        print(json.dumps(gazetteer.rechercher(args.adresse, score_min=0), ensure_ascii=False, indent=2))
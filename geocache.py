@@ -0,0 +1,113 @@
+"""
+Cache de géocodage à deux niveaux pour verify_address
+
+- mémoire : LRU borné, partagé par les threads du processus
+- disque : SQLite avec date d'expiration, conservé entre les requêtes
+Les clés sont les adresses normalisées (voir addresses.normaliser_adresse).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from addresses import normaliser_adresse
+
+GEOCACHE_PATH = os.environ.get('GEOCACHE_PATH', '/tmp/chicken_geocache.sqlite3')
+GEOCACHE_MEMORY_SIZE = int(os.environ.get('GEOCACHE_MEMORY_SIZE', 1000))
+# Adresses trouvées : 30 jours ; adresses introuvables : 1 jour
+GEOCACHE_TTL = float(os.environ.get('GEOCACHE_TTL', 30 * 24 * 3600))
+GEOCACHE_TTL_NEGATIF = float(os.environ.get('GEOCACHE_NEGATIVE_TTL', 24 * 3600))
+
+
+class CacheGeocodage:
+    """Cache des résultats de verify_address, avec compteurs de succès/échecs"""
+
+    def __init__(self, path=GEOCACHE_PATH, taille_memoire=GEOCACHE_MEMORY_SIZE,
+                 ttl=GEOCACHE_TTL, ttl_negatif=GEOCACHE_TTL_NEGATIF):
+        self.path = path
+        self.taille_memoire = taille_memoire
+        self.ttl = ttl
+        self.ttl_negatif = ttl_negatif
+        self._memoire = OrderedDict()
+        self._lock = threading.Lock()
+        self._compteurs = {'hits_memoire': 0, 'hits_disque': 0, 'misses': 0, 'ecritures': 0}
+
+        self._conn = None
+        try:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocache (cle TEXT PRIMARY KEY, valeur TEXT NOT NULL, expire_at REAL NOT NULL)"
+            )
+        except sqlite3.Error as e:
+            print(f"⚠️ Cache disque de géocodage indisponible ({path}): {e}")
+            self._conn = None
+
+    def lire(self, adresse):
+        """Retourne le résultat en cache pour cette adresse, ou None"""
+        cle = normaliser_adresse(adresse)
+        if not cle:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entree = self._memoire.get(cle)
+            if entree and entree[1] > now:
+                self._memoire.move_to_end(cle)
+                self._compteurs['hits_memoire'] += 1
+                return _decoder(entree[0])
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT valeur, expire_at FROM geocache WHERE cle = ? AND expire_at > ?", (cle, now)
+                ).fetchone()
+                if row:
+                    self._memoriser(cle, row[0], row[1])
+                    self._compteurs['hits_disque'] += 1
+                    return _decoder(row[0])
+
+            self._compteurs['misses'] += 1
+            return None
+
+    def ecrire(self, adresse, resultat):
+        """Enregistre un résultat de géocodage (trouvé ou introuvable)"""
+        cle = normaliser_adresse(adresse)
+        if not cle:
+            return
+        ttl = self.ttl if resultat.get('valid') else self.ttl_negatif
+        expire_at = time.time() + ttl
+        valeur = json.dumps(resultat)
+
+        with self._lock:
+            self._memoriser(cle, valeur, expire_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO geocache (cle, valeur, expire_at) VALUES (?, ?, ?)",
+                    (cle, valeur, expire_at)
+                )
+            self._compteurs['ecritures'] += 1
+
+    def _memoriser(self, cle, valeur, expire_at):
+        self._memoire[cle] = (valeur, expire_at)
+        self._memoire.move_to_end(cle)
+        while len(self._memoire) > self.taille_memoire:
+            self._memoire.popitem(last=False)
+
+    def stats(self):
+        """Compteurs et taux de succès du cache"""
+        with self._lock:
+            stats = dict(self._compteurs)
+            stats['taille_memoire'] = len(self._memoire)
+        lectures = stats['hits_memoire'] + stats['hits_disque'] + stats['misses']
+        stats['taux_hit'] = round((lectures - stats['misses']) / lectures, 3) if lectures else 0.0
+        return stats
+
+
+def _decoder(valeur):
+    resultat = json.loads(valeur)
+    if 'coordinates' in resultat:
+        resultat['coordinates'] = tuple(resultat['coordinates'])
+    return resultat
@@ -0,0 +1,200 @@
+"""
+File d'attente durable (SQLite) et pool de workers pour le traitement des appels
+
+Le webhook enregistre l'appel et répond 202 immédiatement ; les workers
+exécutent ensuite l'analyse complète avec reprises en cas d'échec.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from logging_setup import obtenir_logger, contexte_appel
+
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', '/tmp/chicken_jobs.sqlite3')
+NB_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+MAX_TENTATIVES = int(os.environ.get('JOB_MAX_ATTEMPTS', 4))
+DELAI_REPRISE = float(os.environ.get('JOB_RETRY_DELAY', 2.0))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    call_id TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_run_at REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_run_at);
+"""
+
+logger = obtenir_logger('jobs')
+
+
+class FileTravaux:
+    """File de travaux persistée dans SQLite, partagée entre threads (et processus)"""
+
+    def __init__(self, path=JOB_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._nouveau = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        # Les travaux interrompus par un arrêt brutal repartent en file
+        self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+
+    def ajouter(self, call_id, payload):
+        """Ajoute un travail ; retourne (job_id, nouveau). Idempotent par call_id."""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._nouveau:
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, call_id, payload, status, next_run_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                    (job_id, call_id, json.dumps(payload), now, now, now)
+                )
+            except sqlite3.IntegrityError:
+                row = self._conn.execute("SELECT id FROM jobs WHERE call_id = ?", (call_id,)).fetchone()
+                return row['id'], False
+            self._nouveau.notify()
+        return job_id, True
+
+    def prendre(self, attente=1.0):
+        """Réserve le prochain travail prêt, ou retourne None après `attente` secondes"""
+        with self._nouveau:
+            row = self._reserver()
+            if row is None:
+                self._nouveau.wait(attente)
+                row = self._reserver()
+            return row
+
+    def _reserver(self):
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND next_run_at <= ? "
+            "ORDER BY next_run_at LIMIT 1", (now,)
+        ).fetchone()
+        if row is None:
+            return None
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+            "WHERE id = ? AND status = 'queued'", (now, row['id'])
+        )
+        if cur.rowcount != 1:
+            # Pris par un autre processus entre-temps
+            return None
+        job = dict(row)
+        job['attempts'] += 1
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def terminer(self, job_id, result):
+        """Marque le travail comme terminé avec son résultat"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id)
+            )
+
+    def echouer(self, job, error):
+        """Replanifie le travail avec un délai exponentiel, ou l'abandonne après MAX_TENTATIVES"""
+        now = time.time()
+        with self._nouveau:
+            if job['attempts'] >= MAX_TENTATIVES:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job['id'])
+                )
+                return False
+            delai = DELAI_REPRISE * (2 ** (job['attempts'] - 1))
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, next_run_at = ?, updated_at = ? WHERE id = ?",
+                (error, now + delai, now, job['id'])
+            )
+            self._nouveau.notify()
+            return True
+
+    def statut(self, job_id):
+        """Retourne l'état public d'un travail, ou None s'il est inconnu"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row['id'],
+            'call_id': row['call_id'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+    def compter(self):
+        """Nombre de travaux par état"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+
+class PoolWorkers:
+    """Threads qui exécutent `handler(payload) -> (résultat, code HTTP)` pour chaque travail"""
+
+    def __init__(self, file, handler, nb_workers=NB_WORKERS):
+        self.file = file
+        self.handler = handler
+        self.nb_workers = nb_workers
+        self._threads = []
+        self._stop = threading.Event()
+
+    def demarrer(self):
+        for i in range(self.nb_workers):
+            t = threading.Thread(target=self._boucle, name=f'job-worker-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"🧵 {self.nb_workers} worker(s) de traitement démarré(s) ({self.file.path})")
+
+    def arreter(self):
+        self._stop.set()
+
+    def _boucle(self):
+        while not self._stop.is_set():
+            try:
+                job = self.file.prendre()
+            except Exception as e:
+                logger.error("❌ Erreur file de travaux: %s", e)
+                time.sleep(1)
+                continue
+            if job is None:
+                continue
+            self._executer(job)
+
+    def _executer(self, job):
+        try:
+            with contexte_appel(job_id=job['id']):
+                result, status_code = self.handler(job['payload'])
+        except Exception as e:
+            logger.exception("❌ Travail %s en erreur: %s", job['id'], e)
+            result, status_code = {'status': 'error', 'message': str(e)}, 500
+
+        if status_code < 500:
+            self.file.terminer(job['id'], result)
+            return
+
+        message = result.get('message', 'Erreur inconnue')
+        if self.file.echouer(job, message):
+            logger.warning("🔁 Travail %s replanifié (tentative %s/%s): %s", job['id'], job['attempts'], MAX_TENTATIVES, message)
+        else:
+            logger.error("❌ Travail %s abandonné après %s tentatives: %s", job['id'], job['attempts'], message)
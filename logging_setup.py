@@ -0,0 +1,174 @@
+"""
+Journalisation structurée et non bloquante
+
+Les threads du webhook ne font que déposer un LogRecord dans une file bornée
+(QueueHandler) : le formatage (message, JSON, traceback) et l'écriture sur
+stdout sont faits par un seul thread (QueueListener). Si la file est pleine,
+l'enregistrement est abandonné et compté plutôt que de bloquer une requête.
+
+- un enregistrement par étape d'une commande : evenement(logger, 'etape', ...)
+  avec des champs structurés, et le call_id de l'appel en cours ajouté
+  automatiquement (contexte_appel)
+- LOG_FORMAT=json (défaut, une ligne JSON par enregistrement, lue par Cloud
+  Logging) ou text (lecture humaine en local)
+- LOG_LEVEL et échantillonnage par niveau (LOG_SAMPLING="DEBUG:0.1,INFO:1")
+- les arguments sont formatés plus tard, et seulement si le niveau est actif :
+  logger.debug("Réponse %s", texte) plutôt qu'une f-string
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')
+
+RACINE = 'chicken'
+
+# Contexte de l'appel en cours (call_id, job_id...), ajouté à chaque enregistrement
+_contexte = contextvars.ContextVar('contexte_log', default={})
+
+# Attributs standard d'un LogRecord (le reste vient de extra=)
+_ATTRIBUTS_STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_lock = threading.Lock()
+_ecouteur = None
+_gestionnaire = None
+
+
+def _lire_echantillonnage(texte):
+    """"DEBUG:0.1,INFO:1" -> {10: 0.1, 20: 1.0}"""
+    taux = {}
+    for partie in filter(None, (p.strip() for p in texte.split(','))):
+        niveau, _, valeur = partie.partition(':')
+        taux[logging.getLevelName(niveau.strip().upper())] = float(valeur)
+    return taux
+
+
+class FiltreContexte(logging.Filter):
+    """Échantillonne par niveau et copie le contexte de l'appel dans l'enregistrement"""
+
+    def __init__(self, taux=None):
+        super().__init__()
+        self.taux = taux or {}
+
+    def filter(self, record):
+        taux = self.taux.get(record.levelno)
+        if taux is not None and taux < 1 and random.random() >= taux:
+            return False
+        for cle, valeur in _contexte.get().items():
+            if not hasattr(record, cle):
+                setattr(record, cle, valeur)
+        return True
+
+
+class FileNonBloquante(logging.handlers.QueueHandler):
+    """Dépose l'enregistrement tel quel (formatage différé) ; abandonne s'il n'y a plus de place"""
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.abandons = 0
+
+    def prepare(self, record):
+        # Formatage laissé au thread d'écriture
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.abandons += 1
+
+
+class FormatJSON(logging.Formatter):
+    """Une ligne JSON par enregistrement (champs compatibles Cloud Logging)"""
+
+    def format(self, record):
+        donnees = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for cle, valeur in vars(record).items():
+            if cle not in _ATTRIBUTS_STANDARD and not cle.startswith('_'):
+                donnees[cle] = valeur
+        if record.exc_info:
+            donnees['exception'] = self.formatException(record.exc_info)
+        return json.dumps(donnees, ensure_ascii=False, default=str)
+
+
+class FormatTexte(logging.Formatter):
+    """Format lisible en local : message puis champs structurés"""
+
+    def format(self, record):
+        ligne = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.getMessage()}"
+        champs = {k: v for k, v in vars(record).items() if k not in _ATTRIBUTS_STANDARD and not k.startswith('_')}
+        if champs:
+            ligne += ' ' + ' '.join(f'{k}={v}' for k, v in champs.items())
+        if record.exc_info:
+            ligne += '\n' + self.formatException(record.exc_info)
+        return ligne
+
+
+def configurer_logs(niveau=LOG_LEVEL, format_=LOG_FORMAT, echantillonnage=LOG_SAMPLING):
+    """Installe la file et le thread d'écriture (une seule fois par processus)"""
+    global _ecouteur, _gestionnaire
+    with _lock:
+        if _ecouteur is not None:
+            return
+        sortie = logging.StreamHandler(sys.stdout)
+        sortie.setFormatter(FormatTexte() if format_ == 'text' else FormatJSON())
+        _gestionnaire = FileNonBloquante(queue.Queue(LOG_QUEUE_SIZE))
+        _gestionnaire.addFilter(FiltreContexte(_lire_echantillonnage(echantillonnage)))
+
+        racine = logging.getLogger(RACINE)
+        racine.setLevel(niveau)
+        racine.addHandler(_gestionnaire)
+        racine.propagate = False
+
+        _ecouteur = logging.handlers.QueueListener(_gestionnaire.queue, sortie, respect_handler_level=True)
+        _ecouteur.start()
+        # Vide la file à l'arrêt du processus
+        atexit.register(_ecouteur.stop)
+
+
+def obtenir_logger(nom):
+    """Logger du module, rattaché à la file (configurée à la première utilisation)"""
+    configurer_logs()
+    return logging.getLogger(f'{RACINE}.{nom}')
+
+
+@contextmanager
+def contexte_appel(**champs):
+    """Ajoute des champs (call_id, job_id...) à tous les enregistrements du bloc, dans ce thread"""
+    jeton = _contexte.set(dict(_contexte.get(), **champs))
+    try:
+        yield
+    finally:
+        _contexte.reset(jeton)
+
+
+def evenement(logger, etape, message='', niveau=logging.INFO, **champs):
+    """Un enregistrement structuré pour une étape de commande"""
+    if logger.isEnabledFor(niveau):
+        logger.log(niveau, message or etape, extra=dict(champs, etape=etape))
+
+
+def statistiques_logs():
+    """Taille de la file et enregistrements abandonnés (file pleine)"""
+    if _gestionnaire is None:
+        return {'file': 0, 'abandons': 0}
+    return {'file': _gestionnaire.queue.qsize(), 'abandons': _gestionnaire.abandons}
@@ -0,0 +1,343 @@
+"""
+Catalogue structuré du menu Chicken Hot Dreux
+
+Chargé une seule fois à l'import : produits, formules "seul"/"menu", tailles
+(x3, x6...), alias et prix. Fournit :
+- le texte du menu envoyé à l'IA (MENU_CONTEXT)
+- un détecteur multi-motifs (Aho-Corasick) qui repère tous les produits
+  d'une transcription en une seule passe
+- la vérification des prix renvoyés par l'IA et le recalcul du total
+"""
+
+import re
+from collections import deque
+
+from addresses import sans_accents
+
+# (titre de la catégorie, [(produit, prix)], description facultative)
+# prix : {'seul': 6.90, 'menu': 8.90} ou {'seul': {3: 3.50, 7: 6.90}} ou {None: 1.70}
+CATEGORIES = [
+    ('NAANS (Wraps)', [
+        ('Mixte', {'seul': 7.50, 'menu': 9.50}),
+        ('Spécial', {'seul': 7.50, 'menu': 9.50}),
+        ('Country', {'seul': 7.50, 'menu': 9.50}),
+        ('Classico', {'seul': 6.90, 'menu': 8.90}),
+        ('Classic', {'seul': 6.90, 'menu': 8.90}),
+        ('Curry', {'seul': 6.90, 'menu': 8.90}),
+        ('Royal', {'seul': 7.50, 'menu': 9.50}),
+        ('Oriental', {'seul': 7.50, 'menu': 9.50}),
+        ('RoyalBacon', {'seul': 7.50, 'menu': 9.50}),
+        ('DoubleFish', {'seul': 6.50, 'menu': 8.50}),
+    ], None),
+    ('CHICKENBURGERS', [
+        ('Légende', {'seul': 7.00, 'menu': 9.00}),
+        ('Wafelé', {'seul': 6.50, 'menu': 8.50}),
+        ('FiletBurger', {'seul': 5.90, 'menu': 7.90}),
+        ('BigBacon', {'seul': 6.50, 'menu': 8.50}),
+        ('BigChicken', {'seul': 6.50, 'menu': 8.50}),
+        ('FiletBBQ', {'seul': 6.50, 'menu': 8.50}),
+    ], None),
+    ('CLASSIQUEBURGERS', [
+        ('Fish', {'seul': 5.30, 'menu': 7.30}),
+        ('Cheese', {'seul': 3.50, 'menu': 5.50}),
+        ('BigCheese', {'seul': 4.90, 'menu': 6.90}),
+    ], None),
+    ('EXTRAS', [
+        ('Tenders', {'seul': {3: 3.50, 7: 6.90, 14: 12.50}}),
+        ('Pilons', {'seul': {3: 4.90, 5: 7.90}}),
+        ('Wings', {'seul': {3: 2.90, 6: 4.90, 10: 8.00, 15: 11.40}}),
+        ('Nuggets', {'seul': {6: 4.90}}),
+        ('Frites', {None: 1.70}),
+        ('Camembert', {'seul': {6: 4.90}}),
+        ('Jalapeños', {'seul': {6: 4.90}}),
+        ('MozzaSticks', {'seul': {6: 4.90}}),
+        ('Cheese Naan', {None: 2.90}),
+    ], None),
+    ('CHICKEN BOX (avec frites & boisson)', [
+        ('Wings', {'menu': {6: 6.90, 10: 10.00, 15: 13.40}}),
+        ('Tenders', {'menu': {7: 8.90, 14: 14.50}}),
+        ('Pilons', {'menu': {3: 6.90, 5: 9.90}}),
+    ], None),
+    ('FAMILY BOX', [
+        ('Menu XXL', {None: 18.50}),
+        ('Menu Friends', {None: 27.90}),
+        ('Menu Only', {None: 36.50}),
+        ('Menu Family', {None: 34.90}),
+    ], None),
+    ('MENU ENFANT', [
+        ('Menu Enfant', {None: 5.90}),
+    ], "Burger Junior ou 5 Nuggets ou 1 Wrap + frites + jus + compote ou Kinder"),
+]
+
+# Alias supplémentaires (en plus du nom, du nom découpé et du singulier/pluriel)
+ALIAS = {
+    'Spécial': ['speciale'],
+    'Wafelé': ['wafel', 'waffle', 'gaufre'],
+    'FiletBBQ': ['filet barbecue'],
+    'Jalapeños': ['jalapenos', 'jalapeno'],
+    'MozzaSticks': ['mozza', 'mozzarella sticks', 'sticks mozza'],
+    'Menu XXL': ['xxl'],
+    'Menu Friends': ['friends'],
+    'Menu Family': ['family'],
+    'Menu Enfant': ['enfant', 'menu junior', 'menu kids'],
+    'Cheese Naan': ['naan cheese', 'naan fromage'],
+}
+
+# Mots qui précisent la formule dans un nom d'article ou une transcription
+MOTS_SEUL = ('seul', 'seule', 'sans menu', 'sans frites')
+MOTS_MENU = ('menu', 'formule', 'box')
+
+_NON_ALPHANUM = re.compile(r'[^a-z0-9]+')
+_TAILLE_X = re.compile(r'\bx\s*(\d+)\b')
+_NOMBRE = re.compile(r'\b(\d+)\b')
+
+
+def normaliser(texte):
+    """Minuscules, sans accents, ponctuation remplacée par des espaces"""
+    return ' '.join(_NON_ALPHANUM.sub(' ', sans_accents(texte.lower())).split())
+
+
+def formater_prix(prix):
+    """8.9 -> "8,90€" (format du menu)"""
+    return f"{prix:.2f}".replace('.', ',') + '€'
+
+
+class Produit:
+    """Un produit du menu et toutes ses variantes (formule, taille) -> prix"""
+
+    def __init__(self, nom):
+        self.nom = nom
+        self.cle = normaliser(nom)
+        self.variantes = {}
+
+    @property
+    def formules(self):
+        return {formule for formule, _ in self.variantes}
+
+    def tailles(self, formule):
+        return sorted(taille for f, taille in self.variantes if f == formule and taille is not None)
+
+    @property
+    def formule_defaut(self):
+        # Règle du menu : les sandwichs sont en "Menu" par défaut, les extras à l'unité
+        formules = self.formules
+        if None in formules:
+            return None
+        if 'seul' in formules and 'menu' in formules and not self.tailles('seul'):
+            return 'menu'
+        return 'seul' if 'seul' in formules else 'menu'
+
+    def taille_defaut(self, formule):
+        tailles = self.tailles(formule)
+        if not tailles:
+            return None
+        # Plus petite taille commune aux deux formules (Wings x6, Tenders x7), sinon la plus petite
+        autre = self.tailles('menu' if formule == 'seul' else 'seul')
+        communes = [t for t in tailles if t in autre]
+        return communes[0] if communes else tailles[0]
+
+    def prix(self, formule, taille):
+        return self.variantes.get((formule, taille))
+
+    def nom_article(self, formule, taille):
+        """Nom affiché : "Menu Curry", "Curry seul", "Wings x6", "Menu Tenders x7"..."""
+        if formule is None:
+            return self.nom
+        if taille is None:
+            return f"Menu {self.nom}" if formule == 'menu' else f"{self.nom} seul"
+        nom = f"{self.nom} x{taille}"
+        return f"Menu {nom}" if formule == 'menu' else nom
+
+    def alias(self):
+        noms = {self.cle, normaliser(re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', self.nom))}
+        noms.update(normaliser(a) for a in ALIAS.get(self.nom, []))
+        # Singulier / pluriel ("wing", "currys", "tender")
+        for nom in list(noms):
+            if nom.endswith('s') and len(nom) > 4:
+                noms.add(nom[:-1])
+            elif not nom.endswith('s'):
+                noms.add(nom + 's')
+        return noms
+
+
+class DetecteurMotifs:
+    """Automate d'Aho-Corasick : trouve tous les motifs d'un texte en une passe"""
+
+    def __init__(self, motifs):
+        # motifs : {texte: valeur}
+        self._transitions = [{}]
+        self._echec = [0]
+        self._sorties = [[]]
+
+        for motif, valeur in motifs.items():
+            etat = 0
+            for c in motif:
+                suivant = self._transitions[etat].get(c)
+                if suivant is None:
+                    suivant = len(self._transitions)
+                    self._transitions.append({})
+                    self._echec.append(0)
+                    self._sorties.append([])
+                    self._transitions[etat][c] = suivant
+                etat = suivant
+            self._sorties[etat].append((len(motif), valeur))
+
+        # Liens d'échec (parcours en largeur)
+        file = deque(self._transitions[0].values())
+        while file:
+            etat = file.popleft()
+            for c, suivant in self._transitions[etat].items():
+                file.append(suivant)
+                echec = self._echec[etat]
+                while echec and c not in self._transitions[echec]:
+                    echec = self._echec[echec]
+                cible = self._transitions[echec].get(c, 0)
+                self._echec[suivant] = cible if cible != suivant else 0
+                self._sorties[suivant] = self._sorties[suivant] + self._sorties[self._echec[suivant]]
+
+    def rechercher(self, texte):
+        """
+        Retourne les occurrences [(début, fin, valeur)] alignées sur des mots,
+        sans chevauchement (la plus longue l'emporte)
+        """
+        trouves = []
+        etat = 0
+        for i, c in enumerate(texte):
+            while etat and c not in self._transitions[etat]:
+                etat = self._echec[etat]
+            etat = self._transitions[etat].get(c, 0)
+            for longueur, valeur in self._sorties[etat]:
+                debut, fin = i - longueur + 1, i + 1
+                if (debut == 0 or texte[debut - 1] == ' ') and (fin == len(texte) or texte[fin] == ' '):
+                    trouves.append((debut, fin, valeur))
+
+        trouves.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        resultat = []
+        fin_precedente = -1
+        for debut, fin, valeur in trouves:
+            if debut >= fin_precedente:
+                resultat.append((debut, fin, valeur))
+                fin_precedente = fin
+        return resultat
+
+
+class Catalogue:
+    """Catalogue indexé du menu"""
+
+    def __init__(self, categories):
+        self.categories = categories
+        self.produits = {}
+
+        for _, lignes, _ in categories:
+            for nom, prix in lignes:
+                produit = self.produits.setdefault(normaliser(nom), Produit(nom))
+                for formule, valeur in prix.items():
+                    if isinstance(valeur, dict):
+                        for taille, p in valeur.items():
+                            produit.variantes[(formule, taille)] = p
+                    else:
+                        produit.variantes[(formule, None)] = valeur
+
+        motifs = {}
+        for produit in self.produits.values():
+            for alias in produit.alias():
+                motifs.setdefault(alias, produit)
+        self.detecteur = DetecteurMotifs(motifs)
+
+    def detecter(self, texte):
+        """Produits cités dans un texte : [(début, fin, produit)] sur le texte normalisé"""
+        return self.detecteur.rechercher(normaliser(texte))
+
+    def resoudre(self, nom, prix_indique=None):
+        """
+        Retrouve (produit, formule, taille) à partir d'un nom d'article
+        ("Menu Curry", "Wings x10", "Curry seul"...). None si produit inconnu.
+        """
+        texte = normaliser(nom)
+        trouves = self.detecteur.rechercher(texte)
+        if not trouves:
+            return None
+        # Le motif le plus long est le plus précis ("big cheese" plutôt que "cheese")
+        debut, fin, produit = max(trouves, key=lambda m: m[1] - m[0])
+        reste = f"{texte[:debut]} {texte[fin:]}"
+
+        formule = None
+        if None not in produit.formules:
+            if any(re.search(rf'\b{mot}\b', reste) for mot in MOTS_SEUL):
+                formule = 'seul'
+            elif any(re.search(rf'\b{mot}\b', reste) for mot in MOTS_MENU):
+                formule = 'menu'
+
+        taille = None
+        match = _TAILLE_X.search(reste)
+        if match:
+            taille = int(match.group(1))
+        else:
+            for n in _NOMBRE.findall(reste):
+                if any(int(n) == t for f in produit.formules for t in produit.tailles(f)):
+                    taille = int(n)
+                    break
+
+        if formule is None and None not in produit.formules:
+            # Pas de précision : on garde la variante au prix annoncé si elle existe
+            formule = produit.formule_defaut
+            if prix_indique is not None:
+                for (f, t), p in produit.variantes.items():
+                    if abs(p - prix_indique) < 0.005 and (taille is None or t == taille):
+                        formule, taille = f, t
+                        break
+
+        if taille is None:
+            taille = produit.taille_defaut(formule)
+        elif produit.prix(formule, taille) is None:
+            taille = produit.taille_defaut(formule)
+        return produit, formule, taille
+
+    def verifier_articles(self, articles):
+        """
+        Corrige les prix unitaires des articles ({'nom', 'prix', 'quantite'})
+        d'après le catalogue et recalcule le total.
+        Retourne (articles, prix_total, corrections).
+        """
+        corriges = []
+        corrections = []
+        total = 0.0
+        for art in articles:
+            art = dict(art)
+            resolu = self.resoudre(art['nom'], art.get('prix'))
+            if resolu is not None:
+                produit, formule, taille = resolu
+                prix = produit.prix(formule, taille)
+                if prix is not None and abs(prix - art['prix']) >= 0.005:
+                    corrections.append(f"{art['nom']}: {art['prix']:.2f}€ -> {prix:.2f}€")
+                    art['prix'] = prix
+            total += art['prix'] * art['quantite']
+            corriges.append(art)
+        return corriges, round(total, 2), corrections
+
+    def contexte_menu(self):
+        """Texte du menu pour le prompt de l'IA"""
+        lignes = ['', '=== MENU CHICKEN HOT DREUX ===', '']
+        for titre, produits, description in self.categories:
+            if description:
+                nom, prix = produits[0]
+                lignes.append(f"{titre} ({formater_prix(prix[None])}): {description}")
+                continue
+            lignes.append(f"{titre}:")
+            for nom, prix in produits:
+                lignes.append(f"- {self._ligne_menu(nom, prix)}")
+            lignes.append('')
+        return '\n'.join(lignes) + '\n'
+
+    @staticmethod
+    def _ligne_menu(nom, prix):
+        if 'seul' in prix and 'menu' in prix:
+            return f"{nom} ({formater_prix(prix['seul'])} seul / {formater_prix(prix['menu'])} menu)"
+        formule, valeur = next(iter(prix.items()))
+        if isinstance(valeur, dict):
+            tailles = ' / '.join(f"x{t} ({formater_prix(p)})" for t, p in valeur.items())
+            return f"{'Menu ' if formule == 'menu' else ''}{nom} {tailles}"
+        return f"{nom} ({formater_prix(valeur)})"
+
+
+CATALOGUE = Catalogue(CATEGORIES)
@@ -0,0 +1,238 @@
+"""
+Métriques du traitement des appels, exposées au format Prometheus sur /metrics
+
+- histogrammes de durée par étape (déduplication, analyse rapide, appel LLM,
+  parsing JSON, fallback, géocodage, distance, frais, envoi Firebase) et du
+  webhook complet
+- compteurs : tokens OpenAI, niveau d'analyse (rapide / llm / fallback),
+  source du géocodage, résultat de la déduplication
+- valeurs lues au moment de la collecte sur les composants qui comptent déjà
+  (cache de géocodage, géocodage anticipé, boîte d'envoi)
+
+Implémentation sans dépendance : un registre par processus. Avec plusieurs
+workers gunicorn, chaque lecture de /metrics renvoie les valeurs du worker
+qui la reçoit.
+"""
+
+import os
+import threading
+import time
+from functools import wraps
+
+METRICS_PREFIX = os.environ.get('METRICS_PREFIX', 'chicken')
+
+# Bornes des histogrammes de durée (secondes) : du cache mémoire à l'appel GPT-4o lent
+BUCKETS_DUREE = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+
+def percentile(valeurs_triees, p):
+    """Percentile (0-100) d'une liste déjà triée"""
+    if not valeurs_triees:
+        return 0.0
+    k = min(len(valeurs_triees) - 1, max(0, int(round(p / 100 * (len(valeurs_triees) - 1)))))
+    return valeurs_triees[k]
+
+
+def _echapper(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(noms, valeurs, extra=()):
+    paires = list(zip(noms, valeurs)) + list(extra)
+    if not paires:
+        return ''
+    return '{' + ','.join(f'{nom}="{_echapper(valeur)}"' for nom, valeur in paires) + '}'
+
+
+def _format_nombre(valeur):
+    if valeur == float('inf'):
+        return '+Inf'
+    if isinstance(valeur, float) and valeur.is_integer():
+        return str(int(valeur))
+    return repr(valeur) if isinstance(valeur, float) else str(valeur)
+
+
+class Compteur:
+    """Compteur monotone, une série par combinaison de labels"""
+
+    type = 'counter'
+
+    def __init__(self, nom, aide, labels=()):
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._valeurs = {}
+
+    def inc(self, *labels, valeur=1):
+        with self._lock:
+            self._valeurs[labels] = self._valeurs.get(labels, 0) + valeur
+
+    def valeurs(self):
+        with self._lock:
+            return dict(self._valeurs)
+
+    def lignes(self):
+        return [f'{self.nom}{_format_labels(self.labels, cle)} {_format_nombre(v)}'
+                for cle, v in sorted(self.valeurs().items())]
+
+
+class Histogramme:
+    """Histogramme cumulatif (buckets, somme, nombre), une série par combinaison de labels"""
+
+    type = 'histogram'
+
+    def __init__(self, nom, aide, labels=(), buckets=BUCKETS_DUREE):
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observer(self, valeur, *labels):
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                serie = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, borne in enumerate(self.buckets):
+                if valeur <= borne:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valeur
+            serie[2] += 1
+
+    def lignes(self):
+        with self._lock:
+            series = {cle: (list(c), s, n) for cle, (c, s, n) in self._series.items()}
+        lignes = []
+        for cle, (compteurs, somme, nombre) in sorted(series.items()):
+            cumul = 0
+            for borne, n in zip(self.buckets, compteurs):
+                cumul += n
+                labels = _format_labels(self.labels, cle, [('le', _format_nombre(float(borne)))])
+                lignes.append(f'{self.nom}_bucket{labels} {cumul}')
+            lignes.append(f'{self.nom}_sum{_format_labels(self.labels, cle)} {_format_nombre(round(somme, 6))}')
+            lignes.append(f'{self.nom}_count{_format_labels(self.labels, cle)} {nombre}')
+        return lignes
+
+
+class Registre:
+    """Métriques du processus et collecteurs appelés à chaque lecture de /metrics"""
+
+    def __init__(self, prefixe=METRICS_PREFIX):
+        self.prefixe = prefixe
+        self._metriques = []
+        self._collecteurs = []
+        self._lock = threading.Lock()
+
+    def compteur(self, nom, aide, labels=()):
+        return self._ajouter(Compteur(f'{self.prefixe}_{nom}', aide, labels))
+
+    def histogramme(self, nom, aide, labels=(), buckets=BUCKETS_DUREE):
+        return self._ajouter(Histogramme(f'{self.prefixe}_{nom}', aide, labels, buckets))
+
+    def _ajouter(self, metrique):
+        with self._lock:
+            self._metriques.append(metrique)
+        return metrique
+
+    def collecteur(self, fonction):
+        """
+        Enregistre fonction() -> liste de (nom, type, aide, [(labels dict, valeur)]),
+        appelée à chaque collecte ; une erreur n'empêche pas les autres métriques
+        """
+        with self._lock:
+            self._collecteurs.append(fonction)
+        return fonction
+
+    def exposer(self):
+        """Texte au format d'exposition Prometheus (text/plain; version=0.0.4)"""
+        with self._lock:
+            metriques, collecteurs = list(self._metriques), list(self._collecteurs)
+        lignes = []
+        for m in metriques:
+            lignes += [f'# HELP {m.nom} {m.aide}', f'# TYPE {m.nom} {m.type}'] + m.lignes()
+        for fonction in collecteurs:
+            try:
+                familles = fonction()
+            except Exception as e:
+                print(f"⚠️ Collecteur de métriques en erreur: {e}")
+                continue
+            for nom, type_, aide, echantillons in familles:
+                nom = f'{self.prefixe}_{nom}'
+                lignes += [f'# HELP {nom} {aide}', f'# TYPE {nom} {type_}']
+                for labels, valeur in echantillons:
+                    if valeur is None:
+                        continue
+                    lignes.append(f'{nom}{_format_labels(labels.keys(), labels.values())} {_format_nombre(valeur)}')
+        return '\n'.join(lignes) + '\n'
+
+
+registre = Registre()
+
+duree_etapes = registre.histogramme(
+    'stage_duration_seconds', "Durée de chaque étape du traitement d'un appel", ('stage',))
+duree_webhook = registre.histogramme(
+    'webhook_duration_seconds', "Durée de traitement d'un appel Retell (réponse au webhook)", ('status',))
+tokens_llm = registre.compteur(
+    'llm_tokens_total', "Tokens OpenAI consommés", ('type',))
+appels_llm = registre.compteur(
+    'llm_requests_total', "Appels OpenAI par résultat", ('outcome',))
+analyses = registre.compteur(
+    'analysis_total', "Commandes analysées par niveau (rapide, llm, fallback)", ('tier',))
+sources_geocodage = registre.compteur(
+    'geocode_source_total', "Adresses résolues par source (cache, gazetteer, nominatim, erreur)", ('source',))
+deduplication = registre.compteur(
+    'dedup_total', "Appels reçus par résultat de la déduplication", ('result',))
+
+
+class Chronometre:
+    """
+    Mesure une étape (bloc with) dans stage_duration_seconds ; la durée en ms
+    reste disponible dans .ms pour les temps renvoyés au webhook
+    """
+
+    def __init__(self, etape):
+        self.etape = etape
+        self.ms = 0.0
+
+    def __enter__(self):
+        self._debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duree = time.perf_counter() - self._debut
+        self.ms = round(duree * 1000, 1)
+        duree_etapes.observer(duree, self.etape)
+        return False
+
+
+def etape_chronometree(etape):
+    """Décorateur : chaque appel de la fonction est mesuré comme une étape"""
+    def decorateur(fonction):
+        @wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            with Chronometre(etape):
+                return fonction(*args, **kwargs)
+        return enveloppe
+    return decorateur
+
+
+def observer_etape(etape, secondes):
+    """Enregistre une durée déjà mesurée"""
+    duree_etapes.observer(secondes, etape)
+
+
+def compter_tokens(usage):
+    """Ajoute l'usage d'une réponse OpenAI (objet ou dict) aux compteurs de tokens"""
+    if usage is None:
+        return
+    for type_ in ('prompt_tokens', 'completion_tokens'):
+        valeur = usage.get(type_) if isinstance(usage, dict) else getattr(usage, type_, None)
+        if valeur:
+            tokens_llm.inc(type_.removesuffix('_tokens'), valeur=valeur)
+
+
+def exposer():
+    return registre.exposer()
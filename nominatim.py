@@ -0,0 +1,273 @@
+"""
+Client Nominatim partagé : débit limité, file à priorités, requêtes regroupées
+
+La politique d'utilisation du serveur public de Nominatim autorise environ
+une requête par seconde ; au-delà, il répond 429 puis bannit l'adresse IP.
+Toutes les requêtes du processus passent donc par ce client :
+- seau à jetons : NOMINATIM_RATE requêtes/s, NOMINATIM_BURST d'avance au plus
+- file à priorités : l'adresse d'une commande analysée passe avant une adresse
+  anticipée par les regex (spéculative) ; prioriser() remonte une demande déjà
+  en file quand elle devient l'adresse finale
+- regroupement (singleflight) : les demandes simultanées pour la même adresse
+  normalisée partagent une seule requête et son résultat
+- une demande qui attend plus de NOMINATIM_QUEUE_TIMEOUT secondes est
+  abandonnée sans consommer de jeton, et la commande continue sans géocodage
+- abandonner() retire de la file une demande anticipée devenue inutile, quand
+  plus aucun appelant ne l'attend (elle ne consomme alors pas de jeton)
+
+Métriques : attente dans la file par priorité, demandes regroupées ou
+abandonnées, taille de la file ; résumé dans /health → nominatim.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from addresses import normaliser_adresse
+from metrics import registre, percentile
+
+NOMINATIM_RATE = float(os.environ.get('NOMINATIM_RATE', 1.0))
+NOMINATIM_BURST = float(os.environ.get('NOMINATIM_BURST', 1))
+NOMINATIM_QUEUE_TIMEOUT = float(os.environ.get('NOMINATIM_QUEUE_TIMEOUT', 10))
+NOMINATIM_QUEUE_MAX = int(os.environ.get('NOMINATIM_QUEUE_MAX', 200))
+# Requêtes HTTP en vol en même temps (une réponse lente ne retarde pas la suivante)
+NOMINATIM_WORKERS = int(os.environ.get('NOMINATIM_WORKERS', 4))
+
+PRIORITE_COMMANDE = 0
+PRIORITE_ANTICIPATION = 1
+NOMS_PRIORITES = {PRIORITE_COMMANDE: 'order', PRIORITE_ANTICIPATION: 'speculative'}
+
+attente_file = registre.histogramme(
+    'nominatim_queue_wait_seconds', "Attente dans la file avant l'envoi à Nominatim", ('priority',))
+demandes_regroupees = registre.compteur(
+    'nominatim_coalesced_total', "Demandes regroupées avec une requête identique déjà en file ou en vol")
+demandes_abandonnees = registre.compteur(
+    'nominatim_dropped_total', "Demandes abandonnées sans requête (file pleine, attente trop longue, plus attendue)", ('reason',))
+
+
+class SeauJetons:
+    """Limiteur de débit : `debit` jetons par seconde, `capacite` au plus en réserve"""
+
+    def __init__(self, debit, capacite):
+        self.debit = debit
+        self.capacite = max(1.0, capacite)
+        self._jetons = self.capacite
+        self._dernier = time.monotonic()
+        self._lock = threading.Lock()
+
+    def prendre(self):
+        """Prend un jeton ; retourne 0, ou le temps (s) à attendre avant de réessayer"""
+        with self._lock:
+            maintenant = time.monotonic()
+            self._jetons = min(self.capacite, self._jetons + (maintenant - self._dernier) * self.debit)
+            self._dernier = maintenant
+            if self._jetons >= 1:
+                self._jetons -= 1
+                return 0.0
+            return (1 - self._jetons) / self.debit
+
+    def rendre(self):
+        """Rend un jeton pris pour rien (toutes les demandes en file avaient expiré)"""
+        with self._lock:
+            self._jetons = min(self.capacite, self._jetons + 1)
+
+    def attendre(self):
+        """Bloque jusqu'à obtenir un jeton"""
+        while True:
+            attente = self.prendre()
+            if attente <= 0:
+                return
+            time.sleep(attente)
+
+
+class Abonnement:
+    """Intérêt d'un appelant pour une demande, qu'il peut abandonner tant qu'elle est en file"""
+    __slots__ = ('demande', 'abandonne')
+
+    def __init__(self):
+        self.demande = None
+        self.abandonne = False
+
+
+class _Demande:
+    __slots__ = ('cle', 'adresse', 'priorite', 'debut', 'echeance', 'future', 'envoyee', 'abonnes')
+
+    def __init__(self, cle, adresse, priorite):
+        self.cle = cle
+        self.adresse = adresse
+        self.priorite = priorite
+        self.debut = time.monotonic()
+        self.echeance = self.debut + NOMINATIM_QUEUE_TIMEOUT
+        self.future = Future()
+        self.envoyee = False
+        # Appelants qui attendent le résultat (une demande sans abonnement n'est jamais abandonnée)
+        self.abonnes = 0
+
+
+class ClientNominatim:
+    """File unique du processus ; geocoder(adresse) fait la requête et retourne le résultat final"""
+
+    def __init__(self, geocoder, debit=NOMINATIM_RATE, capacite=NOMINATIM_BURST):
+        self.geocoder = geocoder
+        self._seau = SeauJetons(debit, capacite)
+        self._cond = threading.Condition()
+        self._file = []
+        self._demandes = {}
+        self._sequence = itertools.count()
+        self._pool = ThreadPoolExecutor(max_workers=NOMINATIM_WORKERS, thread_name_prefix='nominatim')
+        self._thread = None
+        self._attentes = deque(maxlen=500)
+        self._stats = {
+            'requetes': 0, 'regroupees': 0, 'abandons_file_pleine': 0, 'abandons_attente': 0, 'abandons_appelant': 0}
+
+    def soumettre(self, adresse, priorite=PRIORITE_COMMANDE, abonnement=None):
+        """
+        Future du résultat ; partagée avec une demande identique déjà en file ou en vol.
+        Avec un abonnement, l'appelant peut ensuite renoncer à la demande (abandonner()).
+        """
+        cle = normaliser_adresse(adresse) or adresse
+        with self._cond:
+            if abonnement is not None and abonnement.abandonne:
+                # Abandonnée avant même d'être soumise (géocodage anticipé annulé entre-temps)
+                future = Future()
+                future.cancel()
+                return future
+
+            demande = self._demandes.get(cle)
+            if demande is not None:
+                self._stats['regroupees'] += 1
+                demandes_regroupees.inc()
+                self._remonter(demande, priorite)
+                self._abonner(demande, abonnement)
+                return demande.future
+
+            if len(self._demandes) >= NOMINATIM_QUEUE_MAX:
+                self._stats['abandons_file_pleine'] += 1
+                demandes_abandonnees.inc('queue_full')
+                future = Future()
+                future.set_exception(RuntimeError("File Nominatim pleine"))
+                return future
+
+            demande = _Demande(cle, adresse, priorite)
+            self._abonner(demande, abonnement)
+            self._demandes[cle] = demande
+            heapq.heappush(self._file, (priorite, next(self._sequence), demande))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, name='nominatim-dispatch', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return demande.future
+
+    def rechercher(self, adresse, priorite=PRIORITE_COMMANDE):
+        """Version bloquante de soumettre()"""
+        return self.soumettre(adresse, priorite).result()
+
+    def prioriser(self, adresse, priorite=PRIORITE_COMMANDE):
+        """Remonte une demande encore en file (adresse anticipée devenue l'adresse de la commande)"""
+        with self._cond:
+            demande = self._demandes.get(normaliser_adresse(adresse) or adresse)
+            if demande is not None:
+                self._remonter(demande, priorite)
+
+    def abandonner(self, abonnement):
+        """L'appelant renonce au résultat ; la demande quitte la file si personne d'autre ne l'attend"""
+        with self._cond:
+            abonnement.abandonne = True
+            demande = abonnement.demande
+            if demande is None or demande.envoyee:
+                return
+            abonnement.demande = None
+            demande.abonnes -= 1
+            if demande.abonnes > 0:
+                return
+            # L'entrée reste dans le tas mais sera ignorée, sans consommer de jeton
+            demande.envoyee = True
+            self._demandes.pop(demande.cle, None)
+            self._stats['abandons_appelant'] += 1
+        demandes_abandonnees.inc('cancelled')
+        demande.future.cancel()
+
+    @staticmethod
+    def _abonner(demande, abonnement):
+        demande.abonnes += 1
+        if abonnement is not None:
+            abonnement.demande = demande
+
+    def _remonter(self, demande, priorite):
+        # L'ancienne entrée reste dans le tas ; elle sera ignorée (demande déjà envoyée)
+        if priorite < demande.priorite and not demande.envoyee:
+            demande.priorite = priorite
+            heapq.heappush(self._file, (priorite, next(self._sequence), demande))
+
+    def _suivante(self):
+        """Demande la plus prioritaire encore valide (sous self._cond), ou None"""
+        maintenant = time.monotonic()
+        while self._file:
+            _, _, demande = heapq.heappop(self._file)
+            if demande.envoyee:
+                continue
+            demande.envoyee = True
+            if maintenant > demande.echeance:
+                self._demandes.pop(demande.cle, None)
+                self._stats['abandons_attente'] += 1
+                demandes_abandonnees.inc('queue_timeout')
+                demande.future.set_exception(TimeoutError("Attente Nominatim trop longue"))
+                continue
+            return demande
+        return None
+
+    def _boucle(self):
+        while True:
+            with self._cond:
+                while not self._file:
+                    self._cond.wait()
+            # Jeton obtenu hors du verrou : les demandes continuent d'arriver (et d'être regroupées)
+            self._seau.attendre()
+            with self._cond:
+                demande = self._suivante()
+            if demande is None:
+                self._seau.rendre()
+                continue
+            attente = time.monotonic() - demande.debut
+            attente_file.observer(attente, NOMS_PRIORITES.get(demande.priorite, str(demande.priorite)))
+            with self._cond:
+                self._stats['requetes'] += 1
+                self._attentes.append(attente * 1000)
+            self._pool.submit(self._executer, demande)
+
+    def _executer(self, demande):
+        try:
+            resultat = self.geocoder(demande.adresse)
+        except Exception as e:
+            demande.future.set_exception(e)
+        else:
+            demande.future.set_result(resultat)
+        finally:
+            with self._cond:
+                if self._demandes.get(demande.cle) is demande:
+                    del self._demandes[demande.cle]
+
+    def taille_file(self):
+        with self._cond:
+            return sum(1 for d in self._demandes.values() if not d.envoyee)
+
+    def stats(self):
+        with self._cond:
+            attentes = sorted(self._attentes)
+            en_vol = sum(1 for d in self._demandes.values() if d.envoyee)
+            stats = dict(self._stats)
+        return dict(
+            stats,
+            file=self.taille_file(),
+            en_vol=en_vol,
+            debit=self._seau.debit,
+            attente_ms={
+                'p50': round(percentile(attentes, 50), 1),
+                'p95': round(percentile(attentes, 95), 1),
+                'max': round(attentes[-1], 1) if attentes else 0.0
+            }
+        )
@@ -0,0 +1,273 @@
+"""
+Client OpenAI partagé par tout le processus
+
+Un seul client (et donc un seul pool de connexions HTTP keep-alive) est créé
+à la première utilisation, avec des délais de connexion/lecture explicites.
+Le préchauffage facultatif ouvre la connexion TLS au démarrage du worker,
+pour que la première commande ne paie pas l'établissement de la connexion.
+
+En mode ASGI (asgi_app.py), un client AsyncOpenAI est créé de la même façon
+pour la boucle d'événements du worker ; les deux partagent les mesures.
+
+Chaque appel passe par le disjoncteur "openai" (resilience.py) : délai
+adaptatif, refus immédiat quand OpenAI est en panne, requête doublée
+facultative (OPENAI_HEDGE=1, hors streaming).
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from logging_setup import obtenir_logger, evenement
+from metrics import appels_llm, compter_tokens, observer_etape, percentile
+from resilience import dependance
+
+logger = obtenir_logger('openai')
+
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 3.0))
+OPENAI_READ_TIMEOUT = float(os.environ.get('OPENAI_READ_TIMEOUT', 20.0))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 16))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 1))
+OPENAI_WARMUP = os.environ.get('OPENAI_WARMUP', '0') == '1'
+OPENAI_STREAMING = os.environ.get('OPENAI_STREAMING', '0') == '1'
+# Mode ASGI : les appels en attente ne tiennent plus de thread, le pool peut être plus large
+OPENAI_ASYNC_MAX_CONNECTIONS = int(os.environ.get('OPENAI_ASYNC_MAX_CONNECTIONS', 200))
+# Délai minimal quand le délai s'adapte aux latences observées (le maximum est OPENAI_READ_TIMEOUT)
+OPENAI_TIMEOUT_MIN = float(os.environ.get('OPENAI_TIMEOUT_MIN', 5.0))
+# Requête doublée si la réponse dépasse le p95 (double le coût en tokens de ces appels)
+OPENAI_HEDGE = os.environ.get('OPENAI_HEDGE', '0') == '1'
+# Autre point d'accès compatible (proxy, faux serveur du banc d'essai)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+
+dependance_openai = dependance('openai', OPENAI_READ_TIMEOUT, OPENAI_TIMEOUT_MIN, doubler=OPENAI_HEDGE)
+
+
+class GestionnaireOpenAI:
+    """Crée le client OpenAI une seule fois (thread-safe) et mesure chaque appel"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._client_async = None
+        self._boucle_async = None
+        self._latences = deque(maxlen=500)
+        self._appels = 0
+        self._erreurs = 0
+        self._prechauffe_ms = None
+        self._premiers_tokens = deque(maxlen=500)
+
+    def client(self):
+        """Retourne le client partagé, ou None si OPENAI_API_KEY est absent"""
+        if self._client is not None:
+            return self._client
+
+        with self._lock:
+            if self._client is None:
+                api_key = os.environ.get('OPENAI_API_KEY')
+                if not api_key:
+                    return None
+                # Imports différés : le démarrage du serveur ne paie pas le chargement du SDK
+                import httpx
+                from openai import OpenAI
+                timeout = httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+                http_client = httpx.Client(
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                        keepalive_expiry=120
+                    )
+                )
+                self._client = OpenAI(
+                    api_key=api_key,
+                    base_url=OPENAI_BASE_URL,
+                    timeout=timeout,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=http_client
+                )
+        return self._client
+
+    def client_async(self):
+        """Client AsyncOpenAI de la boucle d'événements courante (mode ASGI), ou None sans clé"""
+        boucle = asyncio.get_running_loop()
+        if self._client_async is not None and self._boucle_async is boucle:
+            return self._client_async
+
+        with self._lock:
+            if self._client_async is None or self._boucle_async is not boucle:
+                api_key = os.environ.get('OPENAI_API_KEY')
+                if not api_key:
+                    return None
+                import httpx
+                from openai import AsyncOpenAI
+                timeout = httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+                http_client = httpx.AsyncClient(
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_ASYNC_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_ASYNC_MAX_CONNECTIONS,
+                        keepalive_expiry=120
+                    )
+                )
+                self._client_async = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=OPENAI_BASE_URL,
+                    timeout=timeout,
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=http_client
+                )
+                self._boucle_async = boucle
+        return self._client_async
+
+    def _mesurer(self, debut, erreur, premier_token=None):
+        """Enregistre la durée d'un appel (et de son premier token en streaming)"""
+        duree_ms = (time.perf_counter() - debut) * 1000
+        observer_etape('llm', duree_ms / 1000)
+        with self._lock:
+            self._appels += 1
+            self._erreurs += erreur
+            self._latences.append(duree_ms)
+            if premier_token is not None:
+                self._premiers_tokens.append(premier_token)
+
+    def completion(self, **kwargs):
+        """chat.completions.create avec mesure de la latence"""
+        client = self.client()
+        if client is None:
+            raise RuntimeError("OPENAI_API_KEY manquant")
+
+        # Disjoncteur ouvert : refus immédiat, compté dans circuit_rejections_total
+        dependance_openai.verifier()
+        debut = time.perf_counter()
+        erreur = True
+        try:
+            response = dependance_openai.executer(
+                lambda delai: client.chat.completions.create(timeout=delai, **kwargs))
+            compter_tokens(response.usage)
+            erreur = False
+            return response
+        finally:
+            appels_llm.inc('error' if erreur else 'ok')
+            self._mesurer(debut, erreur)
+
+    def completion_stream(self, **kwargs):
+        """chat.completions.create en streaming : génère le texte au fil de l'eau"""
+        client = self.client()
+        if client is None:
+            raise RuntimeError("OPENAI_API_KEY manquant")
+
+        # Le dernier morceau du flux porte l'usage (tokens) de la requête
+        kwargs.setdefault('extra_body', {'stream_options': {'include_usage': True}})
+        # Pas de requête doublée en streaming : disjoncteur et délai (entre deux morceaux) seulement
+        dependance_openai.verifier()
+        debut = time.perf_counter()
+        premier_token = None
+        erreur = True
+        try:
+            for chunk in client.chat.completions.create(stream=True, timeout=dependance_openai.delai(), **kwargs):
+                compter_tokens(getattr(chunk, 'usage', None))
+                if not chunk.choices:
+                    continue
+                contenu = chunk.choices[0].delta.content
+                if contenu:
+                    if premier_token is None:
+                        premier_token = (time.perf_counter() - debut) * 1000
+                    yield contenu
+            erreur = False
+        finally:
+            appels_llm.inc('error' if erreur else 'ok')
+            dependance_openai.enregistrer(time.perf_counter() - debut, erreur)
+            self._mesurer(debut, erreur, premier_token)
+
+    async def completion_async(self, **kwargs):
+        """Version non bloquante de completion() (mode ASGI)"""
+        client = self.client_async()
+        if client is None:
+            raise RuntimeError("OPENAI_API_KEY manquant")
+
+        # Disjoncteur ouvert : refus immédiat, compté dans circuit_rejections_total
+        dependance_openai.verifier()
+        debut = time.perf_counter()
+        erreur = True
+        try:
+            response = await dependance_openai.executer_async(
+                lambda delai: client.chat.completions.create(timeout=delai, **kwargs))
+            compter_tokens(response.usage)
+            erreur = False
+            return response
+        finally:
+            appels_llm.inc('error' if erreur else 'ok')
+            self._mesurer(debut, erreur)
+
+    async def completion_stream_async(self, **kwargs):
+        """Version non bloquante de completion_stream() : générateur asynchrone du texte"""
+        client = self.client_async()
+        if client is None:
+            raise RuntimeError("OPENAI_API_KEY manquant")
+
+        kwargs.setdefault('extra_body', {'stream_options': {'include_usage': True}})
+        dependance_openai.verifier()
+        debut = time.perf_counter()
+        premier_token = None
+        erreur = True
+        try:
+            async for chunk in await client.chat.completions.create(stream=True, timeout=dependance_openai.delai(), **kwargs):
+                compter_tokens(getattr(chunk, 'usage', None))
+                if not chunk.choices:
+                    continue
+                contenu = chunk.choices[0].delta.content
+                if contenu:
+                    if premier_token is None:
+                        premier_token = (time.perf_counter() - debut) * 1000
+                    yield contenu
+            erreur = False
+        finally:
+            appels_llm.inc('error' if erreur else 'ok')
+            dependance_openai.enregistrer(time.perf_counter() - debut, erreur)
+            self._mesurer(debut, erreur, premier_token)
+
+    def prechauffer(self):
+        """Ouvre la connexion vers l'API (requête légère sur /models)"""
+        client = self.client()
+        if client is None:
+            return
+        debut = time.perf_counter()
+        try:
+            client.models.list()
+            self._prechauffe_ms = round((time.perf_counter() - debut) * 1000, 1)
+            evenement(logger, 'prechauffage_openai', "🔥 Connexion OpenAI préchauffée",
+                      duree_ms=self._prechauffe_ms)
+        except Exception as e:
+            evenement(logger, 'prechauffage_openai', "⚠️ Préchauffage OpenAI impossible",
+                      niveau=logging.WARNING, erreur=str(e))
+
+    def prechauffer_en_arriere_plan(self):
+        threading.Thread(target=self.prechauffer, name='openai-warmup', daemon=True).start()
+
+    def stats(self):
+        """Nombre d'appels, erreurs et latences (ms) des derniers appels"""
+        with self._lock:
+            latences = sorted(self._latences)
+            premiers_tokens = sorted(self._premiers_tokens)
+            appels, erreurs = self._appels, self._erreurs
+        return {
+            'appels': appels,
+            'erreurs': erreurs,
+            'prechauffe_ms': self._prechauffe_ms,
+            'latence_ms': {
+                'p50': round(percentile(latences, 50), 1),
+                'p95': round(percentile(latences, 95), 1),
+                'p99': round(percentile(latences, 99), 1),
+                'max': round(latences[-1], 1) if latences else 0.0
+            },
+            'premier_token_ms': {
+                'p50': round(percentile(premiers_tokens, 50), 1),
+                'p95': round(percentile(premiers_tokens, 95), 1)
+            }
+        }
+
+
+openai_client = GestionnaireOpenAI()
@@ -2,81 +2,30 @@
 Analyseur intelligent de commandes avec OpenAI - VERSION CORRIGÉE
 """
 
-from openai import OpenAI
 import json
 import os
-import re
-
-# Menu pour le contexte de l'IA
-MENU_CONTEXT = """
-=== MENU CHICKEN HOT DREUX ===
-
-NAANS (Wraps):
-- Mixte (7,50€ seul / 9,50€ menu)
-- Spécial (7,50€ seul / 9,50€ menu)
-- Country (7,50€ seul / 9,50€ menu)
-- Classico (6,90€ seul / 8,90€ menu)
-- Classic (6,90€ seul / 8,90€ menu)
-- Curry (6,90€ seul / 8,90€ menu)
-- Royal (7,50€ seul / 9,50€ menu)
-- Oriental (7,50€ seul / 9,50€ menu)
-- RoyalBacon (7,50€ seul / 9,50€ menu)
-- DoubleFish (6,50€ seul / 8,50€ menu)
-
-CHICKENBURGERS:
-- Légende (7,00€ seul / 9,00€ menu)
-- Wafelé (6,50€ seul / 8,50€ menu)
-- FiletBurger (5,90€ seul / 7,90€ menu)
-- BigBacon (6,50€ seul / 8,50€ menu)
-- BigChicken (6,50€ seul / 8,50€ menu)
-- FiletBBQ (6,50€ seul / 8,50€ menu)
-
-CLASSIQUEBURGERS:
-- Fish (5,30€ seul / 7,30€ menu)
-- Cheese (3,50€ seul / 5,50€ menu)
-- BigCheese (4,90€ seul / 6,90€ menu)
-
-EXTRAS:
-- Tenders x3 (3,50€) / x7 (6,90€) / x14 (12,50€)
-- Pilons x3 (4,90€) / x5 (7,90€)
-- Wings x3 (2,90€) / x6 (4,90€) / x10 (8,00€) / x15 (11,40€)
-- Nuggets x6 (4,90€)
-- Frites (1,70€)
-- Camembert x6 (4,90€)
-- Jalapeños x6 (4,90€)
-- MozzaSticks x6 (4,90€)
-- Cheese Naan (2,90€)
-
-CHICKEN BOX (avec frites & boisson):
-- Menu Wings x6 (6,90€) / x10 (10,00€) / x15 (13,40€)
-- Menu Tenders x7 (8,90€) / x14 (14,50€)
-- Menu Pilons x3 (6,90€) / x5 (9,90€)
-
-FAMILY BOX:
-- Menu XXL (18,50€)
-- Menu Friends (27,90€)
-- Menu Only (36,50€)
-- Menu Family (34,90€)
-
-MENU ENFANT (5,90€): Burger Junior ou 5 Nuggets ou 1 Wrap + frites + jus + compote ou Kinder
-"""
 
-def analyser_commande_avec_openai(transcript):
-    """
-    Analyse la transcription avec OpenAI GPT-4o
-    """
-    
-    try:
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            print("⚠️ OPENAI_API_KEY manquant - utilisation du fallback")
-            return analyser_commande_simple(transcript)
-        
-        client = OpenAI(api_key=api_key)
-    except Exception as e:
-        print(f"❌ Erreur initialisation OpenAI: {e}")
-        return analyser_commande_simple(transcript)
-    
+from addresses import extraire_adresse_manuel
+from menu_catalog import CATALOGUE
+from quick_parser import analyser_commande_rapide, StatistiquesRoutage
+from openai_client import openai_client, OPENAI_STREAMING
+from streaming_json import ExtracteurJSONIncremental
+from metrics import Chronometre, etape_chronometree, analyses
+from logging_setup import obtenir_logger, evenement
+from resilience import DependanceIndisponible
+
+# Menu pour le contexte de l'IA (généré depuis le catalogue structuré)
+MENU_CONTEXT = CATALOGUE.contexte_menu()
+
+# Confiance minimale de l'analyse rapide pour ne pas appeler GPT-4o (> 1 = toujours GPT-4o)
+SEUIL_CONFIANCE = float(os.environ.get('QUICK_PARSER_THRESHOLD', 0.9))
+
+routage = StatistiquesRoutage()
+logger = obtenir_logger('analyse')
+
+
+def parametres_openai(transcript):
+    """Paramètres de chat.completions.create pour analyser une transcription"""
     prompt = f"""Tu es un système d'analyse de commandes pour le restaurant Chicken Hot Dreux.
 
 TRANSCRIPTION DE L'APPEL :
@@ -92,10 +41,10 @@ Réponds UNIQUEMENT en JSON (sans markdown, sans texte avant/après) :
 {{
   "type_appel": "commande" ou "renseignement",
   "type_service": "Sur place" ou "À emporter" ou "Livraison",
+  "adresse_livraison": "Adresse complète avec numéro de rue, nom de rue et ville",
   "articles": [
     {{"nom": "Nom exact du menu", "prix": 8.90, "quantite": 2}}
   ],
-  "adresse_livraison": "Adresse complète avec numéro de rue, nom de rue et ville",
   "prix_total": 17.80,
   "notes": ""
 }}
@@ -127,126 +76,199 @@ EXEMPLES :
 - "Livraison au 15 rue de la Gare à Dreux" → type_service: "Livraison", adresse_livraison: "15 rue de la Gare, Dreux"
 """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Tu es un expert en extraction de données de commandes. Tu réponds UNIQUEMENT en JSON strict."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.1,
-            max_tokens=800,
-            response_format={"type": "json_object"}
-        )
-        
-        result_text = response.choices[0].message.content.strip()
-        print(f"🤖 Réponse OpenAI brute : {result_text[:200]}...")
-        
+    return dict(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "system",
+                "content": "Tu es un expert en extraction de données de commandes. Tu réponds UNIQUEMENT en JSON strict."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        temperature=0.1,
+        max_tokens=800,
+        response_format={"type": "json_object"}
+    )
+
+
+def interpreter_reponse(result_text, transcript):
+    """Valide la réponse JSON de GPT-4o et recalcule les prix d'après le catalogue"""
+    logger.debug("🤖 Réponse OpenAI brute : %s", result_text)
+    
+    with Chronometre('json_parse'):
         result = json.loads(result_text)
-        
-        # Validation et nettoyage
-        type_appel = result.get('type_appel', 'commande')
-        type_service = result.get('type_service', 'Non spécifié')
-        articles = result.get('articles', [])
-        adresse = result.get('adresse_livraison', '').strip()
-        prix_total = float(result.get('prix_total', 0))
-        notes = result.get('notes', '')
-        
-        # Si pas d'articles, créer un article par défaut
-        if not articles or len(articles) == 0:
-            print("⚠️ Aucun article détecté, création article par défaut")
-            articles = [{
-                'nom': 'Article non spécifié',
+    
+    # Validation et nettoyage
+    type_appel = result.get('type_appel', 'commande')
+    type_service = result.get('type_service', 'Non spécifié')
+    articles = result.get('articles', [])
+    adresse = result.get('adresse_livraison', '').strip()
+    prix_total_ia = float(result.get('prix_total', 0))
+    notes = result.get('notes', '')
+    
+    # Si pas d'articles, créer un article par défaut
+    if not articles or len(articles) == 0:
+        logger.warning("⚠️ Aucun article détecté, création article par défaut")
+        articles = [{
+            'nom': 'Article non spécifié',
+            'prix': 0,
+            'quantite': 1
+        }]
+    
+    # Nettoyer les articles (gérer les erreurs de format)
+    articles_propres = []
+    for art in articles:
+        try:
+            articles_propres.append({
+                'nom': str(art.get('nom', 'Article')),
+                'prix': float(art.get('prix', 0)),
+                'quantite': int(art.get('quantite', 1))
+            })
+        except Exception as e:
+            logger.warning("⚠️ Erreur format article : %s", e)
+            articles_propres.append({
+                'nom': 'Article',
                 'prix': 0,
                 'quantite': 1
-            }]
-        
-        # Nettoyer les articles (gérer les erreurs de format)
-        articles_propres = []
-        for art in articles:
-            try:
-                articles_propres.append({
-                    'nom': str(art.get('nom', 'Article')),
-                    'prix': float(art.get('prix', 0)),
-                    'quantite': int(art.get('quantite', 1))
-                })
-            except Exception as e:
-                print(f"⚠️ Erreur format article : {e}")
-                articles_propres.append({
-                    'nom': 'Article',
-                    'prix': 0,
-                    'quantite': 1
-                })
-        
-        # Nettoyer l'adresse
-        if type_service == 'Livraison' and not adresse:
-            print("⚠️ Livraison détectée mais pas d'adresse, tentative extraction manuelle")
-            adresse = extraire_adresse_manuel(transcript)
-        
-        # Formater la liste des articles pour affichage
-        articles_str = ', '.join([
-            f"{art['quantite']}× {art['nom']}" if art['quantite'] > 1 else art['nom']
-            for art in articles_propres
-        ])
-        
-        print(f"✅ Analyse réussie : {len(articles_propres)} article(s), {type_service}")
-        print(f"   Articles : {articles_str}")
-        print(f"   Adresse : {adresse if adresse else 'Aucune'}")
-        
-        return {
-            'type_appel': type_appel,
-            'type_service': type_service,
-            'articles': articles_str if articles_str else 'Non spécifié',
-            'adresse_livraison': adresse,
-            'prix_total': round(prix_total, 2),
-            'nombre_articles': len(articles_propres),
-            'notes': notes,
-            'articles_detailles': articles_propres
-        }
-        
-    except json.JSONDecodeError as e:
-        print(f"❌ Erreur parsing JSON : {e}")
-        print(f"   Réponse brute : {result_text}")
+            })
+    
+    # Prix unitaires vérifiés et total recalculé d'après le catalogue
+    articles_propres, prix_total, corrections = CATALOGUE.verifier_articles(articles_propres)
+    if corrections or abs(prix_total - prix_total_ia) >= 0.005:
+        evenement(logger, 'correction_prix', "💶 Prix corrigés d'après le catalogue",
+                  corrections=corrections, total_ia=prix_total_ia, total=prix_total)
+    
+    # Nettoyer l'adresse
+    if type_service == 'Livraison' and not adresse:
+        logger.info("⚠️ Livraison détectée mais pas d'adresse, tentative extraction manuelle")
+        adresse = extraire_adresse_manuel(transcript)
+    
+    # Formater la liste des articles pour affichage
+    articles_str = ', '.join([
+        f"{art['quantite']}× {art['nom']}" if art['quantite'] > 1 else art['nom']
+        for art in articles_propres
+    ])
+    
+    return {
+        'type_appel': type_appel,
+        'type_service': type_service,
+        'articles': articles_str if articles_str else 'Non spécifié',
+        'adresse_livraison': adresse,
+        'prix_total': round(prix_total, 2),
+        'nombre_articles': len(articles_propres),
+        'notes': notes,
+        'articles_detailles': articles_propres,
+        'tier': 'llm'
+    }
+
+
+def analyser_commande_avec_openai(transcript, on_champs=None):
+    """
+    Analyse la transcription avec OpenAI GPT-4o
+    
+    En mode streaming (OPENAI_STREAMING=1), on_champs(type_service, adresse)
+    est appelé dès que ces deux champs sont reçus, avant la fin de la réponse.
+    """
+    
+    try:
+        client = openai_client.client()
+        if client is None:
+            logger.warning("⚠️ OPENAI_API_KEY manquant - utilisation du fallback")
+            return analyser_commande_simple(transcript)
+    except Exception as e:
+        logger.error("❌ Erreur initialisation OpenAI: %s", e)
         return analyser_commande_simple(transcript)
+    
+    result_text = ''
+    try:
+        params = parametres_openai(transcript)
+        if OPENAI_STREAMING:
+            result_text = lire_reponse_en_flux(params, on_champs)
+        else:
+            response = openai_client.completion(**params)
+            result_text = response.choices[0].message.content.strip()
+        return interpreter_reponse(result_text, transcript)
     except Exception as e:
-        print(f"❌ Erreur OpenAI : {e}")
-        import traceback
-        traceback.print_exc()
+        return fallback_apres_erreur(e, result_text, transcript)
+
+
+async def analyser_commande_avec_openai_async(transcript, on_champs=None):
+    """Version non bloquante pour le mode ASGI (même prompt, même validation, même fallback)"""
+    try:
+        client = openai_client.client_async()
+        if client is None:
+            logger.warning("⚠️ OPENAI_API_KEY manquant - utilisation du fallback")
+            return analyser_commande_simple(transcript)
+    except Exception as e:
+        logger.error("❌ Erreur initialisation OpenAI: %s", e)
         return analyser_commande_simple(transcript)
+    
+    result_text = ''
+    try:
+        params = parametres_openai(transcript)
+        if OPENAI_STREAMING:
+            result_text = await lire_reponse_en_flux_async(params, on_champs)
+        else:
+            response = await openai_client.completion_async(**params)
+            result_text = response.choices[0].message.content.strip()
+        return interpreter_reponse(result_text, transcript)
+    except Exception as e:
+        return fallback_apres_erreur(e, result_text, transcript)
 
 
-def extraire_adresse_manuel(transcript):
-    """Extraction manuelle d'adresse si OpenAI échoue"""
-    transcript_lower = transcript.lower()
+def fallback_apres_erreur(e, result_text, transcript):
+    """Journalise l'erreur d'analyse GPT-4o et bascule sur l'analyse simple"""
+    if isinstance(e, DependanceIndisponible):
+        # Disjoncteur ouvert : pas d'attente, pas de trace d'erreur à chaque appel
+        logger.warning("⚡ OpenAI indisponible - analyse simple")
+    elif isinstance(e, json.JSONDecodeError):
+        logger.error("❌ Erreur parsing JSON : %s", e, extra={'reponse_brute': result_text})
+    else:
+        logger.exception("❌ Erreur OpenAI : %s", e)
+    return analyser_commande_simple(transcript)
+
+
+def lire_reponse_en_flux(params, on_champs=None):
+    """Lit la réponse en streaming et signale type_service/adresse_livraison dès qu'ils sont complets"""
+    extracteur = ExtracteurJSONIncremental()
+    signale = on_champs is None
     
-    # Patterns d'adresse
-    patterns = [
-        r'(\d+\s+(?:rue|avenue|boulevard|av|bd|place)\s+[^,\.]+(?:,\s*\w+)?)',
-        r'(au\s+\d+\s+[^,\.]+(?:,\s*\w+)?)',
-        r'(\d+\s+[^,\.]+(?:dreux|vernouillet|cherisy))',
-    ]
+    for morceau in openai_client.completion_stream(**params):
+        extracteur.ajouter(morceau)
+        if not signale and 'type_service' in extracteur.champs and 'adresse_livraison' in extracteur.champs:
+            signale = True
+            try:
+                on_champs(extracteur.champs['type_service'], extracteur.champs['adresse_livraison'])
+            except Exception as e:
+                logger.warning("⚠️ Erreur lancement anticipé : %s", e)
+    
+    return extracteur.texte.strip()
+
+
+async def lire_reponse_en_flux_async(params, on_champs=None):
+    """Version non bloquante de lire_reponse_en_flux()"""
+    extracteur = ExtracteurJSONIncremental()
+    signale = on_champs is None
     
-    for pattern in patterns:
-        match = re.search(pattern, transcript_lower, re.IGNORECASE)
-        if match:
-            adresse = match.group(1).strip()
-            # Ajouter Dreux si pas de ville
-            if 'dreux' not in adresse.lower() and 'vernouillet' not in adresse.lower():
-                adresse += ', Dreux'
-            return adresse
+    async for morceau in openai_client.completion_stream_async(**params):
+        extracteur.ajouter(morceau)
+        if not signale and 'type_service' in extracteur.champs and 'adresse_livraison' in extracteur.champs:
+            signale = True
+            try:
+                on_champs(extracteur.champs['type_service'], extracteur.champs['adresse_livraison'])
+            except Exception as e:
+                logger.warning("⚠️ Erreur lancement anticipé : %s", e)
     
-    return ''
+    return extracteur.texte.strip()
 
 
+@etape_chronometree('fallback')
 def analyser_commande_simple(transcript):
     """Fallback simple si OpenAI échoue"""
-    print("⚠️ Mode fallback activé")
+    logger.warning("⚠️ Mode fallback activé")
     
     transcript_lower = transcript.lower()
     
@@ -270,18 +292,16 @@ def analyser_commande_simple(transcript):
     articles = []
     prix_total = 0
     
-    # Détection simple des articles populaires
+    # Détection des produits du catalogue (une seule passe sur la transcription)
     items_detectes = []
-    if 'curry' in transcript_lower:
-        items_detectes.append(('Menu Curry', 8.90))
-    if 'mixte' in transcript_lower:
-        items_detectes.append(('Menu Mixte', 9.50))
-    if 'classic' in transcript_lower:
-        items_detectes.append(('Menu Classic', 8.90))
-    if 'wings' in transcript_lower or 'wing' in transcript_lower:
-        items_detectes.append(('Wings x6', 4.90))
-    if 'tenders' in transcript_lower or 'tender' in transcript_lower:
-        items_detectes.append(('Tenders x7', 6.90))
+    produits_vus = set()
+    for _, _, produit in CATALOGUE.detecter(transcript):
+        if produit.cle in produits_vus:
+            continue
+        produits_vus.add(produit.cle)
+        formule = produit.formule_defaut
+        taille = produit.taille_defaut(formule)
+        items_detectes.append((produit.nom_article(formule, taille), produit.prix(formule, taille)))
     
     # Si aucun article détecté
     if not items_detectes:
@@ -301,26 +321,47 @@ def analyser_commande_simple(transcript):
         'prix_total': round(prix_total, 2),
         'nombre_articles': len(articles),
         'notes': 'Analyse simple (OpenAI indisponible)',
-        'articles_detailles': articles
+        'articles_detailles': articles,
+        'tier': 'fallback'
     }
 
 
-def analyser_commande(transcript):
+def analyser_commande(transcript, on_champs=None):
     """Point d'entrée principal"""
-    print(f"\n{'='*60}")
-    print(f"📝 ANALYSE DE COMMANDE")
-    print(f"{'='*60}")
-    print(f"Transcription : {transcript[:100]}...")
-    
-    result = analyser_commande_avec_openai(transcript)
+    # Niveau 1 : analyse déterministe, GPT-4o seulement si la confiance est insuffisante
+    with Chronometre('quick_parse'):
+        rapide, confiance, raisons = analyser_commande_rapide(transcript)
+    if confiance >= SEUIL_CONFIANCE:
+        result = rapide
+    else:
+        result = analyser_commande_avec_openai(transcript, on_champs)
+    return enregistrer_routage(result, confiance, raisons)
+
+
+async def analyser_commande_async(transcript, on_champs=None):
+    """Point d'entrée du mode ASGI : l'attente de GPT-4o ne bloque pas la boucle d'événements"""
+    with Chronometre('quick_parse'):
+        rapide, confiance, raisons = analyser_commande_rapide(transcript)
+    if confiance >= SEUIL_CONFIANCE:
+        result = rapide
+    else:
+        result = await analyser_commande_avec_openai_async(transcript, on_champs)
+    return enregistrer_routage(result, confiance, raisons)
+
+
+def enregistrer_routage(result, confiance, raisons):
+    """Compte le niveau d'analyse utilisé et l'ajoute au résultat"""
+    routage.enregistrer(result['tier'], confiance, raisons)
+    analyses.inc(result['tier'])
+    result['routage'] = {'tier': result['tier'], 'confiance': confiance, 'raisons': raisons}
     
-    print(f"\n{'='*60}")
-    print(f"📊 RÉSULTAT ANALYSE")
-    print(f"{'='*60}")
-    print(f"Type : {result['type_service']}")
-    print(f"Articles : {result['articles']}")
-    print(f"Prix : {result['prix_total']}€")
-    print(f"Adresse : {result['adresse_livraison']}")
-    print(f"{'='*60}\n")
+    evenement(logger, 'analyse', "📊 Commande analysée", niveau_analyse=result['tier'],
+              confiance=round(confiance, 2), raisons=raisons, type_service=result['type_service'],
+              articles=result['articles'], prix=result['prix_total'], adresse=result['adresse_livraison'])
     
     return result
+
+
+def statistiques_routage():
+    """Répartition des analyses par niveau (rapide / llm / fallback)"""
+    return routage.stats(SEUIL_CONFIANCE)
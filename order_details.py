@@ -0,0 +1,121 @@
+"""
+Séparation des champs lourds des commandes (résumé / détails)
+
+Le nœud `orders` ne contient que le résumé affiché par les écrans de cuisine
+et lu par le flux SSE, l'API et l'archivage. La transcription, l'adresse
+complète renvoyée par le géocodage et les informations d'analyse sont écrites
+dans `order_details/<order_id>`, dans le même update() multi-chemins, et lues
+seulement quand une carte est dépliée (GET /api/orders/<id>/details).
+L'archivage déplace les détails avec la commande, vers
+`order_details_archive/AAAA-MM-JJ/<order_id>`.
+
+Usage en ligne de commande :
+    python order_details.py mesurer          # taille d'un rafraîchissement avant/après
+    python order_details.py migrer [--dry-run]
+"""
+
+import json
+import sys
+
+from firebase_setup import db
+
+DETAILS_NODE = 'order_details'
+DETAILS_ARCHIVE_NODE = 'order_details_archive'
+
+# Champs déplacés hors du résumé
+CHAMPS_DETAILS = ('transcript', 'formatted_address', 'address_verified', 'type_appel', 'analysis_tier')
+
+
+def separer_commande(commande):
+    """Retourne (résumé, détails) d'une commande complète"""
+    resume = {k: v for k, v in commande.items() if k not in CHAMPS_DETAILS}
+    details = {k: commande[k] for k in CHAMPS_DETAILS if k in commande}
+    if details:
+        resume['has_details'] = True
+    return resume, details
+
+
+def chemins_commande(order_id, commande):
+    """Chemins de l'update() multi-chemins qui enregistre une commande (résumé + détails)"""
+    resume, details = separer_commande(commande)
+    updates = {f'orders/{order_id}': resume}
+    if details:
+        updates[f'{DETAILS_NODE}/{order_id}'] = details
+    return updates
+
+
+def lire_details(order_id):
+    """Détails d'une commande ; pour une commande pas encore migrée, les champs du document complet"""
+    details = db.reference(f'{DETAILS_NODE}/{order_id}').get()
+    if details:
+        return details
+    commande = db.reference(f'orders/{order_id}').get()
+    if isinstance(commande, dict):
+        return separer_commande(commande)[1]
+    # Commande archivée (import local : archive importe ce module)
+    from archive import jour_commande
+    return db.reference(f'{DETAILS_ARCHIVE_NODE}/{jour_commande(order_id)}/{order_id}').get()
+
+
+def taille_json(donnees):
+    """Taille en octets de la réponse JSON telle que téléchargée par un écran"""
+    return len(json.dumps(donnees, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def mesurer(commandes):
+    """Taille d'un rafraîchissement complet du tableau de bord, avant et après séparation"""
+    resumes = {
+        order_id: separer_commande(commande)[0]
+        for order_id, commande in commandes.items() if isinstance(commande, dict)
+    }
+    avant, apres = taille_json(commandes), taille_json(resumes)
+    return {
+        'commandes': len(commandes),
+        'octets_avant': avant,
+        'octets_apres': apres,
+        'reduction': round(1 - apres / avant, 3) if avant else 0.0
+    }
+
+
+def migrer(dry_run=False, taille_lot=200):
+    """Déplace les champs lourds des commandes existantes vers order_details, par lots"""
+    commandes = db.reference('orders').get() or {}
+    mesure = mesurer(commandes)
+
+    a_migrer = {
+        order_id: commande for order_id, commande in commandes.items()
+        if isinstance(commande, dict) and any(k in commande for k in CHAMPS_DETAILS)
+    }
+    print(f"📏 {mesure['commandes']} commandes : {mesure['octets_avant']} → {mesure['octets_apres']} octets "
+          f"par rafraîchissement (-{mesure['reduction']:.0%})")
+    print(f"🔀 {len(a_migrer)} commande(s) à migrer{' (simulation)' if dry_run else ''}")
+
+    if not dry_run:
+        ids = list(a_migrer)
+        for i in range(0, len(ids), taille_lot):
+            updates = {}
+            for order_id in ids[i:i + taille_lot]:
+                _, details = separer_commande(a_migrer[order_id])
+                updates[f'{DETAILS_NODE}/{order_id}'] = details
+                # Suppression champ par champ : une mise à jour concurrente du statut n'est pas écrasée
+                for champ in details:
+                    updates[f'orders/{order_id}/{champ}'] = None
+                updates[f'orders/{order_id}/has_details'] = True
+            db.reference().update(updates)
+        print("✅ Migration terminée")
+
+    return dict(mesure, migrees=0 if dry_run else len(a_migrer))
+
+
+if __name__ == '__main__':
+    from firebase_setup import initialiser_firebase
+    initialiser_firebase()
+
+    commande = sys.argv[1] if len(sys.argv) > 1 else 'mesurer'
+    if commande == 'migrer':
+        migrer(dry_run='--dry-run' in sys.argv)
+    elif commande == 'mesurer':
+        print(json.dumps(mesurer(db.reference('orders').get() or {}), indent=2))
+    else:
+        print(__doc__)
+        sys.exit(1)
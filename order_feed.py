@@ -0,0 +1,203 @@
+"""
+Flux des commandes pour les écrans de cuisine (Server-Sent Events)
+
+Le journal est abonné à la réplique locale des commandes (un seul écouteur
+Firebase par processus) et garde les derniers changements. Chaque écran
+connecté à /orders/stream lit ce journal à partir de son curseur et ne
+reçoit que les commandes nouvelles ou modifiées, au lieu de retélécharger
+toutes les commandes toutes les 3 secondes.
+
+Le curseur est "<époque>:<numéro>" : l'époque change à chaque démarrage du
+processus. Un curseur d'une autre époque, ou trop ancien pour le journal,
+déclenche l'envoi d'un instantané complet.
+
+Servi par Flask (flux_sse), chaque écran occupe un thread gunicorn pendant
+toute la connexion : au-delà de FEED_MAX_CLIENTS écrans, la connexion est
+refusée (503) pour laisser des threads au webhook. En mode ASGI
+(flux_sse_async), le flux est une coroutine qui n'occupe aucun thread.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from replica import replique_commandes
+
+FEED_JOURNAL_SIZE = int(os.environ.get('FEED_JOURNAL_SIZE', 1000))
+FEED_KEEPALIVE = float(os.environ.get('FEED_KEEPALIVE', 15))
+# Durée max d'une connexion SSE : le navigateur se reconnecte avec Last-Event-ID
+FEED_MAX_DURATION = float(os.environ.get('FEED_MAX_DURATION', 300))
+# Écrans servis par des threads gunicorn (mode Flask) ; à garder bien en dessous de --threads
+FEED_MAX_CLIENTS = int(os.environ.get('FEED_MAX_CLIENTS', 4))
+# Délai avant qu'un écran refusé retente sa connexion (ms)
+FEED_RETRY_MS = int(os.environ.get('FEED_RETRY_MS', 10000))
+# Intervalle de lecture du journal en mode ASGI (s)
+FEED_POLL_INTERVAL = float(os.environ.get('FEED_POLL_INTERVAL', 0.5))
+
+INSTANTANE = 'snapshot'
+COMMANDE = 'order'
+SUPPRESSION = 'removed'
+
+
+class JournalCommandes:
+    """Copie en mémoire des commandes + journal des derniers changements, partagé par les clients"""
+
+    def __init__(self, replique=replique_commandes, taille=FEED_JOURNAL_SIZE):
+        self.epoque = uuid.uuid4().hex[:8]
+        self.replique = replique
+        self._condition = threading.Condition()
+        self._commandes = {}
+        self._journal = deque(maxlen=taille)
+        self._sequence = 0
+        self._pret = False
+        self._abonne = False
+        self._clients = 0
+        self._refus = 0
+
+    def demarrer(self):
+        """S'abonne à la réplique (une seule fois par processus)"""
+        with self._condition:
+            if self._abonne:
+                return
+            self._abonne = True
+        self.replique.abonner(self._sur_changements)
+        print(f"📡 Flux des commandes démarré (époque {self.epoque})")
+
+    def _sur_changements(self, changements):
+        """Callback de la réplique : [(order_id, commande ou None)]"""
+        with self._condition:
+            for order_id, commande in changements:
+                self._changer(order_id, commande)
+            self._pret = True
+            self._condition.notify_all()
+
+    def _changer(self, order_id, commande):
+        """Enregistre un changement dans la copie et dans le journal (verrou tenu)"""
+        if commande is None:
+            if self._commandes.pop(order_id, None) is None:
+                return
+        else:
+            self._commandes[order_id] = commande
+        self._sequence += 1
+        self._journal.append((self._sequence, order_id, commande))
+
+    def curseur(self, sequence):
+        return f"{self.epoque}:{sequence}"
+
+    def _lire_curseur(self, curseur):
+        """Numéro de séquence du curseur, ou None s'il ne vient pas de ce processus"""
+        if not curseur or ':' not in curseur:
+            return None
+        epoque, _, sequence = curseur.partition(':')
+        if epoque != self.epoque or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def evenements(self, curseur, timeout=FEED_KEEPALIVE):
+        """
+        Événements postérieurs au curseur : [(type, curseur, données)].
+        Attend au plus `timeout` secondes qu'il y en ait ; liste vide sinon.
+        """
+        depuis = self._lire_curseur(curseur)
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._pret and (depuis is None or self._sequence > depuis),
+                timeout=timeout
+            )
+            if not self._pret:
+                return []
+
+            plus_ancien = self._journal[0][0] if self._journal else self._sequence + 1
+            if depuis is None or depuis > self._sequence or depuis < plus_ancien - 1:
+                # Curseur inconnu ou sorti du journal : instantané complet
+                return [(INSTANTANE, self.curseur(self._sequence), {'orders': dict(self._commandes)})]
+
+            return [
+                (COMMANDE if commande is not None else SUPPRESSION,
+                 self.curseur(sequence),
+                 {'id': order_id, 'order': commande} if commande is not None else {'id': order_id})
+                for sequence, order_id, commande in self._journal
+                if sequence > depuis
+            ]
+
+    def connexion(self, delta):
+        with self._condition:
+            self._clients += delta
+
+    def reserver(self, maximum):
+        """Compte un client de plus s'il reste de la place ; False sinon"""
+        with self._condition:
+            if self._clients >= maximum:
+                self._refus += 1
+                return False
+            self._clients += 1
+            return True
+
+    def stats(self):
+        with self._condition:
+            return {
+                'epoque': self.epoque,
+                'actif': self._abonne,
+                'clients': self._clients,
+                'refus': self._refus,
+                'commandes': len(self._commandes),
+                'sequence': self._sequence,
+                'journal': len(self._journal)
+            }
+
+
+journal_commandes = JournalCommandes()
+
+
+def formater_sse(type_evenement, curseur, donnees):
+    """Un événement au format text/event-stream"""
+    return f"id: {curseur}\nevent: {type_evenement}\ndata: {json.dumps(donnees, ensure_ascii=False)}\n\n"
+
+
+def refus_sse():
+    """Corps de la réponse 503 quand tous les emplacements d'écran sont pris"""
+    return f"retry: {FEED_RETRY_MS}\n\n"
+
+
+def flux_sse(curseur, journal=journal_commandes):
+    """
+    Générateur de la réponse /orders/stream à partir du curseur du client.
+    L'appelant a déjà compté le client (journal.reserver) et le décompte à la fermeture.
+    """
+    journal.demarrer()
+    fin = time.monotonic() + FEED_MAX_DURATION
+    yield "retry: 3000\n\n"
+    while time.monotonic() < fin:
+        evenements = journal.evenements(curseur)
+        if not evenements:
+            # Commentaire SSE : garde la connexion ouverte à travers les proxys
+            yield ": keepalive\n\n"
+            continue
+        for type_evenement, curseur, donnees in evenements:
+            yield formater_sse(type_evenement, curseur, donnees)
+
+
+async def flux_sse_async(curseur, journal=journal_commandes):
+    """Même flux en mode ASGI : lit le journal sans attendre sous verrou, donc sans thread"""
+    journal.demarrer()
+    journal.connexion(1)
+    fin = time.monotonic() + FEED_MAX_DURATION
+    try:
+        yield "retry: 3000\n\n"
+        dernier_envoi = time.monotonic()
+        while time.monotonic() < fin:
+            evenements = journal.evenements(curseur, timeout=0)
+            for type_evenement, curseur, donnees in evenements:
+                yield formater_sse(type_evenement, curseur, donnees)
+            if evenements:
+                dernier_envoi = time.monotonic()
+            elif time.monotonic() - dernier_envoi >= FEED_KEEPALIVE:
+                yield ": keepalive\n\n"
+                dernier_envoi = time.monotonic()
+            await asyncio.sleep(FEED_POLL_INTERVAL)
+    finally:
+        journal.connexion(-1)
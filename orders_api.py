@@ -0,0 +1,151 @@
+"""
+Lecture paginée des commandes par fenêtre de temps (GET /api/orders)
+
+Les clés des commandes sont des identifiants push : leurs 8 premiers
+caractères encodent l'instant de création. Une fenêtre de temps devient donc
+une requête Firebase par intervalle de clés (order_by_key + start_at/end_at),
+et le volume lu dépend du service en cours, pas de tout l'historique.
+Le filtre de statut est appliqué ensuite, page par page : « reste-t-il des
+commandes » n'est vrai que si une commande retenue suit la page.
+
+Quand la réplique locale couvre la fenêtre demandée, la page est lue en
+mémoire, sans requête Firebase.
+"""
+
+import os
+import re
+import time
+from datetime import datetime
+
+from firebase_setup import db
+
+from push_ids import borne_id_push, PUSH_CHARS
+
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 200))
+RESTAURANT_TZ = os.environ.get('RESTAURANT_TZ', 'Europe/Paris')
+
+_DUREE = re.compile(r'^(\d+)\s*(m|min|h|d|j)$')
+_UNITES_MS = {'m': 60_000, 'min': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'j': 86_400_000}
+
+
+def fuseau_restaurant():
+    """Fuseau horaire du restaurant (None si la base tz est absente)"""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(RESTAURANT_TZ)
+    except Exception:
+        # Pas de base tz dans l'image : heure locale du conteneur
+        return None
+
+
+def _debut_du_jour(now_ms):
+    fuseau = fuseau_restaurant()
+    maintenant = datetime.fromtimestamp(now_ms / 1000, tz=fuseau)
+    minuit = maintenant.replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(minuit.timestamp() * 1000)
+
+
+def _lire_instant(valeur):
+    """Instant ISO 8601 ("2024-05-01T18:00") ou en ms depuis l'epoch"""
+    if valeur.isdigit():
+        return int(valeur)
+    instant = datetime.fromisoformat(valeur)
+    if instant.tzinfo is None and fuseau_restaurant() is not None:
+        instant = instant.replace(tzinfo=fuseau_restaurant())
+    return int(instant.timestamp() * 1000)
+
+
+def lire_fenetre(fenetre=None, depuis=None, jusqua=None, now_ms=None):
+    """
+    Bornes (début, fin) en ms d'une fenêtre : "today", "yesterday", "2h", "30m", "7d",
+    ou since/until explicites. Lève ValueError si la fenêtre est invalide.
+    """
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+
+    fin = _lire_instant(jusqua) if jusqua else now_ms
+    if depuis:
+        debut = _lire_instant(depuis)
+    else:
+        fenetre = (fenetre or 'today').strip().lower()
+        if fenetre in ('today', 'aujourdhui'):
+            debut = _debut_du_jour(now_ms)
+        elif fenetre in ('yesterday', 'hier'):
+            fin = _debut_du_jour(now_ms)
+            debut = _debut_du_jour(fin - 1)
+        else:
+            m = _DUREE.match(fenetre)
+            if not m:
+                raise ValueError(f"Fenêtre invalide: {fenetre}")
+            debut = fin - int(m.group(1)) * _UNITES_MS[m.group(2)]
+
+    if debut > fin:
+        raise ValueError("Début de fenêtre après la fin")
+    return debut, fin
+
+
+def lire_commandes(debut_ms, fin_ms, statuts=None, curseur=None, limite=API_PAGE_SIZE, replique=None):
+    """
+    Commandes créées entre debut_ms et fin_ms, par ordre chronologique, après le curseur.
+    Retourne (commandes avec leur 'id', curseur de la dernière clé lue, reste-t-il des commandes).
+    """
+    limite = max(1, min(limite, API_MAX_PAGE_SIZE))
+    # Toutes les clés de la dernière milliseconde sont incluses
+    cle_fin = borne_id_push(fin_ms)[:8] + PUSH_CHARS[-1] * 12
+    depart = borne_id_push(debut_ms)
+    if curseur:
+        if len(curseur) != 20 or any(c not in PUSH_CHARS for c in curseur):
+            raise ValueError(f"Curseur invalide: {curseur}")
+        depart = max(depart, curseur)
+
+    if replique is not None and replique.couvre(depart):
+        return _page(replique.intervalle(depart, cle_fin), statuts, curseur, limite)
+
+    commandes = []
+    dernier = curseur
+    while True:
+        lot = db.reference('orders').order_by_key().start_at(depart).end_at(cle_fin) \
+            .limit_to_first(limite + 1).get() or {}
+        cles = [cle for cle in lot if cle != curseur]
+
+        for cle in cles:
+            curseur = cle
+            if not _retenue(lot[cle], statuts):
+                continue
+            if len(commandes) == limite:
+                # Une commande retenue après la page pleine : il en reste
+                return commandes, dernier, True
+            commandes.append(dict(lot[cle], id=cle))
+            dernier = cle
+
+        if len(lot) <= limite:
+            # Fin de la fenêtre atteinte
+            return commandes, curseur, False
+
+        # Page incomplète, ou pleine sans savoir s'il en reste : on continue après la dernière clé lue
+        depart = curseur
+
+
+def _retenue(commande, statuts):
+    """La commande passe-t-elle le filtre de statut"""
+    if not isinstance(commande, dict):
+        return False
+    return not statuts or commande.get('status', 'pending') in statuts
+
+
+def _page(lignes, statuts, curseur, limite):
+    """Même pagination que lire_commandes, sur des (clé, commande) déjà triées"""
+    commandes = []
+    dernier = curseur
+    for cle, commande in lignes:
+        if cle == curseur:
+            continue
+        curseur = cle
+        if not _retenue(commande, statuts):
+            continue
+        if len(commandes) == limite:
+            return commandes, dernier, True
+        commandes.append(dict(commande, id=cle))
+        dernier = cle
+    return commandes, curseur, False
@@ -0,0 +1,243 @@
+"""
+Boîte d'envoi durable (SQLite) pour les écritures Firebase des commandes
+
+Le webhook enregistre d'abord la commande dans SQLite (quelques ms, local),
+puis un thread d'envoi regroupe les commandes en attente, leurs entrées
+d'index et leurs compteurs en un seul update() multi-chemins. Une panne ou un
+ralentissement de Firebase ne bloque plus les threads du webhook et ne fait
+plus perdre une commande déjà analysée (et déjà payée à OpenAI) : l'envoi est
+repris avec un délai exponentiel jusqu'à ce qu'il réussisse.
+
+Si Firebase refuse un lot comme invalide, ses entrées sont renvoyées une par
+une : seule l'écriture fautive reste en attente, le reste du lot part.
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from firebase_setup import db
+
+from logging_setup import obtenir_logger, evenement
+from metrics import Chronometre
+
+logger = obtenir_logger('outbox')
+
+OUTBOX_PATH = os.environ.get('OUTBOX_PATH', '/tmp/chicken_outbox.sqlite3')
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+# Délai de regroupement : les commandes arrivées pendant ce délai partent ensemble
+OUTBOX_FLUSH_DELAY = float(os.environ.get('OUTBOX_FLUSH_DELAY', 0.05))
+OUTBOX_RETRY_DELAY = float(os.environ.get('OUTBOX_RETRY_DELAY', 1.0))
+OUTBOX_MAX_BACKOFF = float(os.environ.get('OUTBOX_MAX_BACKOFF', 60.0))
+# Une entrée "en envoi" depuis plus longtemps est reprise (processus arrêté en plein envoi)
+OUTBOX_CLAIM_TIMEOUT = float(os.environ.get('OUTBOX_CLAIM_TIMEOUT', 60.0))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cle TEXT UNIQUE,
+    updates TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    isolated INTEGER NOT NULL DEFAULT 0,
+    next_try_at REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (status, next_try_at);
+"""
+
+
+def _est_increment(valeur):
+    return isinstance(valeur, dict) and set(valeur) == {'.sv'} and 'increment' in (valeur['.sv'] or {})
+
+
+def erreur_permanente(e):
+    """Écriture refusée par Firebase (réessayer le même lot ne servira à rien)"""
+    return getattr(e, 'code', None) == 'INVALID_ARGUMENT' or isinstance(e, (TypeError, ValueError))
+
+
+def fusionner_updates(liste):
+    """Fusionne plusieurs update() multi-chemins en un seul (les incréments d'un même chemin s'additionnent)"""
+    fusion = {}
+    for updates in liste:
+        for chemin, valeur in updates.items():
+            if chemin in fusion and _est_increment(fusion[chemin]) and _est_increment(valeur):
+                total = fusion[chemin]['.sv']['increment'] + valeur['.sv']['increment']
+                fusion[chemin] = {'.sv': {'increment': total}}
+            else:
+                fusion[chemin] = valeur
+    return fusion
+
+
+class BoiteEnvoi:
+    """Écritures Firebase en attente, persistées dans SQLite et envoyées par lots"""
+
+    def __init__(self, path=OUTBOX_PATH, envoyer=None):
+        self.path = path
+        self._envoyer = envoyer or (lambda updates: db.reference().update(updates))
+        self._id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._nouveau = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Une commande confirmée au webhook doit survivre à un arrêt brutal
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(SCHEMA)
+        self._thread = None
+        self._stop = threading.Event()
+        self._envoyees = 0
+        self._lots = 0
+        self._echecs = 0
+        self._dernier_envoi_ms = None
+        self._derniere_erreur = None
+
+    def ajouter(self, updates, cle=None):
+        """Enregistre un update() multi-chemins à envoyer ; idempotent par clé (ex. order_id)"""
+        now = time.time()
+        with self._nouveau:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (cle, updates, status, next_try_at, created_at) "
+                "VALUES (?, ?, 'pending', ?, ?)",
+                (cle, json.dumps(updates), now, now)
+            )
+            self._nouveau.notify()
+
+    def _reserver(self):
+        """Réserve le prochain lot prêt : plusieurs entrées, ou une seule entrée isolée"""
+        now = time.time()
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+                (now - OUTBOX_CLAIM_TIMEOUT,)
+            )
+            rows = self._conn.execute(
+                "SELECT * FROM outbox WHERE status = 'pending' AND next_try_at <= ? "
+                "ORDER BY id LIMIT ?", (now, OUTBOX_BATCH_SIZE)
+            ).fetchall()
+            if rows and rows[0]['isolated']:
+                rows = rows[:1]
+            else:
+                rows = [r for r in rows if not r['isolated']]
+            if rows:
+                self._conn.execute(
+                    f"UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ? "
+                    f"WHERE id IN ({','.join('?' * len(rows))})",
+                    (self._id, now, *[r['id'] for r in rows])
+                )
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        return rows
+
+    def vider(self):
+        """Envoie un lot ; retourne le nombre d'entrées envoyées (0 si rien à faire ou échec)"""
+        with self._lock:
+            rows = self._reserver()
+        if not rows:
+            return 0
+
+        ids = [r['id'] for r in rows]
+        marques = ','.join('?' * len(ids))
+        debut = time.perf_counter()
+        try:
+            with Chronometre('firebase_push'):
+                self._envoyer(fusionner_updates(json.loads(r['updates']) for r in rows))
+        except Exception as e:
+            now = time.time()
+            with self._lock:
+                self._echecs += 1
+                self._derniere_erreur = str(e)
+                if len(rows) > 1 and erreur_permanente(e):
+                    # Lot refusé : chaque entrée est renvoyée seule, tout de suite
+                    self._conn.execute(
+                        f"UPDATE outbox SET status = 'pending', isolated = 1, claimed_by = NULL "
+                        f"WHERE id IN ({marques})", ids
+                    )
+                    evenement(logger, 'outbox_lot_refuse', "⚠️ Lot refusé par Firebase, renvoi entrée par entrée",
+                              niveau=logging.WARNING, ecritures=len(rows), erreur=str(e))
+                    return 0
+                for r in rows:
+                    delai = min(OUTBOX_MAX_BACKOFF, OUTBOX_RETRY_DELAY * (2 ** r['attempts']))
+                    self._conn.execute(
+                        "UPDATE outbox SET status = 'pending', attempts = attempts + 1, next_try_at = ?, "
+                        "error = ?, claimed_by = NULL WHERE id = ?",
+                        (now + delai, str(e), r['id'])
+                    )
+            evenement(logger, 'outbox_echec', "⚠️ Envoi Firebase échoué, nouvel essai plus tard",
+                      niveau=logging.WARNING, ecritures=len(rows), erreur=str(e))
+            return 0
+
+        with self._lock:
+            self._conn.execute(f"DELETE FROM outbox WHERE id IN ({marques})", ids)
+            self._envoyees += len(rows)
+            self._lots += 1
+            self._dernier_envoi_ms = round((time.perf_counter() - debut) * 1000, 1)
+        return len(rows)
+
+    def demarrer(self):
+        """Lance le thread d'envoi (une seule fois) et la dernière tentative à l'arrêt du processus"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._boucle, name='outbox', daemon=True)
+        self._thread.start()
+        atexit.register(self._vider_a_l_arret)
+        print(f"📤 Boîte d'envoi Firebase démarrée ({self.path}, {self.compter().get('pending', 0)} en attente)")
+
+    def _vider_a_l_arret(self):
+        self._stop.set()
+        try:
+            while self.vider():
+                pass
+        except Exception:
+            pass
+
+    def _boucle(self):
+        while not self._stop.is_set():
+            try:
+                if self.vider():
+                    continue
+            except Exception:
+                logger.exception("❌ Erreur boîte d'envoi", extra={'etape': 'outbox_erreur'})
+            with self._nouveau:
+                self._nouveau.wait(self._prochaine_attente())
+            # Laisse arriver les commandes simultanées pour les envoyer dans le même lot
+            time.sleep(OUTBOX_FLUSH_DELAY)
+
+    def _prochaine_attente(self):
+        """Secondes avant la prochaine entrée prête (verrou tenu)"""
+        row = self._conn.execute(
+            "SELECT MIN(next_try_at) AS t FROM outbox WHERE status = 'pending'"
+        ).fetchone()
+        if row['t'] is None:
+            return 1.0
+        return min(1.0, max(0.0, row['t'] - time.time()))
+
+    def compter(self):
+        """Nombre d'entrées par état"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def stats(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(created_at) AS t FROM outbox").fetchone()
+            return {
+                'en_attente': self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0],
+                'plus_ancienne_s': round(time.time() - row['t'], 1) if row['t'] else 0.0,
+                'envoyees': self._envoyees,
+                'lots': self._lots,
+                'echecs': self._echecs,
+                'dernier_envoi_ms': self._dernier_envoi_ms,
+                'derniere_erreur': self._derniere_erreur
+            }
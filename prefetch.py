@@ -0,0 +1,172 @@
+"""
+Géocodage lancé en avance, pendant que l'analyse de la commande continue
+
+Le géocodage d'une adresse démarre dans un pool de threads dès qu'elle est
+connue : adresse trouvée par les regex avant même l'appel à GPT-4o
+(spéculatif), ou "adresse_livraison" reçue en streaming. À la fin de
+l'analyse, le résultat est réutilisé si l'adresse finale a la même forme
+normalisée ; sinon les géocodages anticipés sont annulés et l'adresse finale
+est géocodée normalement. Une requête Nominatim anticipée encore en file est
+alors abandonnée (abandonner) : elle ne consomme pas le débit autorisé.
+
+GeocodageAnticipeAsync fait la même chose avec des tâches asyncio (mode ASGI).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from addresses import normaliser_adresse
+from logging_setup import obtenir_logger
+from nominatim import Abonnement
+
+GEOCODE_PREFETCH_WORKERS = int(os.environ.get('GEOCODE_PREFETCH_WORKERS', 8))
+
+_executor = ThreadPoolExecutor(max_workers=GEOCODE_PREFETCH_WORKERS, thread_name_prefix='geocode')
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+logger = obtenir_logger('prefetch')
+
+
+def _compter(evenement):
+    with _stats_lock:
+        _stats[evenement] += 1
+
+
+def statistiques_anticipation():
+    """Géocodages anticipés lancés / réutilisés / perdus, par origine"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class GeocodageAnticipe:
+    """Géocodages lancés en avance pour une commande, indexés par adresse normalisée"""
+
+    def __init__(self, geocoder, abandonner=None):
+        # geocoder(adresse, origine, abonnement) ; abandonner(abonnement) retire la requête de la file Nominatim
+        self.geocoder = geocoder
+        self.abandonner = abandonner
+        self._lock = threading.Lock()
+        self._futures = {}
+        # Mesures du dernier appel à resultat() (affichées dans les temps d'étapes)
+        self.mesure = {}
+
+    def lancer(self, adresse, origine):
+        """Démarre le géocodage de l'adresse en arrière-plan (une seule fois par adresse)"""
+        cle = normaliser_adresse(adresse)
+        if not cle:
+            return
+        with self._lock:
+            if cle in self._futures:
+                return
+            abonnement = Abonnement()
+            self._futures[cle] = (_executor.submit(self._chronometrer, adresse, origine, abonnement), origine, abonnement)
+        _compter(f'lances_{origine}')
+        logger.debug("🚀 Géocodage anticipé lancé (%s) : %s", origine, adresse)
+
+    def _chronometrer(self, adresse, origine, abonnement=None):
+        debut = time.perf_counter()
+        resultat = self.geocoder(adresse, origine, abonnement)
+        return resultat, (time.perf_counter() - debut) * 1000
+
+    def resultat(self, adresse):
+        """Résultat pour l'adresse finale : réutilise un géocodage anticipé identique, sinon géocode"""
+        cle = normaliser_adresse(adresse)
+        with self._lock:
+            entree = self._futures.pop(cle, None)
+        self.annuler()
+
+        debut = time.perf_counter()
+        if entree is not None:
+            future, origine, _ = entree
+            resultat, geocodage_ms = future.result()
+            _compter(f'reutilises_{origine}')
+            logger.debug("♻️ Géocodage anticipé réutilisé (%s)", origine)
+        else:
+            origine = 'direct'
+            resultat, geocodage_ms = self._chronometrer(adresse, origine)
+        attente_ms = (time.perf_counter() - debut) * 1000
+
+        # Temps de géocodage caché derrière l'analyse
+        self.mesure = {
+            'origine': origine,
+            'geocodage_ms': round(geocodage_ms, 1),
+            'attente_ms': round(attente_ms, 1),
+            'gain_ms': round(max(0.0, geocodage_ms - attente_ms), 1)
+        }
+        return resultat
+
+    def annuler(self):
+        """Abandonne les géocodages anticipés non utilisés (annulés s'ils n'ont pas démarré, retirés de la file Nominatim sinon)"""
+        with self._lock:
+            restants = list(self._futures.values())
+            self._futures.clear()
+        for future, origine, abonnement in restants:
+            future.cancel()
+            if self.abandonner is not None:
+                self.abandonner(abonnement)
+            _compter(f'perdus_{origine}')
+
+
+class GeocodageAnticipeAsync:
+    """Même principe en mode ASGI : géocodages anticipés sous forme de tâches asyncio"""
+
+    def __init__(self, geocoder, abandonner=None):
+        # geocoder : fonction async (adresse, origine, abonnement) -> résultat
+        self.geocoder = geocoder
+        self.abandonner = abandonner
+        self._taches = {}
+        self.mesure = {}
+
+    def lancer(self, adresse, origine):
+        """Démarre le géocodage dans la boucle courante (une seule fois par adresse)"""
+        cle = normaliser_adresse(adresse)
+        if not cle or cle in self._taches:
+            return
+        abonnement = Abonnement()
+        self._taches[cle] = (asyncio.ensure_future(self._chronometrer(adresse, origine, abonnement)), origine, abonnement)
+        _compter(f'lances_{origine}')
+        logger.debug("🚀 Géocodage anticipé lancé (%s) : %s", origine, adresse)
+
+    async def _chronometrer(self, adresse, origine, abonnement=None):
+        debut = time.perf_counter()
+        resultat = await self.geocoder(adresse, origine, abonnement)
+        return resultat, (time.perf_counter() - debut) * 1000
+
+    async def resultat(self, adresse):
+        """Résultat pour l'adresse finale : réutilise un géocodage anticipé identique, sinon géocode"""
+        entree = self._taches.pop(normaliser_adresse(adresse), None)
+        self.annuler()
+
+        debut = time.perf_counter()
+        if entree is not None:
+            tache, origine, _ = entree
+            resultat, geocodage_ms = await tache
+            _compter(f'reutilises_{origine}')
+            logger.debug("♻️ Géocodage anticipé réutilisé (%s)", origine)
+        else:
+            origine = 'direct'
+            resultat, geocodage_ms = await self._chronometrer(adresse, origine)
+        attente_ms = (time.perf_counter() - debut) * 1000
+
+        self.mesure = {
+            'origine': origine,
+            'geocodage_ms': round(geocodage_ms, 1),
+            'attente_ms': round(attente_ms, 1),
+            'gain_ms': round(max(0.0, geocodage_ms - attente_ms), 1)
+        }
+        return resultat
+
+    def annuler(self):
+        """Abandonne les géocodages anticipés non utilisés"""
+        restants = list(self._taches.values())
+        self._taches.clear()
+        for tache, origine, abonnement in restants:
+            tache.cancel()
+            if self.abandonner is not None:
+                self.abandonner(abonnement)
+            _compter(f'perdus_{origine}')
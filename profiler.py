@@ -0,0 +1,165 @@
+"""
+Profileur par échantillonnage, activable à chaud sur le service en production
+
+Un thread relève toutes les `intervalle_ms` la pile de chaque thread
+(sys._current_frames) et compte les piles identiques. Deux modes :
+- fenêtre : tous les threads du processus pendant `duree_s` secondes
+- requêtes : seulement les threads qui traitent une requête webhook sur N,
+  pendant `duree_s` secondes au plus
+
+Le résultat est au format "piles repliées" (une ligne `a;b;c nombre` par
+pile), lu directement par flamegraph.pl, speedscope ou inferno. Le coût est
+nul quand le profileur est arrêté ; pendant une session, il est
+proportionnel au nombre de threads et à la fréquence d'échantillonnage.
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 10))
+PROFILE_MAX_DURATION = float(os.environ.get('PROFILE_MAX_DURATION', 300))
+# Nombre max de piles distinctes gardées (les suivantes sont comptées dans "autres")
+PROFILE_MAX_STACKS = int(os.environ.get('PROFILE_MAX_STACKS', 20000))
+
+
+def _nom_cadre(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def pile_repliee(frame, racine):
+    """Pile d'un thread, de la racine vers le cadre courant, séparée par des ';'"""
+    cadres = []
+    while frame is not None:
+        cadres.append(_nom_cadre(frame))
+        frame = frame.f_back
+    cadres.append(racine)
+    return ';'.join(reversed(cadres))
+
+
+class ProfileurEchantillons:
+    """Une session de profilage à la fois, démarrée et lue via les routes d'administration"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._piles = Counter()
+        self._suivis = set()
+        self._compteur_requetes = itertools.count()
+        self._thread = None
+        self._stop = threading.Event()
+        self._session = None
+
+    @property
+    def actif(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def demarrer(self, duree_s=60, intervalle_ms=PROFILE_INTERVAL_MS, une_sur=None):
+        """
+        Lance une session ; une_sur=N limite l'échantillonnage à une requête webhook sur N.
+        Retourne False si une session est déjà en cours.
+        """
+        with self._lock:
+            if self.actif:
+                return False
+            duree_s = min(max(1.0, float(duree_s)), PROFILE_MAX_DURATION)
+            self._piles = Counter()
+            self._suivis = set()
+            self._compteur_requetes = itertools.count()
+            self._stop = threading.Event()
+            self._session = {
+                'mode': 'requetes' if une_sur else 'fenetre',
+                'une_sur': int(une_sur) if une_sur else None,
+                'intervalle_ms': max(1.0, float(intervalle_ms)),
+                'duree_s': duree_s,
+                'debut': time.time(),
+                'fin': None,
+                'echantillons': 0,
+                'requetes_suivies': 0
+            }
+            self._thread = threading.Thread(target=self._boucle, name='profiler', daemon=True)
+            self._thread.start()
+        print(f"🔬 Profilage démarré ({self._session['mode']}, {duree_s:.0f}s, "
+              f"toutes les {self._session['intervalle_ms']:.0f} ms)")
+        return True
+
+    def arreter(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def suivre(self):
+        """À l'entrée d'une requête : retourne True si ce thread est échantillonné (mode requêtes)"""
+        session = self._session
+        if session is None or session['mode'] != 'requetes' or not self.actif:
+            return False
+        if next(self._compteur_requetes) % session['une_sur']:
+            return False
+        with self._lock:
+            self._suivis.add(threading.get_ident())
+            session['requetes_suivies'] += 1
+        return True
+
+    def liberer(self):
+        with self._lock:
+            self._suivis.discard(threading.get_ident())
+
+    @contextmanager
+    def requete(self):
+        """Bloc traité comme une requête pour le mode 1 sur N (workers du mode asynchrone)"""
+        suivi = self.suivre()
+        try:
+            yield
+        finally:
+            if suivi:
+                self.liberer()
+
+    def _boucle(self):
+        session = self._session
+        intervalle = session['intervalle_ms'] / 1000
+        fin = session['debut'] + session['duree_s']
+        moi = threading.get_ident()
+        try:
+            while not self._stop.is_set() and time.time() < fin:
+                noms = {t.ident: t.name for t in threading.enumerate()}
+                with self._lock:
+                    suivis = set(self._suivis) if session['mode'] == 'requetes' else None
+                cadres = sys._current_frames()
+                piles = [
+                    pile_repliee(frame, noms.get(ident, 'thread'))
+                    for ident, frame in cadres.items()
+                    if ident != moi and (suivis is None or ident in suivis)
+                ]
+                del cadres
+                with self._lock:
+                    for pile in piles:
+                        if pile in self._piles or len(self._piles) < PROFILE_MAX_STACKS:
+                            self._piles[pile] += 1
+                        else:
+                            self._piles['autres'] += 1
+                    session['echantillons'] += 1
+                self._stop.wait(intervalle)
+        finally:
+            session['fin'] = time.time()
+            print(f"🔬 Profilage terminé ({session['echantillons']} relevés, {len(self._piles)} piles)")
+
+    def piles_repliees(self):
+        """Résultat de la dernière session au format flamegraph (piles les plus fréquentes d'abord)"""
+        with self._lock:
+            piles = self._piles.most_common()
+        return ''.join(f"{pile} {n}\n" for pile, n in piles)
+
+    def etat(self):
+        with self._lock:
+            session = dict(self._session) if self._session else None
+            nb_piles = len(self._piles)
+        if session is None:
+            return {'actif': False}
+        return dict(session, actif=self.actif, piles=nb_piles)
+
+
+profileur = ProfileurEchantillons()
@@ -0,0 +1,67 @@
+"""
+Génération locale d'identifiants de type "push" Firebase
+
+Même algorithme que le SDK JavaScript : 8 caractères d'horodatage (ms) puis
+12 caractères aléatoires. Les clés restent triées chronologiquement, ce qui
+permet d'écrire une commande et ses index dans un seul update() multi-chemins.
+"""
+
+import random
+import threading
+import time
+
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+_lock = threading.Lock()
+_dernier_ms = 0
+_derniers_aleatoires = [0] * 12
+_rng = random.SystemRandom()
+
+
+def generer_id_push(now_ms=None):
+    """Retourne un nouvel identifiant de 20 caractères, croissant dans le temps"""
+    global _dernier_ms
+
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+
+    with _lock:
+        duplique = now_ms == _dernier_ms
+        _dernier_ms = now_ms
+
+        if not duplique:
+            for i in range(12):
+                _derniers_aleatoires[i] = _rng.randrange(64)
+        else:
+            # Même milliseconde : on incrémente la partie aléatoire
+            i = 11
+            while i >= 0 and _derniers_aleatoires[i] == 63:
+                _derniers_aleatoires[i] = 0
+                i -= 1
+            if i >= 0:
+                _derniers_aleatoires[i] += 1
+
+        aleatoire = ''.join(PUSH_CHARS[c] for c in _derniers_aleatoires)
+
+    return _encoder_horodatage(now_ms) + aleatoire
+
+
+def _encoder_horodatage(ms):
+    horodatage = []
+    for _ in range(8):
+        horodatage.append(PUSH_CHARS[ms % 64])
+        ms //= 64
+    return ''.join(reversed(horodatage))
+
+
+def borne_id_push(ms):
+    """Plus petit identifiant possible pour l'instant `ms` : borne des requêtes par intervalle de temps"""
+    return _encoder_horodatage(ms) + PUSH_CHARS[0] * 12
+
+
+def horodatage_id_push(push_id):
+    """Instant (ms) encodé dans les 8 premiers caractères d'un identifiant push"""
+    ms = 0
+    for c in push_id[:8]:
+        ms = ms * 64 + PUSH_CHARS.index(c)
+    return ms
@@ -0,0 +1,312 @@
+"""
+Analyse rapide et déterministe des commandes simples (niveau 1)
+
+Reconnaît les produits du catalogue, les quantités (chiffres ou "deux",
+"trois"...), les formules seul/menu, les tailles et le type de service,
+et calcule un score de confiance. analyser_commande n'appelle GPT-4o que
+si ce score est sous le seuil.
+"""
+
+import re
+import threading
+from collections import Counter, deque
+
+from addresses import ABREVIATIONS, extraire_adresse_manuel
+from menu_catalog import CATALOGUE, normaliser
+
+NOMBRES = {
+    'un': 1, 'une': 1, 'deux': 2, 'trois': 3, 'quatre': 4, 'cinq': 5, 'six': 6,
+    'sept': 7, 'huit': 8, 'neuf': 9, 'dix': 10, 'onze': 11, 'douze': 12,
+    'quinze': 15, 'vingt': 20,
+}
+MOTS_MENU = {'menu', 'menus', 'formule', 'formules', 'box'}
+MOTS_SEUL = {'seul', 'seuls', 'seule', 'seules'}
+
+# Indices que la commande dépasse ce que l'analyse rapide sait représenter
+MOTS_MODIFICATION = {'plutot', 'finalement', 'annule', 'annuler', 'change', 'changer', 'remplace', 'enleve', 'enlever'}
+MOTS_PERSONNALISATION = {'sans', 'supplement', 'sauce', 'sauces', 'boisson', 'boissons', 'coca', 'dessert', 'desserts'}
+MOTS_RENSEIGNEMENT = {'horaires', 'horaire', 'ouvert', 'ouverts', 'ferme', 'fermez', 'combien', 'prix', 'allergie', 'halal'}
+# Mots qui changent le sens de la phrase : "pas de wings", "menu enfant avec les nuggets", "dont un seul"
+MOTS_NUANCE = {'pas', 'juste', 'avec', 'pour', 'dont', 'autre', 'autres', 'deuxieme', 'second', 'seconde'}
+
+# Adresse dictée : mots d'hésitation qu'une regex laisse passer, types de voie attendus
+MOTS_PARASITES = {'un', 'une', 'euh', 'heu', 'hum', 'ben', 'bah', 'voila', 'hein', 'quoi', 'genre', 'ouais', 'oui', 'merci', 'plait', 'svp'}
+TYPES_VOIE = (set(ABREVIATIONS.values()) - {'saint', 'sainte'}) | {
+    'quai', 'cours', 'passage', 'sentier', 'cite', 'hameau', 'lotissement', 'voie', 'ruelle', 'esplanade'}
+
+# Lignes du client dans une transcription Retell ("User: ...")
+_LIGNE_CLIENT = re.compile(r'^\s*(?:user|client|utilisateur)\s*:\s*(.*)$', re.IGNORECASE | re.MULTILINE)
+_LIGNE_AGENT = re.compile(r'^\s*(?:agent|assistant)\s*:', re.IGNORECASE | re.MULTILINE)
+
+
+def texte_client(transcript):
+    """Ne garde que les répliques du client (l'agent répète souvent la commande)"""
+    if not _LIGNE_AGENT.search(transcript):
+        return transcript
+    return '\n'.join(_LIGNE_CLIENT.findall(transcript))
+
+
+def _nombre(mot):
+    if mot.isdigit():
+        return int(mot)
+    return NOMBRES.get(mot)
+
+
+def _nombre_suivant(apres, produit_suivant):
+    """Nombre juste après le produit qui est en fait la quantité du produit suivant ("wings trois menus tenders")"""
+    return produit_suivant and (len(apres) == 1 or all(mot in MOTS_MENU for mot in apres[1:]))
+
+
+def _taille_explicite(apres, tailles, produit_suivant=False):
+    """
+    Taille donnée après le produit : "wings x10", "wings x 10", "wings par 10", "wings de 10",
+    ou nombre nu "menu tenders 14" ; (taille, True si un nombre nu ne correspond à aucune taille)
+    """
+    if apres and _nombre(apres[0]) is not None and apres[0] not in ('un', 'une') \
+            and not _nombre_suivant(apres, produit_suivant):
+        n = _nombre(apres[0])
+        return (n, False) if n in tailles else (None, True)
+    for i, mot in enumerate(apres):
+        precedent = apres[i - 1] if i > 0 else ''
+        if mot == 'et' or (_nombre(mot) is not None and precedent not in ('x', 'par', 'de')):
+            break
+        if re.fullmatch(r'x\d+', mot):
+            return int(mot[1:]), False
+        if mot in ('x', 'par', 'de') and i + 1 < len(apres) and _nombre(apres[i + 1]) in tailles:
+            return _nombre(apres[i + 1]), False
+    return None, False
+
+
+def _reference_implicite(apres, produit_suivant):
+    """True pour "un menu curry et un pour ma femme" : un nombre après "et" sans produit reconnu derrière"""
+    for i, mot in enumerate(apres[:-1]):
+        if mot == 'et' and _nombre(apres[i + 1]) is not None:
+            reste = apres[i + 2:]
+            if not produit_suivant or any(m not in MOTS_MENU for m in reste):
+                return True
+    return False
+
+
+def _lire_article(produit, avant, apres, produit_suivant=False):
+    """
+    Quantité, formule et taille d'un produit d'après les mots qui l'entourent,
+    et True si quantité et taille ne se distinguent pas sans deviner
+    """
+    quantite, formule = None, None
+    ambigu = False
+    tailles = {t for f in produit.formules for t in produit.tailles(f)}
+
+    # Taille explicite d'abord : un nombre avant le produit est alors une quantité ("trois wings x10")
+    taille, ambigu = _taille_explicite(apres, tailles, produit_suivant)
+
+    # Mots avant le produit, du plus proche au plus lointain : "deux menus 10 wings"
+    for position, mot in enumerate(reversed(avant)):
+        if mot == 'et':
+            # "menu tenders 14 et deux wings" : ce qui précède concerne le produit précédent
+            break
+        if mot in MOTS_MENU:
+            formule = formule or 'menu'
+            continue
+        n = _nombre(mot)
+        if n is None:
+            continue
+        colle = position == 0 and mot not in ('un', 'une')
+        if colle and taille is None and n in tailles:
+            # Nombre juste devant le nom : c'est la taille ("10 wings", "deux menus 10 wings")
+            taille = n
+        elif quantite is None:
+            quantite = n
+            # "4 wings" (pas de taille x4), "10 wings x10" : pièces ou portions ?
+            if colle and tailles and (taille is None or n == taille):
+                ambigu = True
+        else:
+            # Un nombre de trop : "2 3 10 wings"
+            ambigu = True
+
+    # Mots après le produit : "curry seul", "curry en menu"
+    for i, mot in enumerate(apres):
+        precedent = apres[i - 1] if i > 0 else ''
+        # "10 wings et deux menus tenders" : la suite concerne le produit suivant
+        if mot == 'et' or (_nombre(mot) is not None and precedent not in ('x', 'par', 'de')
+                           and (i > 0 or _nombre_suivant(apres, produit_suivant))):
+            break
+        if mot in MOTS_SEUL or (mot == 'sans' and i + 1 < len(apres) and apres[i + 1] in MOTS_MENU):
+            formule = 'seul'
+        elif mot in MOTS_MENU and formule is None:
+            formule = 'menu'
+
+    return quantite or 1, formule, taille, ambigu
+
+
+def _defaut_adresse(adresse):
+    """Raison de ne pas faire confiance à une adresse extraite par regex, ou None"""
+    mots = normaliser(adresse).split()
+    parasites = MOTS_PARASITES & set(mots)
+    if parasites:
+        return f"adresse douteuse: {', '.join(sorted(parasites))}"
+    if not any(mot.isdigit() for mot in mots) or not TYPES_VOIE & {ABREVIATIONS.get(mot, mot) for mot in mots}:
+        return "adresse douteuse: numéro ou type de voie manquant"
+    return None
+
+
+def analyser_commande_rapide(transcript):
+    """
+    Retourne (résultat au format d'analyser_commande, confiance entre 0 et 1,
+    raisons des pénalités)
+    """
+    texte = normaliser(texte_client(transcript))
+    mots = set(texte.split())
+    raisons = []
+    confiance = 1.0
+
+    occurrences = CATALOGUE.detecteur.rechercher(texte)
+
+    articles = []
+    vus = set()
+    for i, (debut, fin, produit) in enumerate(occurrences):
+        fin_precedente = occurrences[i - 1][1] if i > 0 else 0
+        debut_suivant = occurrences[i + 1][0] if i + 1 < len(occurrences) else len(texte)
+        avant = texte[fin_precedente:debut].split()[-4:]
+        segment = texte[fin:debut_suivant].split()
+        produit_suivant = i + 1 < len(occurrences)
+        if produit_suivant:
+            # Seuls les derniers mots avant le produit suivant peuvent le concerner
+            apres = segment if len(segment) <= 4 else segment[:2] + segment[-2:]
+        else:
+            apres = segment[:6]
+
+        quantite, formule, taille, ambigu = _lire_article(produit, avant, apres, produit_suivant)
+        if ambigu:
+            raisons.append(f"quantité ou taille ambiguë: {produit.nom}")
+            confiance -= 0.5
+        if _reference_implicite(segment, produit_suivant):
+            # "et un pour ma femme", "et deux desserts" : un article de plus, sans nom reconnu
+            raisons.append(f"article sous-entendu après: {produit.nom}")
+            confiance -= 0.5
+        if None in produit.formules:
+            formule = None
+        elif formule is None:
+            formule = produit.formule_defaut
+        if produit.prix(formule, taille) is None:
+            if taille is not None:
+                raisons.append(f"taille inconnue: {produit.nom} x{taille}")
+                confiance -= 0.3
+            taille = produit.taille_defaut(formule)
+
+        cle = (produit.cle, formule, taille)
+        if cle in vus:
+            # Répétition ou ajout ? L'analyse rapide ne sait pas trancher
+            raisons.append(f"produit répété: {produit.nom}")
+            confiance -= 0.3
+            continue
+        vus.add(cle)
+        articles.append({
+            'nom': produit.nom_article(formule, taille),
+            'prix': produit.prix(formule, taille),
+            'quantite': quantite
+        })
+
+    if not articles:
+        raisons.append("aucun produit reconnu")
+        confiance = 0.0
+
+    # Type de service
+    services = []
+    if {'livraison', 'livrer', 'livre', 'domicile'} & mots:
+        services.append('Livraison')
+    if 'sur place' in texte:
+        services.append('Sur place')
+    if 'emporter' in mots:
+        services.append('À emporter')
+
+    type_service = services[0] if len(services) == 1 else 'Non spécifié'
+    if not services:
+        raisons.append("type de service non précisé")
+        confiance -= 0.3
+    elif len(services) > 1:
+        raisons.append("types de service contradictoires")
+        confiance -= 0.5
+
+    adresse = ''
+    if type_service == 'Livraison':
+        adresse = extraire_adresse_manuel(texte_client(transcript))
+        if not adresse:
+            raisons.append("adresse de livraison introuvable")
+            confiance -= 0.5
+        elif _defaut_adresse(adresse):
+            # "12 rue de la gare, un, Dreux" : le niveau GPT-4o nettoie l'adresse avant le géocodage
+            raisons.append(_defaut_adresse(adresse))
+            confiance -= 0.5
+
+    for nom, ensemble, penalite in (
+        ('modification', MOTS_MODIFICATION, 0.3),
+        ('personnalisation', MOTS_PERSONNALISATION, 0.3),
+        ('renseignement', MOTS_RENSEIGNEMENT, 0.4),
+        ('nuance', MOTS_NUANCE, 0.4),
+    ):
+        trouves = ensemble & mots
+        if trouves:
+            raisons.append(f"{nom}: {', '.join(sorted(trouves))}")
+            confiance -= penalite
+
+    if len(articles) > 4:
+        raisons.append(f"{len(articles)} articles")
+        confiance -= 0.1 * (len(articles) - 4)
+
+    prix_total = round(sum(art['prix'] * art['quantite'] for art in articles), 2)
+    articles_str = ', '.join(
+        f"{art['quantite']}× {art['nom']}" if art['quantite'] > 1 else art['nom']
+        for art in articles
+    )
+
+    resultat = {
+        'type_appel': 'commande' if articles else 'renseignement',
+        'type_service': type_service,
+        'articles': articles_str if articles_str else 'Non spécifié',
+        'adresse_livraison': adresse,
+        'prix_total': prix_total,
+        'nombre_articles': len(articles),
+        'notes': '',
+        'articles_detailles': articles,
+        'tier': 'rapide'
+    }
+    return resultat, round(max(confiance, 0.0), 2), raisons
+
+
+class StatistiquesRoutage:
+    """Compteurs des niveaux d'analyse utilisés, pour régler le seuil de confiance"""
+
+    SEUILS_SIMULES = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+    def __init__(self, historique=1000):
+        self._lock = threading.Lock()
+        self._tiers = Counter()
+        self._raisons = Counter()
+        self._confiances = deque(maxlen=historique)
+
+    def enregistrer(self, tier, confiance, raisons):
+        with self._lock:
+            self._tiers[tier] += 1
+            self._confiances.append(confiance)
+            for raison in raisons:
+                self._raisons[raison.split(':')[0]] += 1
+
+    def stats(self, seuil):
+        with self._lock:
+            tiers = dict(self._tiers)
+            raisons = dict(self._raisons.most_common(10))
+            confiances = list(self._confiances)
+
+        total = sum(tiers.values())
+        return {
+            'seuil': seuil,
+            'total': total,
+            'tiers': tiers,
+            'taux': {tier: round(n / total, 3) for tier, n in tiers.items()} if total else {},
+            'raisons_escalade': raisons,
+            # Part des derniers appels qui auraient évité GPT-4o avec chaque seuil
+            'simulation_seuils': {
+                str(s): round(sum(1 for c in confiances if c >= s) / len(confiances), 3) if confiances else 0.0
+                for s in self.SEUILS_SIMULES
+            }
+        }
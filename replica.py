@@ -0,0 +1,201 @@
+"""
+Réplique locale du nœud `orders`, tenue à jour par un écouteur Firebase
+
+Au démarrage, db.reference('orders').listen() envoie d'abord tout le nœud
+(amorçage), puis chaque modification. La réplique garde en mémoire les
+commandes récentes, indexées par clé et par call_id : la déduplication,
+l'API des commandes et le flux des écrans la lisent sans aller sur le réseau.
+
+Mémoire bornée : au-delà de REPLICA_MAX_ORDERS commandes, ou pour les
+commandes plus anciennes que REPLICA_MAX_AGE_HOURS, les plus anciennes clés
+sont évincées. Les commandes plus anciennes que la dernière clé évincée ne
+sont plus couvertes : les lectures correspondantes repassent par Firebase.
+
+Fraîcheur : retard de réplication mesuré sur chaque nouvelle commande
+(réception - instant encodé dans sa clé) et temps depuis le dernier événement.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+from firebase_setup import db
+
+from push_ids import borne_id_push, horodatage_id_push
+from metrics import percentile
+
+REPLICA_MAX_ORDERS = int(os.environ.get('REPLICA_MAX_ORDERS', 5000))
+REPLICA_MAX_AGE_HOURS = float(os.environ.get('REPLICA_MAX_AGE_HOURS', 48))
+REPLICA_SEED_TIMEOUT = float(os.environ.get('REPLICA_SEED_TIMEOUT', 10))
+
+
+def _fusionner(cible, chemin, valeur):
+    """Applique une écriture Firebase (chemin relatif à une commande) sur un dict"""
+    noeud = cible
+    for partie in chemin[:-1]:
+        suivant = noeud.get(partie)
+        suivant = dict(suivant) if isinstance(suivant, dict) else {}
+        noeud[partie] = suivant
+        noeud = suivant
+    if valeur is None:
+        noeud.pop(chemin[-1], None)
+    else:
+        noeud[chemin[-1]] = valeur
+
+
+class RepliqueCommandes:
+    """Copie en mémoire des commandes récentes, alimentée par un seul écouteur Firebase"""
+
+    def __init__(self, taille_max=REPLICA_MAX_ORDERS, age_max_h=REPLICA_MAX_AGE_HOURS):
+        self.taille_max = taille_max
+        self.age_max_h = age_max_h
+        self._lock = threading.Lock()
+        self._pret = threading.Event()
+        self._commandes = {}
+        self._par_call_id = {}
+        self._abonnes = []
+        self._ecouteur = None
+        # Plus grande clé évincée : les commandes antérieures ne sont plus couvertes
+        self._borne_eviction = ''
+        self._evictions = 0
+        self._evenements = 0
+        self._dernier_evenement = None
+        self._retards = deque(maxlen=500)
+
+    def demarrer(self, attente=REPLICA_SEED_TIMEOUT):
+        """Lance l'écouteur (une seule fois) et attend l'amorçage au plus `attente` secondes"""
+        with self._lock:
+            if self._ecouteur is None:
+                self._ecouteur = db.reference('orders').listen(self._sur_evenement)
+        if self._pret.wait(attente):
+            print(f"🪞 Réplique des commandes amorcée ({len(self._commandes)} commandes)")
+        else:
+            print(f"⚠️ Réplique des commandes non amorcée après {attente}s : lectures via Firebase")
+
+    @property
+    def pret(self):
+        return self._pret.is_set()
+
+    def abonner(self, callback):
+        """callback(changements) à chaque événement : liste de (order_id, commande ou None)"""
+        with self._lock:
+            self._abonnes.append(callback)
+            if self.pret:
+                callback(list(self._commandes.items()))
+
+    def _sur_evenement(self, event):
+        """Callback de l'écouteur Firebase (thread de firebase_admin)"""
+        recu_ms = time.time() * 1000
+        chemin = [p for p in (event.path or '/').split('/') if p]
+        changements = []
+
+        with self._lock:
+            self._evenements += 1
+            self._dernier_evenement = time.time()
+            if not chemin:
+                if event.event_type == 'put':
+                    # Remplacement complet (amorçage ou reconnexion)
+                    nouvelles = event.data if isinstance(event.data, dict) else {}
+                    for order_id in list(self._commandes):
+                        if order_id not in nouvelles:
+                            self._changer(order_id, None, changements)
+                    for order_id, commande in nouvelles.items():
+                        if self._commandes.get(order_id) != commande:
+                            self._changer(order_id, commande, changements)
+                else:
+                    for order_id, commande in (event.data or {}).items():
+                        self._changer(order_id, commande, changements)
+            else:
+                order_id, reste = chemin[0], chemin[1:]
+                nouvelle = order_id not in self._commandes
+                if not reste and event.event_type == 'put':
+                    self._changer(order_id, event.data, changements)
+                else:
+                    commande = dict(self._commandes.get(order_id) or {})
+                    if event.event_type == 'patch':
+                        for cle, valeur in (event.data or {}).items():
+                            _fusionner(commande, reste + cle.split('/'), valeur)
+                    else:
+                        _fusionner(commande, reste, event.data)
+                    self._changer(order_id, commande or None, changements)
+                if nouvelle and self.pret and order_id in self._commandes:
+                    self._retards.append(max(0.0, recu_ms - horodatage_id_push(order_id)))
+
+            self._evincer(changements)
+            self._pret.set()
+            for callback in self._abonnes:
+                try:
+                    callback(changements)
+                except Exception as e:
+                    print(f"⚠️ Abonné de la réplique en erreur: {e}")
+
+    def _changer(self, order_id, commande, changements):
+        """Applique un changement à la copie et à l'index call_id (verrou tenu)"""
+        if commande is not None and order_id <= self._borne_eviction:
+            # Commande déjà sortie de la fenêtre de la réplique
+            return
+        ancienne = self._commandes.pop(order_id, None)
+        if ancienne is None and commande is None:
+            return
+        if isinstance(ancienne, dict) and ancienne.get('call_id'):
+            self._par_call_id.pop(ancienne['call_id'], None)
+        if commande is not None:
+            self._commandes[order_id] = commande
+            if isinstance(commande, dict) and commande.get('call_id'):
+                self._par_call_id[commande['call_id']] = order_id
+        changements.append((order_id, commande))
+
+    def _evincer(self, changements):
+        """Évince les commandes trop anciennes, puis les plus anciennes au-delà de la taille max"""
+        borne_age = borne_id_push(int((time.time() - self.age_max_h * 3600) * 1000))
+        trop_vieilles = [cle for cle in self._commandes if cle < borne_age]
+        cles = trop_vieilles
+        if len(self._commandes) - len(cles) > self.taille_max:
+            # Éviction par lot (10 %) pour ne pas trier à chaque nouvelle commande
+            restantes = sorted(cle for cle in self._commandes if cle >= borne_age)
+            en_trop = len(restantes) - int(self.taille_max * 0.9)
+            cles = trop_vieilles + restantes[:en_trop]
+        for cle in cles:
+            self._changer(cle, None, changements)
+            self._evictions += 1
+        if cles:
+            self._borne_eviction = max(self._borne_eviction, max(cles))
+
+    def lire(self, order_id):
+        with self._lock:
+            return self._commandes.get(order_id)
+
+    def order_id_pour_call(self, call_id):
+        """ID de la commande d'un appel, si elle est dans la réplique"""
+        with self._lock:
+            return self._par_call_id.get(call_id)
+
+    def couvre(self, cle_debut):
+        """Vrai si toutes les commandes à partir de cette clé sont dans la réplique"""
+        return self.pret and cle_debut > self._borne_eviction
+
+    def intervalle(self, cle_debut, cle_fin):
+        """Commandes dont la clé est dans [cle_debut, cle_fin], triées par clé"""
+        with self._lock:
+            cles = sorted(cle for cle in self._commandes if cle_debut <= cle <= cle_fin)
+            return [(cle, self._commandes[cle]) for cle in cles]
+
+    def stats(self):
+        with self._lock:
+            retards = sorted(self._retards)
+            return {
+                'pret': self.pret,
+                'commandes': len(self._commandes),
+                'evenements': self._evenements,
+                'evictions': self._evictions,
+                'dernier_evenement_s': round(time.time() - self._dernier_evenement, 1) if self._dernier_evenement else None,
+                'retard_ms': {
+                    'p50': round(percentile(retards, 50), 1),
+                    'p95': round(percentile(retards, 95), 1),
+                    'max': round(retards[-1], 1) if retards else 0.0
+                }
+            }
+
+
+replique_commandes = RepliqueCommandes()
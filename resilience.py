@@ -0,0 +1,311 @@
+"""
+Disjoncteurs, délais adaptatifs et requêtes doublées pour les services externes
+
+Chaque dépendance (OpenAI, Nominatim) a :
+- un disjoncteur : si trop d'appels récents échouent (erreur ou délai dépassé),
+  il s'ouvre et les appels suivants sont refusés tout de suite pendant
+  CIRCUIT_OPEN_SECONDS ; l'appelant bascule sur son repli (analyse simple,
+  commande sans géocodage). Ensuite, un seul appel d'essai est autorisé
+  (semi-ouvert) : s'il réussit, le disjoncteur se referme.
+- un délai adaptatif : p99 des dernières durées réussies x ADAPTIVE_TIMEOUT_FACTOR,
+  borné entre un minimum et le délai configuré (utilisé tant qu'il n'y a pas
+  assez de mesures)
+- une requête doublée facultative (*_HEDGE=1) : si l'appel dépasse le p95
+  observé, un second appel identique part et le premier arrivé est gardé
+
+État visible dans /health → disjoncteurs et dans /metrics.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from logging_setup import obtenir_logger, evenement
+from metrics import registre, percentile
+
+CIRCUIT_WINDOW = int(os.environ.get('CIRCUIT_WINDOW', 20))
+CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', 5))
+CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE', 0.5))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+ADAPTIVE_TIMEOUT_FACTOR = float(os.environ.get('ADAPTIVE_TIMEOUT_FACTOR', 2.0))
+# Mesures nécessaires avant d'adapter le délai ou de doubler une requête
+ADAPTIVE_MIN_SAMPLES = int(os.environ.get('ADAPTIVE_MIN_SAMPLES', 20))
+HEDGE_MAX_WORKERS = int(os.environ.get('HEDGE_MAX_WORKERS', 16))
+
+FERME = 'ferme'
+OUVERT = 'ouvert'
+SEMI_OUVERT = 'semi_ouvert'
+
+logger = obtenir_logger('resilience')
+
+refus_disjoncteur = registre.compteur(
+    'circuit_rejections_total', "Appels refusés par un disjoncteur ouvert", ('dependency',))
+requetes_doublees = registre.compteur(
+    'hedged_requests_total', "Requêtes doublées, par requête gagnante (primary / hedge)", ('dependency', 'winner'))
+
+
+class DependanceIndisponible(Exception):
+    """Appel refusé sans être tenté : le disjoncteur de la dépendance est ouvert"""
+
+    def __init__(self, nom):
+        super().__init__(f"{nom} indisponible (disjoncteur ouvert)")
+        self.nom = nom
+
+
+class Disjoncteur:
+    """Taux d'erreur sur les derniers appels ; ouvert puis semi-ouvert après un délai"""
+
+    def __init__(self, nom):
+        self.nom = nom
+        self._lock = threading.Lock()
+        self._resultats = deque(maxlen=CIRCUIT_WINDOW)
+        self._etat = FERME
+        self._ouvert_a = 0.0
+        self._essai_en_cours = False
+        self._ouvertures = 0
+        self._refus = 0
+
+    @property
+    def etat(self):
+        with self._lock:
+            return self._etat_courant()
+
+    def _etat_courant(self):
+        if self._etat == OUVERT and time.monotonic() - self._ouvert_a >= CIRCUIT_OPEN_SECONDS:
+            self._etat = SEMI_OUVERT
+            self._essai_en_cours = False
+        return self._etat
+
+    def autoriser(self):
+        """True si l'appel peut partir (un seul appel d'essai à la fois en semi-ouvert)"""
+        with self._lock:
+            etat = self._etat_courant()
+            if etat == FERME:
+                return True
+            if etat == SEMI_OUVERT and not self._essai_en_cours:
+                self._essai_en_cours = True
+                return True
+            self._refus += 1
+        refus_disjoncteur.inc(self.nom)
+        return False
+
+    def enregistrer(self, erreur):
+        with self._lock:
+            # Comme autoriser() : passe en semi-ouvert une fois le délai écoulé
+            etat = self._etat_courant()
+            if etat == SEMI_OUVERT:
+                self._essai_en_cours = False
+                if erreur:
+                    self._ouvrir()
+                else:
+                    self._etat = FERME
+                    self._resultats.clear()
+                    evenement(logger, 'disjoncteur', f"✅ Disjoncteur {self.nom} refermé",
+                              dependance=self.nom, etat=FERME)
+                return
+            self._resultats.append(erreur)
+            if etat == FERME and len(self._resultats) >= CIRCUIT_MIN_CALLS:
+                taux = sum(self._resultats) / len(self._resultats)
+                if taux >= CIRCUIT_ERROR_RATE:
+                    self._ouvrir()
+
+    def _ouvrir(self):
+        self._etat = OUVERT
+        self._ouvert_a = time.monotonic()
+        self._ouvertures += 1
+        taux = round(sum(self._resultats) / len(self._resultats), 2) if self._resultats else None
+        self._resultats.clear()
+        evenement(logger, 'disjoncteur', f"⚡ Disjoncteur {self.nom} ouvert pour {CIRCUIT_OPEN_SECONDS:.0f}s",
+                  niveau=logging.WARNING, dependance=self.nom, etat=OUVERT, taux_erreur=taux,
+                  ouvertures=self._ouvertures, duree_s=CIRCUIT_OPEN_SECONDS)
+
+    def stats(self):
+        with self._lock:
+            etat = self._etat_courant()
+            resultats = list(self._resultats)
+            return {
+                'etat': etat,
+                'taux_erreur': round(sum(resultats) / len(resultats), 2) if resultats else 0.0,
+                'ouvertures': self._ouvertures,
+                'refus': self._refus,
+                'reouverture_dans_s': round(max(0.0, CIRCUIT_OPEN_SECONDS - (time.monotonic() - self._ouvert_a)), 1)
+                if etat == OUVERT else None
+            }
+
+
+class Dependance:
+    """Disjoncteur + délai adaptatif + requête doublée facultative pour un service externe"""
+
+    def __init__(self, nom, delai_max, delai_min, doubler=False):
+        self.nom = nom
+        self.delai_max = delai_max
+        self.delai_min = min(delai_min, delai_max)
+        self.doubler = doubler
+        self.disjoncteur = Disjoncteur(nom)
+        self._lock = threading.Lock()
+        self._durees = deque(maxlen=500)
+        self._pool = None
+
+    def _percentile(self, p):
+        with self._lock:
+            if len(self._durees) < ADAPTIVE_MIN_SAMPLES:
+                return None
+            durees = sorted(self._durees)
+        return percentile(durees, p)
+
+    def delai(self):
+        """Délai de l'appel suivant (secondes)"""
+        p99 = self._percentile(99)
+        if p99 is None:
+            return self.delai_max
+        return round(min(self.delai_max, max(self.delai_min, p99 * ADAPTIVE_TIMEOUT_FACTOR)), 2)
+
+    def delai_doublement(self):
+        """Attente avant d'envoyer la requête doublée (p95), ou None si désactivé / pas assez de mesures"""
+        return self._percentile(95) if self.doubler else None
+
+    def disponible(self):
+        """False si le disjoncteur est ouvert (sans consommer l'appel d'essai du mode semi-ouvert)"""
+        return self.disjoncteur.etat != OUVERT
+
+    def verifier(self):
+        """Lève DependanceIndisponible si le disjoncteur refuse l'appel"""
+        if not self.disjoncteur.autoriser():
+            raise DependanceIndisponible(self.nom)
+
+    def enregistrer(self, duree_s, erreur):
+        """Résultat d'un appel : alimente le disjoncteur et, s'il a réussi, les percentiles"""
+        self.disjoncteur.enregistrer(erreur)
+        if not erreur:
+            with self._lock:
+                self._durees.append(duree_s)
+
+    def appeler(self, fonction):
+        """
+        fonction(delai) -> résultat, appelée sous la protection du disjoncteur ;
+        doublée si elle dépasse le p95 (*_HEDGE=1)
+        """
+        self.verifier()
+        return self.executer(fonction)
+
+    def executer(self, fonction):
+        """Comme appeler(), quand l'appelant a déjà fait verifier()"""
+        debut = time.perf_counter()
+        erreur = True
+        try:
+            attente = self.delai_doublement()
+            if attente is None:
+                resultat = fonction(self.delai())
+            else:
+                resultat = self._appeler_double(fonction, attente)
+            erreur = False
+            return resultat
+        finally:
+            self.enregistrer(time.perf_counter() - debut, erreur)
+
+    def _appeler_double(self, fonction, attente):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix=f'hedge-{self.nom}')
+        delai = self.delai()
+        # Le contexte des journaux (call_id) suit l'appel dans le pool
+        principale = self._pool.submit(contextvars.copy_context().run, fonction, delai)
+        termines, _ = wait([principale], timeout=attente)
+        if termines:
+            return principale.result()
+
+        # La requête d'origine dépasse le p95 : on en envoie une seconde, la première réponse valide gagne
+        doublee = self._pool.submit(contextvars.copy_context().run, fonction, delai)
+        en_cours = {principale: 'primary', doublee: 'hedge'}
+        while True:
+            termines, _ = wait(list(en_cours), return_when=FIRST_COMPLETED)
+            for future in termines:
+                gagnante = en_cours.pop(future)
+                if future.exception() is None or not en_cours:
+                    requetes_doublees.inc(self.nom, gagnante)
+                    return future.result()
+
+    async def appeler_async(self, fonction):
+        """Version asyncio de appeler() : fonction(delai) retourne un awaitable ; la perdante est annulée"""
+        self.verifier()
+        return await self.executer_async(fonction)
+
+    async def executer_async(self, fonction):
+        debut = time.perf_counter()
+        erreur = True
+        try:
+            attente = self.delai_doublement()
+            if attente is None:
+                resultat = await fonction(self.delai())
+            else:
+                resultat = await self._appeler_double_async(fonction, attente)
+            erreur = False
+            return resultat
+        finally:
+            self.enregistrer(time.perf_counter() - debut, erreur)
+
+    async def _appeler_double_async(self, fonction, attente):
+        delai = self.delai()
+        principale = asyncio.ensure_future(fonction(delai))
+        en_cours = {principale: 'primary'}
+        try:
+            termines, _ = await asyncio.wait([principale], timeout=attente)
+            if termines:
+                return principale.result()
+
+            doublee = asyncio.ensure_future(fonction(delai))
+            en_cours[doublee] = 'hedge'
+            while True:
+                termines, _ = await asyncio.wait(list(en_cours), return_when=asyncio.FIRST_COMPLETED)
+                for tache in termines:
+                    gagnante = en_cours.pop(tache)
+                    if tache.exception() is None or not en_cours:
+                        requetes_doublees.inc(self.nom, gagnante)
+                        return tache.result()
+        finally:
+            for tache in en_cours:
+                if not tache.done():
+                    tache.cancel()
+
+    def stats(self):
+        p95 = self._percentile(95)
+        with self._lock:
+            mesures = len(self._durees)
+        return dict(
+            self.disjoncteur.stats(),
+            delai_s=self.delai(),
+            p95_ms=round(p95 * 1000, 1) if p95 is not None else None,
+            mesures=mesures,
+            doublement=self.doubler
+        )
+
+
+dependances = {}
+
+
+def dependance(nom, delai_max, delai_min, doubler=False):
+    """Crée (ou retourne) la dépendance `nom`"""
+    if nom not in dependances:
+        dependances[nom] = Dependance(nom, delai_max, delai_min, doubler)
+    return dependances[nom]
+
+
+def etat_dependances():
+    return {nom: d.stats() for nom, d in dependances.items()}
+
+
+@registre.collecteur
+def metriques_dependances():
+    codes = {FERME: 0, SEMI_OUVERT: 1, OUVERT: 2}
+    return [
+        ('circuit_state', 'gauge', "État du disjoncteur (0 fermé, 1 semi-ouvert, 2 ouvert)",
+         [({'dependency': nom}, codes[d.disjoncteur.etat]) for nom, d in dependances.items()]),
+        ('dependency_timeout_seconds', 'gauge', "Délai adaptatif courant",
+         [({'dependency': nom}, d.delai()) for nom, d in dependances.items()])
+    ]
@@ -0,0 +1,273 @@
+"""
+Statistiques de ventes tenues à jour à chaque commande (GET /api/stats)
+
+Chaque commande incrémente les agrégats de son jour et de son heure (heure du
+restaurant, d'après sa clé push), dans la même écriture multi-chemins que la
+commande elle-même (incréments serveur `.sv`) :
+    sales_stats/jours/AAAA-MM-JJ/{commandes, chiffre_affaires, frais_livraison,
+        par_type/<type>, livraisons, distance_km, frais_offerts, articles/<nom>}
+    sales_stats/heures/AAAA-MM-JJ/HHh/{commandes, chiffre_affaires, par_type/<type>}
+
+Lire une journée ou un mois coûte donc une lecture par jour, quel que soit le
+nombre de commandes. Les agrégats comptent les commandes enregistrées (les
+changements de statut ne sont pas suivis). Une correction des montants d'une
+commande enregistrée (recalcul des frais de livraison) ajoute les écarts
+correspondants (ecarts_statistiques) dans la même écriture.
+
+Reconstruction à partir de l'historique (orders + orders_archive), en une
+passe lue par lots, par exemple après une coupure ou un changement de calcul :
+    python sales_stats.py reconstruire [--depuis AAAA-MM-JJ] [--dry-run]
+"""
+
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+
+from firebase_setup import db
+
+from archive import ARCHIVE_NODE, increment
+from orders_api import fuseau_restaurant
+from push_ids import horodatage_id_push
+
+STATS_NODE = 'sales_stats'
+SALES_STATS_ENABLED = os.environ.get('SALES_STATS_ENABLED', '1') == '1'
+STATS_TOP_ITEMS = int(os.environ.get('STATS_TOP_ITEMS', 10))
+# Champs en euros / km (arrondis), les autres sont des nombres
+CHAMPS_DECIMAUX = ('chiffre_affaires', 'frais_livraison', 'distance_km')
+
+# Caractères interdits dans une clé Firebase
+_INTERDITS = re.compile(r'[.$#\[\]/]')
+
+
+def cle_firebase(texte):
+    """Nom d'article ou de type utilisable comme clé Firebase"""
+    return _INTERDITS.sub('_', str(texte)).strip() or 'Non spécifié'
+
+
+def instant_commande(order_id):
+    """(jour AAAA-MM-JJ, heure "18h") de création d'une commande, heure du restaurant"""
+    instant = datetime.fromtimestamp(horodatage_id_push(order_id) / 1000, tz=fuseau_restaurant())
+    # "18h" plutôt que "18" : des clés numériques seraient relues comme un tableau par Firebase
+    return instant.strftime('%Y-%m-%d'), instant.strftime('%Hh')
+
+
+def agregats_commande(commande):
+    """Contributions d'une commande : (champs du jour, champs de l'heure)"""
+    total = float(commande.get('total', 0) or 0)
+    type_service = cle_firebase(commande.get('type_service') or 'Non spécifié')
+    heure = {
+        'commandes': 1,
+        'chiffre_affaires': total,
+        f'par_type/{type_service}': 1
+    }
+    jour = dict(heure, frais_livraison=float(commande.get('delivery_fee', 0) or 0))
+
+    if commande.get('type_service') == 'Livraison' and commande.get('distance_km'):
+        jour['livraisons'] = 1
+        jour['distance_km'] = float(commande['distance_km'])
+    if commande.get('delivery_fee_waived'):
+        jour['frais_offerts'] = 1
+
+    for item in commande.get('items') or []:
+        if not isinstance(item, dict):
+            continue
+        cle = f"articles/{cle_firebase(item.get('name') or 'Article')}"
+        jour[cle] = jour.get(cle, 0) + int(item.get('quantity', 1) or 1)
+    return jour, heure
+
+
+def _arrondir(champ, valeur):
+    return round(valeur, 2) if champ in CHAMPS_DECIMAUX else int(valeur)
+
+
+def chemins_statistiques(order_id, commande):
+    """Incréments à ajouter à l'update() multi-chemins qui enregistre la commande"""
+    if not SALES_STATS_ENABLED:
+        return {}
+    jour, heure = instant_commande(order_id)
+    champs_jour, champs_heure = agregats_commande(commande)
+    updates = {
+        f'{STATS_NODE}/jours/{jour}/{champ}': increment(_arrondir(champ, valeur))
+        for champ, valeur in champs_jour.items()
+    }
+    updates.update({
+        f'{STATS_NODE}/heures/{jour}/{heure}/{champ}': increment(_arrondir(champ, valeur))
+        for champ, valeur in champs_heure.items()
+    })
+    return updates
+
+
+def ecarts_statistiques(order_id, ancienne, nouvelle):
+    """Écarts {chemin: valeur} des agrégats quand une commande enregistrée est corrigée"""
+    if not SALES_STATS_ENABLED:
+        return {}
+    jour, heure = instant_commande(order_id)
+    avant_jour, avant_heure = agregats_commande(ancienne)
+    apres_jour, apres_heure = agregats_commande(nouvelle)
+    ecarts = {}
+    for prefixe, avant, apres in (
+        (f'{STATS_NODE}/jours/{jour}', avant_jour, apres_jour),
+        (f'{STATS_NODE}/heures/{jour}/{heure}', avant_heure, apres_heure),
+    ):
+        for champ in avant.keys() | apres.keys():
+            ecart = apres.get(champ, 0) - avant.get(champ, 0)
+            if abs(ecart) >= 0.005:
+                ecarts[f'{prefixe}/{champ}'] = ecart
+    return ecarts
+
+
+def chemins_ecarts(ecarts):
+    """Incréments serveur pour des écarts {chemin: valeur} (éventuellement cumulés sur plusieurs commandes)"""
+    return {
+        chemin: increment(_arrondir(chemin.rsplit('/', 1)[-1], valeur))
+        for chemin, valeur in ecarts.items()
+    }
+
+
+def resumer(jours, top=STATS_TOP_ITEMS):
+    """Totaux d'une période à partir des agrégats journaliers {jour: agrégats}"""
+    totaux = defaultdict(float)
+    par_type = defaultdict(int)
+    articles = defaultdict(int)
+    for agregats in jours.values():
+        for champ, valeur in (agregats or {}).items():
+            if champ == 'par_type':
+                for type_service, n in valeur.items():
+                    par_type[type_service] += n
+            elif champ == 'articles':
+                for nom, n in valeur.items():
+                    articles[nom] += n
+            elif isinstance(valeur, (int, float)):
+                totaux[champ] += valeur
+
+    commandes = int(totaux['commandes'])
+    livraisons = int(totaux['livraisons'])
+    return {
+        'commandes': commandes,
+        'chiffre_affaires': round(totaux['chiffre_affaires'], 2),
+        'panier_moyen': round(totaux['chiffre_affaires'] / commandes, 2) if commandes else 0.0,
+        'frais_livraison': round(totaux['frais_livraison'], 2),
+        'par_type': dict(par_type),
+        'livraisons': livraisons,
+        'distance_moyenne_km': round(totaux['distance_km'] / livraisons, 2) if livraisons else 0.0,
+        'frais_offerts': int(totaux['frais_offerts']),
+        'top_articles': [
+            {'nom': nom, 'quantite': n}
+            for nom, n in sorted(articles.items(), key=lambda a: (-a[1], a[0]))[:top]
+        ]
+    }
+
+
+def lire_statistiques(depuis, jusqua, par_heure=False, top=STATS_TOP_ITEMS):
+    """Statistiques des jours [depuis, jusqua] (AAAA-MM-JJ), avec le détail par jour ou par heure"""
+    jours = db.reference(f'{STATS_NODE}/jours').order_by_key().start_at(depuis).end_at(jusqua).get() or {}
+    resultat = {
+        'depuis': depuis,
+        'jusqua': jusqua,
+        'total': resumer(jours, top),
+        'par_jour': {jour: resumer({jour: agregats}, top) for jour, agregats in sorted(jours.items())}
+    }
+    if par_heure:
+        resultat['par_heure'] = {}
+        for jour in sorted(jours):
+            heures = db.reference(f'{STATS_NODE}/heures/{jour}').get() or {}
+            for heure, agregats in sorted(heures.items()):
+                resultat['par_heure'][f'{jour} {heure}'] = {
+                    'commandes': int(agregats.get('commandes', 0)),
+                    'chiffre_affaires': round(agregats.get('chiffre_affaires', 0), 2),
+                    'par_type': agregats.get('par_type', {})
+                }
+    return resultat
+
+
+def _parcourir(noeud, taille_lot):
+    """Commandes d'un nœud, lues par lots de clés (jamais le nœud entier en mémoire)"""
+    depart = None
+    while True:
+        requete = db.reference(noeud).order_by_key()
+        if depart:
+            requete = requete.start_at(depart)
+        lot = requete.limit_to_first(taille_lot + 1).get() or {}
+        cles = [cle for cle in lot if cle != depart]
+        for cle in cles:
+            if isinstance(lot[cle], dict):
+                yield cle, lot[cle]
+        if len(lot) <= taille_lot or not cles:
+            return
+        depart = cles[-1]
+
+
+def reconstruire(depuis=None, dry_run=False, taille_lot=500):
+    """
+    Recalcule les agrégats à partir de l'historique, en une passe, puis remplace ceux
+    des jours concernés. À lancer hors service : une commande enregistrée pendant la
+    reconstruction peut être comptée deux fois ou pas du tout.
+    """
+    jours = defaultdict(lambda: defaultdict(float))
+    heures = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+
+    noeuds = ['orders']
+    jours_archives = db.reference(ARCHIVE_NODE).get(shallow=True) or {}
+    noeuds += [f'{ARCHIVE_NODE}/{jour}' for jour in sorted(jours_archives) if not depuis or jour >= depuis]
+
+    lues = 0
+    for noeud in noeuds:
+        for order_id, commande in _parcourir(noeud, taille_lot):
+            jour, heure = instant_commande(order_id)
+            if depuis and jour < depuis:
+                continue
+            champs_jour, champs_heure = agregats_commande(commande)
+            for champ, valeur in champs_jour.items():
+                jours[jour][champ] += valeur
+            for champ, valeur in champs_heure.items():
+                heures[jour][heure][champ] += valeur
+            lues += 1
+
+    updates = {}
+    for jour, champs in jours.items():
+        updates[f'{STATS_NODE}/jours/{jour}'] = _imbriquer(champs)
+        updates[f'{STATS_NODE}/heures/{jour}'] = {
+            heure: _imbriquer(champs_heure) for heure, champs_heure in heures[jour].items()
+        }
+    if not dry_run:
+        chemins = sorted(updates)
+        for i in range(0, len(chemins), taille_lot):
+            db.reference().update({chemin: updates[chemin] for chemin in chemins[i:i + taille_lot]})
+    print(f"📊 {lues} commande(s) sur {len(jours)} jour(s)" + (" (simulation)" if dry_run else ''))
+    return {'commandes': lues, 'jours': sorted(jours)}
+
+
+def _imbriquer(champs):
+    """{'par_type/Livraison': 3} -> {'par_type': {'Livraison': 3}}, valeurs arrondies"""
+    resultat = {}
+    for champ, valeur in champs.items():
+        *parents, feuille = champ.split('/')
+        noeud = resultat
+        for parent in parents:
+            noeud = noeud.setdefault(parent, {})
+        noeud[feuille] = _arrondir(champ, valeur)
+    return resultat
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Statistiques de ventes")
+    sub = parser.add_subparsers(dest='commande', required=True)
+    reconstruction = sub.add_parser('reconstruire', help="Recalcule les agrégats à partir de l'historique")
+    reconstruction.add_argument('--depuis', help="premier jour recalculé (AAAA-MM-JJ)")
+    reconstruction.add_argument('--dry-run', action='store_true')
+    lecture = sub.add_parser('lire', help="Affiche les statistiques d'une période")
+    lecture.add_argument('depuis')
+    lecture.add_argument('jusqua', nargs='?')
+
+    args = parser.parse_args()
+
+    from firebase_setup import initialiser_firebase
+    initialiser_firebase()
+    if args.commande == 'reconstruire':
+        print(reconstruire(depuis=args.depuis, dry_run=args.dry_run))
+    else:
+        print(json.dumps(lire_statistiques(args.depuis, args.jusqua or args.depuis), ensure_ascii=False, indent=2))
@@ -1,19 +1,44 @@
-from flask import Flask, request, jsonify
-import firebase_admin
-from firebase_admin import credentials, db
+# En premier : instant de début du chargement du serveur (mesure du démarrage à froid)
+from startup import demarrage, InitialisationEchouee, STARTUP_MODE, STARTUP_WARMUP
+from flask import Flask, Response, request, jsonify, g
+from firebase_setup import db
 import os
 import json
+import time
+import hashlib
+import hmac
 from datetime import datetime
-import requests
-from geopy.distance import geodesic
+from concurrent.futures import CancelledError
 
 # Import de la fonction d'analyse
-from order_analyzer import analyser_commande
+from order_analyzer import analyser_commande, statistiques_routage
+from addresses import extraire_adresse_manuel
+from quick_parser import texte_client
+from openai_client import openai_client, OPENAI_WARMUP
+from firebase_setup import initialiser_firebase
+from dedup import DeduplicateurAppels, EN_COURS
+from push_ids import generer_id_push
+from job_queue import FileTravaux, PoolWorkers
+from geocache import CacheGeocodage
+from gazetteer import charger_gazetteer
+from addresses import RESTAURANT_COORDS, distance_haversine
+from delivery_zones import GrilleZones, Paliers
+from prefetch import GeocodageAnticipe, statistiques_anticipation
+from order_feed import journal_commandes, flux_sse, refus_sse, FEED_MAX_CLIENTS, FEED_RETRY_MS
+from orders_api import lire_fenetre, lire_commandes, fuseau_restaurant, API_PAGE_SIZE
+from archive import archiver, demarrer_archivage_periodique, totaux_jour
+from order_details import chemins_commande, lire_details
+from sales_stats import chemins_statistiques, lire_statistiques, STATS_TOP_ITEMS
+from outbox import BoiteEnvoi
+from replica import replique_commandes
+from logging_setup import obtenir_logger, evenement, contexte_appel, statistiques_logs
+from profiler import profileur, PROFILE_INTERVAL_MS
+from resilience import dependance, etat_dependances, DependanceIndisponible
+from nominatim import ClientNominatim, PRIORITE_COMMANDE, PRIORITE_ANTICIPATION
+from metrics import Chronometre, registre, duree_webhook, sources_geocodage, deduplication, observer_etape, exposer
 
 app = Flask(__name__)
-
-# Configuration
-FIREBASE_URL = os.environ.get('FIREBASE_URL')
+logger = obtenir_logger('server')
 
 # HTML embarqué (version standalone sans stats, sans clignotement)
 INDEX_HTML = '''<!DOCTYPE html>
@@ -86,6 +111,9 @@ INDEX_HTML = '''<!DOCTYPE html>
         .price-row { display: flex; justify-content: space-between; margin: 8px 0; font-size: 0.95rem; }
         .price-row.total { font-size: 1.5rem; font-weight: bold; color: #667eea; margin-top: 10px; padding-top: 10px; border-top: 2px solid #667eea; }
         .status-badge { padding: 6px 12px; border-radius: 20px; font-size: 0.85rem; font-weight: bold; background: #fff3cd; color: #856404; }
+        .details-toggle { margin-top: 15px; padding: 8px 16px; border: none; border-radius: 8px; background: #edf2ff; color: #667eea; font-weight: bold; cursor: pointer; }
+        .order-details { background: #f8f9fa; padding: 15px; border-radius: 8px; margin-top: 10px; font-size: 0.9rem; color: #555; }
+        .order-details .transcript { white-space: pre-wrap; margin-top: 8px; }
         .empty-state { text-align: center; padding: 60px 20px; color: white; }
         .empty-state h2 { font-size: 2rem; margin-bottom: 10px; }
         @media (max-width: 768px) { .orders-grid { grid-template-columns: 1fr; } header h1 { font-size: 2rem; } }
@@ -105,9 +133,13 @@ INDEX_HTML = '''<!DOCTYPE html>
         <div id="orders-container" class="orders-grid"></div>
     </div>
     <script>
-        const FIREBASE_URL = 'https://chicken-hot-dreux-default-rtdb.europe-west1.firebasedatabase.app';
         let orders = {};
-        let lastOrdersJSON = '';
+        // Détails chargés à la demande (cartes dépliées)
+        let details = {};
+        
+        function escapeHTML(s) {
+            return String(s).replace(/[&<>"]/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c]));
+        }
         
         function formatDateTime(d) {
             const date = new Date(d);
@@ -127,15 +159,38 @@ INDEX_HTML = '''<!DOCTYPE html>
             let contact = '';
             if (isDel && (o.phone_number || o.delivery_address)) {
                 contact = '<div class="contact-info">';
-                if (o.phone_number && o.phone_number !== 'Non fourni') contact += \`<p><strong>📞 Téléphone:</strong> <span class="phone-number">\${o.phone_number}</span></p>\`;
-                if (o.formatted_address || o.delivery_address) contact += \`<p><strong>📍 Adresse:</strong> <span class="delivery-address">\${o.formatted_address || o.delivery_address}</span></p>\`;
-                if (o.distance_km > 0) contact += \`<p>Distance: \${o.distance_km} km</p>\`;
+                if (o.phone_number && o.phone_number !== 'Non fourni') contact += `<p><strong>📞 Téléphone:</strong> <span class="phone-number">${o.phone_number}</span></p>`;
+                if (o.formatted_address || o.delivery_address) contact += `<p><strong>📍 Adresse:</strong> <span class="delivery-address">${o.formatted_address || o.delivery_address}</span></p>`;
+                if (o.distance_km > 0) contact += `<p>Distance: ${o.distance_km} km</p>`;
                 contact += '</div>';
             }
-            const items = o.items.map(i => \`<div class="item"><span class="item-name"><span class="item-quantity">\${i.quantity}×</span>\${i.name}</span><span class="item-price">\${i.total_price.toFixed(2)}€</span></div>\`).join('');
+            const items = o.items.map(i => `<div class="item"><span class="item-name"><span class="item-quantity">${i.quantity}×</span>${i.name}</span><span class="item-price">${i.total_price.toFixed(2)}€</span></div>`).join('');
             let delFee = '';
-            if (isDel && o.delivery_fee > 0) delFee = \`<div class="price-row"><span>Frais de livraison</span><span>+\${o.delivery_fee.toFixed(2)}€</span></div>\`;
-            return \`<div class="order-card" data-type="\${t}" data-id="\${id}"><div class="order-header"><span class="order-time">\${formatDateTime(o.timestamp)}</span><span class="status-badge">Nouvelle</span></div><div class="order-type \${getTypeClass(t)}">\${t}</div>\${contact}<div class="order-items">\${items}</div><div class="order-pricing"><div class="price-row"><span>Sous-total</span><span>\${o.subtotal.toFixed(2)}€</span></div>\${delFee}<div class="price-row total"><span>TOTAL</span><span>\${o.total.toFixed(2)}€</span></div></div></div>\`;
+            if (isDel && o.delivery_fee > 0) delFee = `<div class="price-row"><span>Frais de livraison</span><span>+${o.delivery_fee.toFixed(2)}€</span></div>`;
+            let more = '';
+            if (o.has_details) {
+                const d = details[id];
+                more = `<button class="details-toggle" onclick="toggleDetails('${id}')">${d ? 'Masquer' : 'Détails'}</button>`;
+                if (d) {
+                    more += '<div class="order-details">';
+                    if (d.formatted_address) more += `<p><strong>📍 Adresse complète:</strong> ${escapeHTML(d.formatted_address)}</p>`;
+                    if (d.transcript) more += `<p class="transcript"><strong>📞 Transcription:</strong>\n${escapeHTML(d.transcript)}</p>`;
+                    more += '</div>';
+                }
+            }
+            return `<div class="order-card" data-type="${t}" data-id="${id}"><div class="order-header"><span class="order-time">${formatDateTime(o.timestamp)}</span><span class="status-badge">Nouvelle</span></div><div class="order-type ${getTypeClass(t)}">${t}</div>${contact}<div class="order-items">${items}</div><div class="order-pricing"><div class="price-row"><span>Sous-total</span><span>${o.subtotal.toFixed(2)}€</span></div>${delFee}<div class="price-row total"><span>TOTAL</span><span>${o.total.toFixed(2)}€</span></div></div>${more}</div>`;
+        }
+        
+        function toggleDetails(id) {
+            if (details[id]) {
+                delete details[id];
+                displayOrders();
+                return;
+            }
+            fetch(`/api/orders/${id}/details`).then(r => r.json()).then(d => {
+                details[id] = d.details || {};
+                displayOrders();
+            }).catch(e => console.error(e));
         }
         
         function displayOrders() {
@@ -149,32 +204,32 @@ INDEX_HTML = '''<!DOCTYPE html>
         }
         
         function listenToOrders() {
-            const ref = \`\${FIREBASE_URL}/orders.json\`;
-            
-            // Premier chargement
-            fetch(ref).then(r => r.json()).then(d => { 
-                if (d) { 
-                    orders = d; 
-                    lastOrdersJSON = JSON.stringify(d);
-                    displayOrders(); 
-                } 
-            }).catch(e => console.error(e));
+            // Flux SSE du serveur : instantané puis seulement les commandes modifiées
+            const source = new EventSource('/orders/stream');
             
-            // Vérification toutes les 3 secondes SEULEMENT si changement
-            setInterval(() => {
-                fetch(ref).then(r => r.json()).then(d => { 
-                    if (d) {
-                        const newJSON = JSON.stringify(d);
-                        // Ne recharge QUE si les données ont changé
-                        if (newJSON !== lastOrdersJSON) {
-                            orders = d;
-                            lastOrdersJSON = newJSON;
-                            displayOrders();
-                            console.log('🔄 Nouvelles commandes détectées');
-                        }
-                    }
-                }).catch(e => console.error(e));
-            }, 3000);
+            source.addEventListener('snapshot', e => {
+                orders = JSON.parse(e.data).orders || {};
+                displayOrders();
+            });
+            source.addEventListener('order', e => {
+                const d = JSON.parse(e.data);
+                orders[d.id] = d.order;
+                displayOrders();
+                console.log('🔄 Commande reçue', d.id);
+            });
+            source.addEventListener('removed', e => {
+                delete orders[JSON.parse(e.data).id];
+                displayOrders();
+            });
+            source.onerror = () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    // Refus (503, trop d'écrans connectés) : le navigateur ne réessaie pas seul
+                    console.warn('Flux refusé, nouvel essai dans 10 s...');
+                    setTimeout(listenToOrders, 10000);
+                } else {
+                    console.warn('Flux interrompu, reconnexion automatique...');
+                }
+            };
         }
         
         document.addEventListener('DOMContentLoaded', () => { 
@@ -186,99 +241,296 @@ INDEX_HTML = '''<!DOCTYPE html>
 </html>
 '''
 
-# Coordonnées du restaurant Chicken Hot Dreux
-RESTAURANT_COORDS = (48.7333, 1.3667)  # Dreux, France
+# Déduplication des appels (appels récents + réplique, index call_id Firebase en secours)
+dedup = DeduplicateurAppels(replique=replique_commandes)
+
+# Mode du webhook : 'sync' (traitement dans la requête) ou 'async' (file + workers)
+WEBHOOK_MODE = os.environ.get('WEBHOOK_MODE', 'sync')
+file_travaux = None
+
+# Cache des adresses déjà géocodées (mémoire + disque)
+geocache = CacheGeocodage()
+
+# Service de géocodage (remplaçable par un faux serveur pour les bancs d'essai)
+NOMINATIM_URL = os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search')
+# Délai max et délai min (adaptatif) ; disjoncteur "nominatim". Pas de requête doublée :
+# elle compterait dans la limite d'une requête par seconde du serveur public
+NOMINATIM_TIMEOUT = float(os.environ.get('NOMINATIM_TIMEOUT', 5))
+NOMINATIM_TIMEOUT_MIN = float(os.environ.get('NOMINATIM_TIMEOUT_MIN', 1))
+dependance_nominatim = dependance('nominatim', NOMINATIM_TIMEOUT, NOMINATIM_TIMEOUT_MIN)
+
+# Écritures Firebase des commandes via la boîte d'envoi locale (OUTBOX_ENABLED=0 pour écrire directement)
+boite_envoi = None
+if os.environ.get('OUTBOX_ENABLED', '1') == '1':
+    boite_envoi = BoiteEnvoi()
+    boite_envoi.demarrer()
 
-# Initialiser Firebase
-firebase_key = os.environ.get('FIREBASE_KEY')
-if firebase_key:
-    if isinstance(firebase_key, str):
-        cred_dict = json.loads(firebase_key)
+def initialiser_services():
+    """Firebase et ce qui en dépend : réplique (lue par la déduplication, l'API et le flux), archivage"""
+    initialiser_firebase()
+    replique_commandes.demarrer()
+    journal_commandes.demarrer()
+    # Archivage périodique des commandes terminées (ARCHIVE_INTERVAL=0 pour désactiver)
+    demarrer_archivage_periodique()
+
+def gazetteer_local():
+    """Index local des rues de la zone de livraison (None si non généré ou en échec), chargé une seule fois"""
+    try:
+        return demarrage.une_fois('gazetteer', charger_gazetteer)
+    except InitialisationEchouee:
+        # Géocodage par Nominatim en attendant le prochain essai
+        return None
+
+# Paliers de frais de livraison (DELIVERY_FEE_TIERS, FREE_DELIVERY_THRESHOLD)
+PALIERS_LIVRAISON = Paliers.depuis_texte()
+
+def zones_livraison():
+    """Grille précalculée des paliers de frais autour du restaurant, construite une seule fois (InitialisationEchouee sinon)"""
+    return demarrage.une_fois('zones_livraison', lambda: GrilleZones(PALIERS_LIVRAISON))
+
+def prechauffer(connexion_openai=OPENAI_WARMUP):
+    """Charge ce qu'utilise la première commande : modules, gazetteer, zones, client (et connexion) OpenAI"""
+    import requests  # noqa: F401
+    gazetteer_local()
+    try:
+        zones_livraison()
+    except InitialisationEchouee:
+        pass  # erreur visible dans /health → demarrage ; retentée à la première livraison
+    if connexion_openai:
+        openai_client.prechauffer()
     else:
-        cred_dict = firebase_key
-    cred = credentials.Certificate(cred_dict)
-else:
-    cred = credentials.Certificate('firebase-key.json')
+        openai_client.client()
+
+# Jeton des routes d'administration (désactivées si absent)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
 
-firebase_admin.initialize_app(cred, {
-    'databaseURL': FIREBASE_URL
-})
+def admin_autorise():
+    """Vérifie l'en-tête Authorization: Bearer <ADMIN_TOKEN>"""
+    if not ADMIN_TOKEN:
+        return False
+    fourni = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    return hmac.compare_digest(fourni, ADMIN_TOKEN)
+
+def geocodage_local(address):
+    """Résultat sans réseau : cache des adresses déjà géocodées, puis gazetteer local (ou None)"""
+    cached = geocache.lire(address)
+    if cached is not None:
+        sources_geocodage.inc('cache')
+        logger.debug("⚡ Adresse trouvée dans le cache")
+        return cached
+    
+    gazetteer = gazetteer_local()
+    if gazetteer is not None:
+        local = gazetteer.rechercher(address)
+        if local is not None:
+            sources_geocodage.inc('gazetteer')
+            logger.debug("🗺️ Adresse trouvée dans le gazetteer local (score %s)", local['score'])
+            return local
+    return None
+
+def parametres_nominatim(address):
+    """Paramètres et en-têtes de la requête de recherche Nominatim"""
+    params = {
+        'q': address,
+        'format': 'json',
+        'limit': 1,
+        'countrycodes': 'fr'
+    }
+    headers = {
+        'User-Agent': 'ChickenHotDreux/1.0'
+    }
+    return params, headers
+
+def resultat_nominatim(address, data):
+    """Interprète la réponse de Nominatim et la met en cache"""
+    sources_geocodage.inc('nominatim')
+    if data and len(data) > 0:
+        lat = float(data[0]['lat'])
+        lon = float(data[0]['lon'])
+        display_name = data[0]['display_name']
+        result = {
+            'valid': True,
+            'coordinates': (lat, lon),
+            'formatted_address': display_name
+        }
+    else:
+        result = {'valid': False, 'error': 'Adresse introuvable'}
+    
+    # Les erreurs réseau ne sont pas mises en cache, seulement les réponses
+    geocache.ecrire(address, result)
+    return result
 
-def verify_address(address):
-    """Vérifie l'adresse avec Nominatim et retourne les coordonnées"""
+def erreur_geocodage(e):
+    if isinstance(e, CancelledError):
+        # Géocodage anticipé abandonné en file : personne n'attend ce résultat
+        return {'valid': False, 'error': 'Géocodage annulé'}
+    if isinstance(e, DependanceIndisponible):
+        # Nominatim en panne : la commande est enregistrée sans géocodage, sans attendre
+        sources_geocodage.inc('indisponible')
+        logger.debug("⚡ Nominatim indisponible, géocodage ignoré")
+        return {'valid': False, 'error': 'Géocodage indisponible'}
+    sources_geocodage.inc('erreur')
+    logger.warning("Erreur vérification adresse: %s", e)
+    return {'valid': False, 'error': str(e)}
+
+def geocoder_nominatim(address):
+    """Requête Nominatim, exécutée par client_nominatim au rythme autorisé"""
+    import requests
+    params, headers = parametres_nominatim(address)
+    
+    def rechercher(delai):
+        response = requests.get(NOMINATIM_URL, params=params, headers=headers, timeout=delai)
+        response.raise_for_status()
+        return response.json()
+    
+    with Chronometre('nominatim'):
+        data = dependance_nominatim.appeler(rechercher)
+    return resultat_nominatim(address, data)
+
+# File partagée des requêtes Nominatim : débit limité, priorités, regroupement des adresses identiques
+client_nominatim = ClientNominatim(geocoder_nominatim)
+
+def demande_nominatim(address, priorite=PRIORITE_COMMANDE, abonnement=None):
+    """Future du géocodage Nominatim ; refus immédiat si le disjoncteur est ouvert"""
+    if not dependance_nominatim.disponible():
+        raise DependanceIndisponible('nominatim')
+    return client_nominatim.soumettre(address, priorite, abonnement)
+
+def verify_address(address, priorite=PRIORITE_COMMANDE, abonnement=None):
+    """Vérifie l'adresse (cache, gazetteer local puis Nominatim) et retourne les coordonnées"""
     if not address or address == '':
         return {'valid': False, 'error': 'Pas d\'adresse'}
     
+    local = geocodage_local(address)
+    if local is not None:
+        return local
+    
     try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': address,
-            'format': 'json',
-            'limit': 1,
-            'countrycodes': 'fr'
-        }
-        headers = {
-            'User-Agent': 'ChickenHotDreux/1.0'
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        data = response.json()
-        
-        if data and len(data) > 0:
-            lat = float(data[0]['lat'])
-            lon = float(data[0]['lon'])
-            display_name = data[0]['display_name']
-            return {
-                'valid': True,
-                'coordinates': (lat, lon),
-                'formatted_address': display_name
-            }
-        else:
-            return {'valid': False, 'error': 'Adresse introuvable'}
+        return demande_nominatim(address, priorite, abonnement).result()
     except Exception as e:
-        print(f"Erreur vérification adresse: {e}")
-        return {'valid': False, 'error': str(e)}
+        return erreur_geocodage(e)
 
 def calculate_distance(coords1, coords2):
-    """Calcule la distance en km entre deux coordonnées"""
-    return round(geodesic(coords1, coords2).km, 2)
+    """Calcule la distance en km entre deux coordonnées (même formule que la grille et le recalcul par lots)"""
+    return round(distance_haversine(coords1, coords2), 2)
 
-def calculate_delivery_fee(distance_km, order_total):
-    """Calcule les frais de livraison - GRATUIT si commande > 20€"""
-    if order_total > 20:
-        return 0.00
-    
-    # Sinon, frais basés sur la distance
-    if distance_km <= 3:
-        return 2.00
-    elif distance_km <= 5:
-        return 3.00
-    elif distance_km <= 8:
-        return 4.00
-    else:
-        return 5.00
+def ajouter_distance(address_info):
+    """Ajoute la distance au restaurant à une adresse validée"""
+    if address_info.get('valid'):
+        with Chronometre('distance'):
+            distance_km = calculate_distance(RESTAURANT_COORDS, address_info['coordinates'])
+        address_info = dict(address_info, distance_km=distance_km)
+    return address_info
+
+def priorite_geocodage(origine):
+    """Une adresse trouvée par les regex est spéculative : elle passe après celles des commandes analysées"""
+    return PRIORITE_ANTICIPATION if origine == 'regex' else PRIORITE_COMMANDE
+
+def localiser_adresse(address, origine='direct', abonnement=None):
+    """Vérifie l'adresse et ajoute la distance au restaurant"""
+    with Chronometre('geocode'):
+        address_info = verify_address(address, priorite_geocodage(origine), abonnement)
+    return ajouter_distance(address_info)
+
+def calculate_delivery_fee(coords, order_total):
+    """Calcule les frais de livraison - GRATUIT au-dessus du seuil, sinon palier de la zone"""
+    try:
+        return zones_livraison().frais(coords, order_total)
+    except InitialisationEchouee:
+        # Grille indisponible : même palier, calculé à partir de la distance
+        return PALIERS_LIVRAISON.frais(distance_haversine(RESTAURANT_COORDS, coords), order_total)
+
+@app.before_request
+def debut_requete():
+    g.debut = time.perf_counter()
+    # Profilage d'une requête webhook sur N (session lancée via /admin/profile)
+    if request.endpoint == 'retell_webhook':
+        g.profilee = profileur.suivre()
+
+@app.after_request
+def fin_requete(response):
+    """Durée du webhook Retell, par code HTTP"""
+    if request.endpoint == 'retell_webhook' and 'debut' in g:
+        duree_webhook.observer(time.perf_counter() - g.debut, str(response.status_code))
+    demarrage.requete_servie('webhook' if request.endpoint == 'retell_webhook' else 'autre')
+    return response
+
+@app.teardown_request
+def liberer_requete(exc):
+    if g.get('profilee'):
+        profileur.liberer()
 
 @app.route('/')
 def index():
-    """Serve l'interface web avec URL Firebase dynamique"""
-    # Utiliser l'URL Firebase ou une valeur par défaut
-    firebase_url = FIREBASE_URL or 'https://chicken-hot-dreux-default-rtdb.europe-west1.firebasedatabase.app'
-    
-    # Injecter l'URL Firebase réelle dans le HTML
-    html = INDEX_HTML.replace(
-        'https://chicken-hot-dreux-default-rtdb.europe-west1.firebasedatabase.app',
-        firebase_url
+    """Serve l'interface web (les commandes arrivent par /orders/stream)"""
+    return INDEX_HTML
+
+@app.route('/orders/stream', methods=['GET'])
+def orders_stream():
+    """Flux SSE des commandes nouvelles ou modifiées (reprise via Last-Event-ID ou ?cursor=)"""
+    # Chaque écran occupe un thread pendant la connexion : on en garde pour le webhook
+    if not journal_commandes.reserver(FEED_MAX_CLIENTS):
+        return Response(
+            refus_sse(),
+            status=503,
+            mimetype='text/event-stream',
+            headers={'Retry-After': str(FEED_RETRY_MS // 1000), 'Cache-Control': 'no-cache'}
+        )
+    curseur = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    response = Response(
+        flux_sse(curseur),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
-    return html
+    # Appelé à la fermeture de la réponse, même si le flux n'a jamais commencé
+    response.call_on_close(lambda: journal_commandes.connexion(-1))
+    return response
+
+@app.route('/api/orders', methods=['GET'])
+def api_orders():
+    """Commandes d'une fenêtre de temps (?window=today|2h|..., ?since=, ?until=, ?status=, ?cursor=, ?limit=)"""
+    try:
+        debut_ms, fin_ms = lire_fenetre(
+            request.args.get('window'),
+            request.args.get('since'),
+            request.args.get('until')
+        )
+        statuts = {s for s in request.args.get('status', '').split(',') if s} or None
+        limite = int(request.args.get('limit', API_PAGE_SIZE))
+        commandes, curseur, encore = lire_commandes(
+            debut_ms, fin_ms, statuts, request.args.get('cursor'), limite, replique=replique_commandes
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    page = {
+        'orders': commandes,
+        'count': len(commandes),
+        'cursor': curseur,
+        'has_more': encore
+    }
+    # ETag sur le contenu seul (la fin de fenêtre "maintenant" change à chaque appel)
+    etag = hashlib.sha1(json.dumps(page, sort_keys=True, default=str).encode()).hexdigest()
+    
+    response = jsonify(dict(page, window={'since': debut_ms, 'until': fin_ms}))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Même contenu que le dernier appel du client (If-None-Match) : 304 sans corps
+    return response.make_conditional(request)
+
+@app.route('/api/orders/<order_id>/details', methods=['GET'])
+def order_details(order_id):
+    """Champs lourds d'une commande (transcription, adresse complète), lus quand la carte est dépliée"""
+    details = lire_details(order_id)
+    if details is None:
+        return jsonify({'status': 'error', 'message': 'Commande inconnue'}), 404
+    return jsonify({'id': order_id, 'details': details}), 200
 
 @app.route('/webhook/retell', methods=['POST'])
 def retell_webhook():
     """Webhook pour recevoir les appels de Retell AI"""
     try:
         data = request.json
-        print(f"\n{'='*70}")
-        print(f"📞 WEBHOOK RETELL REÇU")
-        print(f"{'='*70}")
         
         # Extraire les données de l'appel
         call_data = data.get('call', {})
@@ -286,171 +538,391 @@ def retell_webhook():
         transcript = call_data.get('transcript', '')
         from_number = call_data.get('from_number', 'Non fourni')
         
-        print(f"Call ID: {call_id}")
-        print(f"Téléphone: {from_number}")
-        print(f"Transcription: {transcript[:100]}...")
+        evenement(logger, 'webhook_recu', "📞 Webhook Retell reçu", call_id=call_id,
+                  telephone=from_number, longueur_transcription=len(transcript))
         
         if not transcript:
-            print("❌ Pas de transcription")
+            logger.warning("❌ Pas de transcription", extra={'call_id': call_id})
             return jsonify({
                 'status': 'error',
                 'message': 'Pas de transcription'
             }), 400
         
-        # Vérifier les doublons (SANS INDEX - méthode corrigée)
-        print(f"\n🔍 Vérification des doublons...")
-        ref = db.reference('orders')
-        all_orders = ref.get()
-        
-        if all_orders:
-            for order_id, order_data in all_orders.items():
-                if order_data.get('call_id') == call_id:
-                    print(f"⚠️ Commande {call_id} déjà traitée (ID: {order_id})")
-                    return jsonify({'status': 'duplicate', 'call_id': call_id}), 200
-        
-        print(f"✅ Pas de doublon détecté")
-        
-        # Analyser la commande
-        print(f"\n🤖 Lancement de l'analyse OpenAI...")
-        analysis = analyser_commande(transcript)
-        
-        if not analysis:
-            print("❌ Analyse impossible")
-            return jsonify({'status': 'error', 'message': 'Analyse impossible'}), 500
-        
-        # Traiter l'adresse de livraison SEULEMENT si c'est une livraison
-        type_service = analysis.get('type_service', 'Non spécifié')
-        delivery_address = analysis.get('adresse_livraison', '')
-        address_info = {'valid': False}
-        distance_km = 0
-        delivery_fee = 0
+        # Mode asynchrone : on enregistre l'appel et on répond tout de suite
+        if WEBHOOK_MODE == 'async':
+            job_id, nouveau = file_travaux.ajouter(call_id, {
+                'call_id': call_id,
+                'transcript': transcript,
+                'from_number': from_number
+            })
+            evenement(logger, 'mise_en_file', "📥 Appel mis en file", call_id=call_id, job_id=job_id, nouveau=nouveau)
+            return jsonify({
+                'status': 'accepted',
+                'job_id': job_id,
+                'call_id': call_id,
+                'status_url': f'/jobs/{job_id}'
+            }), 202
         
-        print(f"\n📍 Traitement de la livraison...")
-        print(f"Type de service: {type_service}")
-        print(f"Adresse brute: {delivery_address}")
+        result, status_code = traiter_appel(call_id, transcript, from_number)
+        return jsonify(result), status_code
         
-        # Calculer les frais de livraison UNIQUEMENT si c'est une livraison
-        if type_service == 'Livraison' and delivery_address and delivery_address != '':
-            print(f"🗺️ Vérification de l'adresse...")
-            address_info = verify_address(delivery_address)
-            
-            if address_info['valid']:
-                distance_km = calculate_distance(RESTAURANT_COORDS, address_info['coordinates'])
-                print(f"✅ Adresse validée - Distance: {distance_km} km")
-                
-                subtotal = analysis.get('prix_total', 0)
-                delivery_fee = calculate_delivery_fee(distance_km, subtotal)
-                print(f"💰 Frais de livraison: {delivery_fee}€ (sous-total: {subtotal}€)")
-            else:
-                print(f"⚠️ Adresse non validée: {address_info.get('error', 'Erreur inconnue')}")
-        else:
-            print(f"✅ Pas de frais de livraison (type: {type_service})")
+    except Exception as e:
+        logger.exception("❌ Erreur critique du webhook: %s", e)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+def traiter_appel(call_id, transcript, from_number):
+    """Dédoublonne puis traite un appel - utilisé par le webhook et par les workers"""
+    with contexte_appel(call_id=call_id):
+        with Chronometre('dedup') as mesure:
+            existing_order_id = dedup.reserver(call_id)
         
-        # Calculer le total
-        subtotal = analysis.get('prix_total', 0)
-        total = subtotal + delivery_fee
+        if existing_order_id == EN_COURS:
+            deduplication.inc('en_cours')
+            evenement(logger, 'doublon', "⚠️ Appel déjà en cours de traitement", resultat='en_cours', duree_ms=mesure.ms)
+            return {'status': 'duplicate', 'call_id': call_id}, 200
+        if existing_order_id:
+            deduplication.inc('doublon')
+            evenement(logger, 'doublon', "⚠️ Appel déjà traité", resultat='doublon',
+                      order_id=existing_order_id, duree_ms=mesure.ms)
+            return {'status': 'duplicate', 'call_id': call_id, 'order_id': existing_order_id}, 200
         
-        # Préparer les items avec gestion robuste des articles multiples
-        print(f"\n📦 Préparation des articles...")
-        items = []
-        if 'articles_detailles' in analysis and analysis['articles_detailles']:
-            print(f"✅ {len(analysis['articles_detailles'])} article(s) détecté(s)")
-            for art in analysis['articles_detailles']:
-                try:
-                    item = {
-                        'name': str(art.get('nom', 'Article')),
-                        'quantity': int(art.get('quantite', 1)),
-                        'unit_price': float(art.get('prix', 0)),
-                        'total_price': float(art.get('prix', 0)) * int(art.get('quantite', 1))
-                    }
-                    items.append(item)
-                    print(f"   - {item['quantity']}× {item['name']} = {item['total_price']}€")
-                except Exception as e:
-                    print(f"⚠️ Erreur sur un article: {e}")
-                    items.append({
-                        'name': 'Article',
-                        'quantity': 1,
-                        'unit_price': 0,
-                        'total_price': 0
-                    })
-        else:
-            print(f"⚠️ Aucun article détaillé, création d'un article par défaut")
-            items = [{
-                'name': analysis.get('articles', 'Non spécifié'),
-                'quantity': 1,
-                'unit_price': subtotal,
-                'total_price': subtotal
-            }]
+        deduplication.inc('nouveau')
         
-        # Créer la commande
-        order = {
-            'call_id': call_id,
-            'phone_number': from_number,
-            'timestamp': datetime.now().isoformat(),
-            'type_appel': analysis.get('type_appel', 'commande'),
-            'type_service': type_service,
-            'items': items,
-            'delivery_address': delivery_address if type_service == 'Livraison' else '',
-            'address_verified': address_info.get('valid', False),
-            'formatted_address': address_info.get('formatted_address', delivery_address) if type_service == 'Livraison' else '',
-            'distance_km': distance_km,
-            'subtotal': subtotal,
-            'delivery_fee': delivery_fee,
-            'delivery_fee_waived': delivery_fee == 0 and subtotal > 20 and type_service == 'Livraison',
-            'total': total,
-            'notes': analysis.get('notes', ''),
-            'status': 'pending',
-            'transcript': transcript[:500]
-        }
-        
-        # Sauvegarder dans Firebase
-        print(f"\n💾 Sauvegarde dans Firebase...")
         try:
-            new_order_ref = ref.push(order)
-            print(f"✅ Commande sauvegardée avec succès (ID: {new_order_ref.key})")
-        except Exception as e:
-            print(f"❌ ERREUR FIREBASE: {e}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({'status': 'error', 'message': f'Erreur Firebase: {str(e)}'}), 500
-        
-        print(f"\n{'='*70}")
-        print(f"✅ COMMANDE TRAITÉE AVEC SUCCÈS")
-        print(f"{'='*70}")
-        print(f"ID Commande: {new_order_ref.key}")
-        print(f"Call ID: {call_id}")
-        print(f"Téléphone: {from_number}")
-        print(f"Type: {type_service}")
-        print(f"Articles: {len(items)}")
-        print(f"Total: {total}€")
-        print(f"{'='*70}\n")
+            return traiter_commande(call_id, transcript, from_number)
+        finally:
+            dedup.liberer(call_id)
+
+def traiter_job(payload):
+    """Handler des workers de la file d'attente"""
+    with profileur.requete():
+        return traiter_appel(payload['call_id'], payload['transcript'], payload['from_number'])
+
+def lancer_geocodage_regex(anticipation, transcript):
+    """Géocodage spéculatif : adresse trouvée par regex, géocodée pendant l'analyse"""
+    if 'livr' in transcript.lower():
+        adresse_regex = extraire_adresse_manuel(texte_client(transcript))
+        if adresse_regex:
+            anticipation.lancer(adresse_regex, 'regex')
+
+def adresse_a_geocoder(analysis):
+    """Adresse de livraison à vérifier, ou '' si la commande n'est pas une livraison"""
+    if analysis.get('type_service', 'Non spécifié') == 'Livraison':
+        return analysis.get('adresse_livraison', '') or ''
+    return ''
+
+def traiter_commande(call_id, transcript, from_number):
+    """Analyse, calcule les frais et enregistre la commande - retourne (réponse, code HTTP)"""
+    debut = time.perf_counter()
+    timings = {}
+    
+    anticipation = GeocodageAnticipe(localiser_adresse, client_nominatim.abandonner)
+    lancer_geocodage_regex(anticipation, transcript)
+    
+    # ... et dès que le streaming OpenAI fournit l'adresse
+    def on_champs(type_service, adresse):
+        if type_service == 'Livraison' and adresse:
+            anticipation.lancer(adresse, 'stream')
+    
+    # Analyser la commande
+    etape = time.perf_counter()
+    analysis = analyser_commande(transcript, on_champs=on_champs)
+    timings['analyse'] = round((time.perf_counter() - etape) * 1000, 1)
+    
+    if not analysis:
+        anticipation.annuler()
+        logger.error("❌ Analyse impossible")
+        return {'status': 'error', 'message': 'Analyse impossible'}, 500
+    
+    # Géocoder l'adresse SEULEMENT si c'est une livraison
+    address_info = None
+    delivery_address = adresse_a_geocoder(analysis)
+    if delivery_address:
+        client_nominatim.prioriser(delivery_address)
+        address_info = anticipation.resultat(delivery_address)
+        timings['geocodage'] = anticipation.mesure
+    else:
+        anticipation.annuler()
+    
+    return finaliser_commande(call_id, transcript, from_number, analysis, address_info, timings, debut)
+
+def finaliser_commande(call_id, transcript, from_number, analysis, address_info, timings, debut):
+    """Frais de livraison, articles et enregistrement (partagé par les modes sync et async)"""
+    type_service = analysis.get('type_service', 'Non spécifié')
+    delivery_address = analysis.get('adresse_livraison', '')
+    distance_km = 0
+    delivery_fee = 0
+    
+    # Calculer les frais de livraison UNIQUEMENT si c'est une livraison
+    if address_info is not None:
+        mesure = timings.get('geocodage', {})
+        observer_etape('geocode_wait', mesure.get('attente_ms', 0.0) / 1000)
         
-        return jsonify({
-            'status': 'success',
-            'order_id': new_order_ref.key,
-            'call_id': call_id,
-            'total': total,
-            'delivery_fee': delivery_fee
-        }), 200
+        if address_info['valid']:
+            distance_km = address_info['distance_km']
+            subtotal = analysis.get('prix_total', 0)
+            with Chronometre('fee'):
+                delivery_fee = calculate_delivery_fee(address_info['coordinates'], subtotal)
         
+        evenement(logger, 'livraison', "📍 Adresse de livraison traitée", adresse=delivery_address,
+                  valide=address_info['valid'], erreur=address_info.get('error'), distance_km=distance_km,
+                  frais=delivery_fee, **mesure)
+    address_info = address_info or {'valid': False}
+    
+    # Calculer le total
+    subtotal = analysis.get('prix_total', 0)
+    total = subtotal + delivery_fee
+    
+    # Préparer les items avec gestion robuste des articles multiples
+    items = []
+    if 'articles_detailles' in analysis and analysis['articles_detailles']:
+        for art in analysis['articles_detailles']:
+            try:
+                item = {
+                    'name': str(art.get('nom', 'Article')),
+                    'quantity': int(art.get('quantite', 1)),
+                    'unit_price': float(art.get('prix', 0)),
+                    'total_price': float(art.get('prix', 0)) * int(art.get('quantite', 1))
+                }
+                items.append(item)
+            except Exception as e:
+                logger.warning("⚠️ Erreur sur un article: %s", e)
+                items.append({
+                    'name': 'Article',
+                    'quantity': 1,
+                    'unit_price': 0,
+                    'total_price': 0
+                })
+    else:
+        logger.warning("⚠️ Aucun article détaillé, création d'un article par défaut")
+        items = [{
+            'name': analysis.get('articles', 'Non spécifié'),
+            'quantity': 1,
+            'unit_price': subtotal,
+            'total_price': subtotal
+        }]
+    
+    # Créer la commande
+    order = {
+        'call_id': call_id,
+        'phone_number': from_number,
+        'timestamp': datetime.now().isoformat(),
+        'type_appel': analysis.get('type_appel', 'commande'),
+        'type_service': type_service,
+        'items': items,
+        'delivery_address': delivery_address if type_service == 'Livraison' else '',
+        'address_verified': address_info.get('valid', False),
+        'formatted_address': address_info.get('formatted_address', delivery_address) if type_service == 'Livraison' else '',
+        'distance_km': distance_km,
+        'subtotal': subtotal,
+        'delivery_fee': delivery_fee,
+        'delivery_fee_waived': delivery_fee == 0 and subtotal > PALIERS_LIVRAISON.seuil_gratuit and type_service == 'Livraison',
+        'total': total,
+        'notes': analysis.get('notes', ''),
+        'analysis_tier': analysis.get('tier', 'llm'),
+        'status': 'pending',
+        'transcript': transcript[:500]
+    }
+    
+    # Coordonnées gardées pour recalculer les frais si les paliers changent (delivery_zones.py)
+    if address_info.get('valid') and type_service == 'Livraison':
+        order['delivery_coordinates'] = list(address_info['coordinates'])
+    
+    # Sauvegarder dans Firebase : résumé + détails + index call_id en une seule écriture atomique
+    etape = time.perf_counter()
+    order_id = generer_id_push()
+    updates = chemins_commande(order_id, order)
+    updates.update(dedup.chemins_index(call_id, order_id))
+    # Statistiques de ventes du jour et de l'heure, incrémentées dans la même écriture
+    updates.update(chemins_statistiques(order_id, order))
+    try:
+        if boite_envoi is not None:
+            # Enregistrement local durable ; l'envoi à Firebase se fait par lots en arrière-plan
+            with Chronometre('outbox_enqueue'):
+                boite_envoi.ajouter(updates, cle=order_id)
+        else:
+            with Chronometre('firebase_push'):
+                db.reference().update(updates)
+        dedup.confirmer(call_id, order_id)
     except Exception as e:
-        print(f"\n{'='*70}")
-        print(f"❌ ERREUR CRITIQUE")
-        print(f"{'='*70}")
-        print(f"Erreur: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        print(f"{'='*70}\n")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        logger.exception("❌ Erreur Firebase: %s", e)
+        return {'status': 'error', 'message': f'Erreur Firebase: {str(e)}'}, 500
+    timings['sauvegarde'] = round((time.perf_counter() - etape) * 1000, 1)
+    timings['total'] = round((time.perf_counter() - debut) * 1000, 1)
+    
+    evenement(logger, 'commande_enregistree', "✅ Commande traitée", order_id=order_id,
+              type_service=type_service, articles=len(items), total=total, frais=delivery_fee,
+              niveau_analyse=order['analysis_tier'], timings_ms=timings)
+    
+    return {
+        'status': 'success',
+        'order_id': order_id,
+        'call_id': call_id,
+        'total': total,
+        'delivery_fee': delivery_fee,
+        'timings_ms': timings
+    }, 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """État d'un appel traité en mode asynchrone"""
+    if file_travaux is None:
+        return jsonify({'status': 'error', 'message': 'Mode asynchrone désactivé'}), 404
+    
+    job = file_travaux.statut(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Travail inconnu'}), 404
+    return jsonify(job), 200
+
+if WEBHOOK_MODE == 'async':
+    file_travaux = FileTravaux()
+    PoolWorkers(file_travaux, traiter_job).demarrer()
+
+@app.route('/admin/archive', methods=['POST'])
+def admin_archive():
+    """Lance un passage d'archivage immédiat (appelable par un planificateur externe)"""
+    if not admin_autorise():
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 403
+    archives = archiver()
+    return jsonify({'status': 'success', 'archived': archives, 'total': sum(archives.values())}), 200
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile_start():
+    """Démarre une session de profilage : ?duration=60&interval_ms=10[&sample=N pour 1 requête webhook sur N]"""
+    if not admin_autorise():
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 403
+    try:
+        duree = float(request.args.get('duration', 60))
+        intervalle = float(request.args.get('interval_ms', PROFILE_INTERVAL_MS))
+        une_sur = int(request.args['sample']) if request.args.get('sample') else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Paramètre invalide'}), 400
+    if une_sur is not None and une_sur < 1:
+        return jsonify({'status': 'error', 'message': 'sample doit être >= 1'}), 400
+    if not profileur.demarrer(duree, intervalle, une_sur):
+        return jsonify({'status': 'error', 'message': 'Profilage déjà en cours', 'profile': profileur.etat()}), 409
+    return jsonify({'status': 'started', 'profile': profileur.etat()}), 202
+
+@app.route('/admin/profile', methods=['GET'])
+def admin_profile_status():
+    """État de la session de profilage en cours ou terminée"""
+    if not admin_autorise():
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 403
+    return jsonify(profileur.etat()), 200
+
+@app.route('/admin/profile', methods=['DELETE'])
+def admin_profile_stop():
+    """Arrête la session avant la fin de sa durée"""
+    if not admin_autorise():
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 403
+    profileur.arreter()
+    return jsonify({'status': 'stopped', 'profile': profileur.etat()}), 200
+
+@app.route('/admin/profile/stacks', methods=['GET'])
+def admin_profile_stacks():
+    """Piles repliées de la dernière session (flamegraph.pl, speedscope, inferno)"""
+    if not admin_autorise():
+        return jsonify({'status': 'error', 'message': 'Non autorisé'}), 403
+    nom = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    return Response(profileur.piles_repliees(), mimetype='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename={nom}'})
+
+@app.route('/api/archive/<jour>', methods=['GET'])
+def archive_totals(jour):
+    """Totaux pré-calculés d'un jour archivé (AAAA-MM-JJ)"""
+    try:
+        datetime.strptime(jour, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Date invalide (AAAA-MM-JJ)'}), 400
+    return jsonify({'date': jour, 'totals': totaux_jour(jour)}), 200
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    """Statistiques de ventes pré-agrégées : ?depuis=AAAA-MM-JJ&jusqua=AAAA-MM-JJ&par_heure=1&top=10"""
+    aujourdhui = datetime.fromtimestamp(time.time(), tz=fuseau_restaurant()).strftime('%Y-%m-%d')
+    depuis = request.args.get('depuis', aujourdhui)
+    jusqua = request.args.get('jusqua', depuis)
+    try:
+        for jour in (depuis, jusqua):
+            datetime.strptime(jour, '%Y-%m-%d')
+        top = int(request.args.get('top', STATS_TOP_ITEMS))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Paramètres invalides (dates AAAA-MM-JJ, top entier)'}), 400
+    if jusqua < depuis:
+        return jsonify({'status': 'error', 'message': 'jusqua doit suivre depuis'}), 400
+    par_heure = request.args.get('par_heure') == '1'
+    return jsonify(lire_statistiques(depuis, jusqua, par_heure=par_heure, top=top)), 200
+
+@app.route('/analyse/stats', methods=['GET'])
+def analyse_stats():
+    """Taux d'utilisation de l'analyse rapide / GPT-4o / fallback, pour régler le seuil"""
+    return jsonify(statistiques_routage()), 200
+
+@registre.collecteur
+def metriques_composants():
+    """Compteurs déjà tenus par les composants, lus au moment de la collecte"""
+    cache = geocache.stats()
+    familles = [
+        ('geocache_lookups_total', 'counter', "Lectures du cache de géocodage par résultat", [
+            ({'result': 'memoire'}, cache['hits_memoire']),
+            ({'result': 'disque'}, cache['hits_disque']),
+            ({'result': 'miss'}, cache['misses'])
+        ]),
+        ('geocode_prefetch_total', 'counter', "Géocodages anticipés par événement et origine", [
+            ({'event': cle.split('_', 1)[0], 'origin': cle.split('_', 1)[1]}, n)
+            for cle, n in sorted(statistiques_anticipation().items())
+        ])
+    ]
+    logs = statistiques_logs()
+    familles.append(('log_dropped_total', 'counter', "Enregistrements de log abandonnés (file pleine)", [({}, logs['abandons'])]))
+    familles.append(('nominatim_queue_depth', 'gauge', "Demandes Nominatim en attente d'un jeton",
+                     [({}, client_nominatim.taille_file())]))
+    replique = replique_commandes.stats()
+    familles.append(('replica_orders', 'gauge', "Commandes dans la réplique locale", [({}, replique['commandes'])]))
+    if boite_envoi is not None:
+        envoi = boite_envoi.stats()
+        familles += [
+            ('outbox_pending', 'gauge', "Écritures Firebase en attente dans la boîte d'envoi", [({}, envoi['en_attente'])]),
+            ('outbox_oldest_seconds', 'gauge', "Âge de la plus ancienne écriture en attente", [({}, envoi['plus_ancienne_s'])])
+        ]
+    return familles
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques au format Prometheus (durées par étape, tokens, taux de cache)"""
+    return Response(exposer(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'service': 'Chicken Hot Dreux - Order System'
+        'service': 'Chicken Hot Dreux - Order System',
+        'geocache': geocache.stats(),
+        'openai': openai_client.stats(),
+        'geocodage_anticipe': statistiques_anticipation(),
+        'replique': replique_commandes.stats(),
+        'flux_commandes': journal_commandes.stats(),
+        'boite_envoi': boite_envoi.stats() if boite_envoi is not None else None,
+        'logs': statistiques_logs(),
+        'demarrage': demarrage.stats(),
+        'disjoncteurs': etat_dependances(),
+        'nominatim': client_nominatim.stats()
     }), 200
 
+# Initialisations coûteuses : pendant l'import (eager) ou en arrière-plan (lazy, défaut)
+if STARTUP_MODE == 'eager':
+    initialiser_services()
+    prechauffer(connexion_openai=False)
+    if OPENAI_WARMUP:
+        openai_client.prechauffer_en_arriere_plan()
+else:
+    demarrage.en_arriere_plan('services', initialiser_services)
+    if STARTUP_WARMUP:
+        demarrage.en_arriere_plan('prechauffage', prechauffer)
+
+demarrage.fin_import()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"🚀 Démarrage serveur sur port {port}")
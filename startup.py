@@ -0,0 +1,159 @@
+"""
+Démarrage à froid : initialisations différées et mesure du temps de démarrage
+
+Importé en premier par server.py, ce module note l'instant où le chargement
+du serveur commence. Les initialisations coûteuses (Firebase, réplique,
+gazetteer, SDK OpenAI) sont lancées dans des threads d'arrière-plan ou faites
+à la première utilisation (une_fois), pour que /health réponde au plus tôt.
+Une initialisation une_fois en échec n'est pas mémorisée : l'appelant reçoit
+InitialisationEchouee (et se rabat sur autre chose), puis elle est retentée.
+
+Mesures exposées dans /health → demarrage :
+- processus_ms : du lancement du processus au début de l'import du serveur
+  (interpréteur, gunicorn ; Linux uniquement)
+- import_ms : import de server.py, jusqu'à ce que l'application soit prête
+- premiere_requete_ms / premier_webhook_ms : du lancement du processus à la
+  première réponse
+- taches : durée et erreur éventuelle de chaque initialisation différée
+"""
+
+import os
+import threading
+import time
+
+DEBUT = time.perf_counter()
+
+# 'lazy' (défaut) : initialisations en arrière-plan ; 'eager' : tout pendant l'import
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'lazy')
+# Préchauffage en arrière-plan (imports, gazetteer, client OpenAI) en mode lazy
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', '1') == '1'
+# Objectif de temps avant que le serveur puisse répondre (processus + import)
+STARTUP_TARGET_MS = float(os.environ.get('STARTUP_TARGET_MS', 3000))
+# Délai avant de retenter une initialisation une_fois en échec (s)
+STARTUP_RETRY_SECONDS = float(os.environ.get('STARTUP_RETRY_SECONDS', 30))
+
+
+class InitialisationEchouee(Exception):
+    """Initialisation une_fois en échec (récent) : l'appelant doit s'en passer"""
+
+    def __init__(self, nom, erreur):
+        super().__init__(f"Initialisation '{nom}' indisponible: {erreur}")
+        self.nom = nom
+
+
+def _age_processus_ms():
+    """Temps écoulé depuis le lancement du processus (None hors Linux)"""
+    try:
+        with open('/proc/self/stat') as f:
+            champs = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        debut_s = int(champs[19]) / os.sysconf('SC_CLK_TCK')
+        return max(0.0, (uptime - debut_s) * 1000)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Demarrage:
+    """Chronologie du démarrage du processus et initialisations différées"""
+
+    def __init__(self, debut=DEBUT):
+        self.debut = debut
+        self.processus_ms = _age_processus_ms()
+        self.import_ms = None
+        self.premieres = {}
+        self._lock = threading.Lock()
+        self._taches = {}
+        self._valeurs = {}
+        self._verrous = {}
+        self._echecs = {}
+
+    def _depuis_lancement_ms(self):
+        return (self.processus_ms or 0.0) + (time.perf_counter() - self.debut) * 1000
+
+    def fin_import(self):
+        """À la fin de l'import du serveur : l'application peut répondre"""
+        self.import_ms = round((time.perf_counter() - self.debut) * 1000, 1)
+        pret_ms = self.pret_ms()
+        if pret_ms > STARTUP_TARGET_MS:
+            print(f"⚠️ Serveur prêt en {pret_ms:.0f} ms (objectif {STARTUP_TARGET_MS:.0f} ms)")
+        else:
+            print(f"🚀 Serveur prêt en {pret_ms:.0f} ms (import {self.import_ms:.0f} ms, mode {STARTUP_MODE})")
+
+    def pret_ms(self):
+        return round((self.processus_ms or 0.0) + (self.import_ms or 0.0), 1)
+
+    def requete_servie(self, type_requete):
+        """Note la première requête servie (et la première de chaque type)"""
+        if type_requete in self.premieres and 'requete' in self.premieres:
+            return
+        with self._lock:
+            instant = round(self._depuis_lancement_ms(), 1)
+            self.premieres.setdefault('requete', instant)
+            self.premieres.setdefault(type_requete, instant)
+
+    def executer(self, nom, fonction, relancer=False):
+        """Exécute une initialisation et enregistre sa durée (et son erreur, relancée si demandé)"""
+        debut = time.perf_counter()
+        erreur = None
+        try:
+            return fonction()
+        except Exception as e:
+            erreur = str(e)
+            print(f"❌ Initialisation '{nom}' en erreur: {e}")
+            if relancer:
+                raise
+        finally:
+            with self._lock:
+                self._taches[nom] = {
+                    'ms': round((time.perf_counter() - debut) * 1000, 1),
+                    'erreur': erreur
+                }
+
+    def en_arriere_plan(self, nom, fonction):
+        """Lance une initialisation dans un thread, sans retarder l'import"""
+        thread = threading.Thread(target=self.executer, args=(nom, fonction), name=f'init-{nom}', daemon=True)
+        thread.start()
+        return thread
+
+    def une_fois(self, nom, fonction):
+        """
+        Valeur calculée au premier appel réussi (préchauffage ou première requête), puis réutilisée.
+        Lève InitialisationEchouee si l'initialisation échoue, ou a échoué il y a moins de
+        STARTUP_RETRY_SECONDS : rien n'est mémorisé et l'appel suivant la retente.
+        """
+        if nom in self._valeurs:
+            return self._valeurs[nom]
+        with self._lock:
+            verrou = self._verrous.setdefault(nom, threading.Lock())
+        with verrou:
+            if nom not in self._valeurs:
+                echec = self._echecs.get(nom)
+                if echec is not None and time.monotonic() - echec[0] < STARTUP_RETRY_SECONDS:
+                    raise InitialisationEchouee(nom, echec[1])
+                try:
+                    self._valeurs[nom] = self.executer(nom, fonction, relancer=True)
+                except Exception as e:
+                    self._echecs[nom] = (time.monotonic(), e)
+                    raise InitialisationEchouee(nom, e) from e
+                self._echecs.pop(nom, None)
+        return self._valeurs[nom]
+
+    def stats(self):
+        with self._lock:
+            taches = dict(self._taches)
+            premieres = dict(self.premieres)
+        return {
+            'mode': STARTUP_MODE,
+            'processus_ms': round(self.processus_ms, 1) if self.processus_ms is not None else None,
+            'import_ms': self.import_ms,
+            'pret_ms': self.pret_ms(),
+            'objectif_ms': STARTUP_TARGET_MS,
+            'objectif_respecte': self.pret_ms() <= STARTUP_TARGET_MS,
+            'premiere_requete_ms': premieres.get('requete'),
+            'premier_webhook_ms': premieres.get('webhook'),
+            'taches': taches
+        }
+
+
+demarrage = Demarrage()
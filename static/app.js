@@ -1,8 +1,15 @@
-// Configuration Firebase
-const FIREBASE_URL = 'https://chicken-hot-dreux-default-rtdb.europe-west1.firebasedatabase.app';
+// Flux des commandes servi par le serveur (Server-Sent Events)
+const STREAM_URL = '/orders/stream';
 
 let orders = {};
 let isFirstLoad = true;
+// Détails des commandes (transcription, adresse complète), chargés quand une carte est dépliée
+let details = {};
+
+// Fonction pour échapper le texte libre (transcription)
+function escapeHTML(text) {
+    return String(text).replace(/[&<>"]/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;' }[c]));
+}
 
 // Fonction pour formater la date/heure
 function formatDateTime(isoString) {
@@ -85,6 +92,29 @@ function createOrderHTML(orderId, order) {
         </div>
     ` : '';
     
+    // Détails à la demande
+    let detailsHTML = '';
+    if (order.has_details) {
+        const orderDetails = details[orderId];
+        detailsHTML = `
+            <button class="details-toggle" onclick="toggleDetails('${orderId}')">
+                ${orderDetails ? 'Masquer' : 'Détails'}
+            </button>
+        `;
+        if (orderDetails) {
+            detailsHTML += `
+                <div class="order-details">
+                    ${orderDetails.formatted_address ? `
+                        <p><strong>📍 Adresse complète:</strong> ${escapeHTML(orderDetails.formatted_address)}</p>
+                    ` : ''}
+                    ${orderDetails.transcript ? `
+                        <p class="transcript"><strong>📞 Transcription:</strong><br>${escapeHTML(orderDetails.transcript)}</p>
+                    ` : ''}
+                </div>
+            `;
+        }
+    }
+    
     return `
         <div class="order-card" data-type="${typeService}" data-id="${orderId}">
             <div class="order-header">
@@ -117,12 +147,44 @@ function createOrderHTML(orderId, order) {
             </div>
             
             ${notesHTML}
+            
+            ${detailsHTML}
         </div>
     `;
 }
 
+// Fonction pour déplier / replier les détails d'une commande
+function toggleDetails(orderId) {
+    const redraw = () => {
+        const card = document.querySelector(`[data-id="${orderId}"]`);
+        if (card && orders[orderId]) {
+            const tempDiv = document.createElement('div');
+            tempDiv.innerHTML = createOrderHTML(orderId, orders[orderId]);
+            card.replaceWith(tempDiv.firstElementChild);
+        }
+    };
+    
+    if (details[orderId]) {
+        delete details[orderId];
+        redraw();
+        return;
+    }
+    
+    fetch(`/api/orders/${orderId}/details`)
+        .then(response => response.json())
+        .then(data => {
+            details[orderId] = data.details || {};
+            redraw();
+        })
+        .catch(error => {
+            console.error('Erreur:', error);
+        });
+}
+
 // Fonction pour comparer si deux commandes sont identiques
 function ordersAreEqual(order1, order2) {
+    // Les commandes non modifiées par le flux gardent le même objet
+    if (order1 === order2) return true;
     return JSON.stringify(order1) === JSON.stringify(order2);
 }
 
@@ -210,31 +272,34 @@ function updateOrders(newOrders) {
 
 // Fonction pour écouter les nouvelles commandes en temps réel
 function listenToOrders() {
-    const ordersRef = `${FIREBASE_URL}/orders.json`;
-    
-    // Fonction de récupération
-    function fetchOrders() {
-        fetch(ordersRef)
-            .then(response => response.json())
-            .then(data => {
-                if (data) {
-                    updateOrders(data);
-                    orders = data;
-                } else {
-                    updateOrders({});
-                    orders = {};
-                }
-            })
-            .catch(error => {
-                console.error('Erreur:', error);
-            });
-    }
+    // Le serveur envoie un instantané, puis seulement les commandes nouvelles ou modifiées.
+    // En cas de coupure, le navigateur se reconnecte avec Last-Event-ID et reprend au curseur.
+    const source = new EventSource(STREAM_URL);
+    
+    source.addEventListener('snapshot', event => {
+        const data = JSON.parse(event.data).orders || {};
+        updateOrders(data);
+        orders = data;
+    });
     
-    // Première récupération
-    fetchOrders();
+    source.addEventListener('order', event => {
+        const { id, order } = JSON.parse(event.data);
+        const newOrders = { ...orders, [id]: order };
+        updateOrders(newOrders);
+        orders = newOrders;
+    });
+    
+    source.addEventListener('removed', event => {
+        const { id } = JSON.parse(event.data);
+        const newOrders = { ...orders };
+        delete newOrders[id];
+        updateOrders(newOrders);
+        orders = newOrders;
+    });
     
-    // Polling toutes les 5 secondes
-    setInterval(fetchOrders, 5000);
+    source.onerror = () => {
+        console.warn('Flux interrompu, reconnexion automatique...');
+    };
 }
 
 // Fonction pour jouer un son de notification
@@ -0,0 +1,96 @@
+"""
+Lecture incrémentale d'un objet JSON reçu morceau par morceau (streaming OpenAI)
+
+Signale chaque champ de premier niveau dès que sa valeur est complète, sans
+attendre la fin de la réponse : "type_service" et "adresse_livraison" sont
+connus bien avant la fin de la liste "articles".
+"""
+
+import json
+
+
+class ExtracteurJSONIncremental:
+    """Analyse un objet JSON au fil de l'eau et retourne ses champs de premier niveau complets"""
+
+    def __init__(self):
+        self.texte = ''
+        self.champs = {}
+        self._pos = 0
+        self._profondeur = 0
+        self._dans_chaine = False
+        self._echappement = False
+        self._attend_cle = True
+        self._cle_debut = None
+        self._cle = None
+        self._valeur_debut = None
+
+    def ajouter(self, morceau):
+        """Ajoute un morceau de texte ; retourne la liste des (clé, valeur) nouvellement complètes"""
+        self.texte += morceau
+        nouveaux = []
+        texte = self.texte
+
+        while self._pos < len(texte):
+            i = self._pos
+            c = texte[i]
+            self._pos += 1
+
+            if self._dans_chaine:
+                if self._echappement:
+                    self._echappement = False
+                elif c == '\\':
+                    self._echappement = True
+                elif c == '"':
+                    self._dans_chaine = False
+                    if self._profondeur == 1:
+                        if self._cle_debut is not None:
+                            self._cle = json.loads(texte[self._cle_debut:i + 1])
+                            self._cle_debut = None
+                        elif self._valeur_debut is not None:
+                            self._terminer(i + 1, nouveaux)
+                continue
+
+            if c == '"':
+                self._dans_chaine = True
+                if self._profondeur == 1:
+                    if self._attend_cle:
+                        self._cle_debut = i
+                    elif self._valeur_debut is None:
+                        self._valeur_debut = i
+            elif c in '{[':
+                self._profondeur += 1
+                if self._profondeur == 2 and self._valeur_debut is None:
+                    self._valeur_debut = i
+            elif c in '}]':
+                if self._profondeur == 1 and self._valeur_debut is not None:
+                    # Valeur simple (nombre, booléen, null) en fin d'objet
+                    self._terminer(i, nouveaux)
+                self._profondeur -= 1
+                if self._profondeur == 1 and self._valeur_debut is not None:
+                    self._terminer(i + 1, nouveaux)
+            elif self._profondeur == 1:
+                if c == ':':
+                    self._attend_cle = False
+                elif c == ',':
+                    if self._valeur_debut is not None:
+                        self._terminer(i, nouveaux)
+                    self._attend_cle = True
+                elif not c.isspace() and self._valeur_debut is None and not self._attend_cle:
+                    self._valeur_debut = i
+
+        return nouveaux
+
+    def _terminer(self, fin, nouveaux):
+        brut = self.texte[self._valeur_debut:fin].strip()
+        self._valeur_debut = None
+        try:
+            valeur = json.loads(brut)
+        except json.JSONDecodeError:
+            return
+        self.champs[self._cle] = valeur
+        nouveaux.append((self._cle, valeur))
+
+    @property
+    def termine(self):
+        """Vrai quand l'objet de premier niveau est fermé"""
+        return self._profondeur == 0 and self._pos > 0 and self.texte.strip().endswith('}')
@@ -0,0 +1,42 @@
+"""Recherche dans le gazetteer local : communes hors de l'index renvoyées à Nominatim"""
+
+from gazetteer import Gazetteer
+
+
+def gazetteer():
+    return Gazetteer([
+        {'nom': 'Rue de Chartres', 'commune': 'Dreux', 'code_postal': '28100',
+         'numeros': [[2, 48.7361, 1.3655], [12, 48.7352, 1.3641], [30, 48.7340, 1.3620]]},
+        {'nom': 'Rue Saint-Martin', 'commune': 'Dreux', 'code_postal': '28100',
+         'numeros': [[1, 48.7370, 1.3680], [15, 48.7378, 1.3702]]},
+        {'nom': 'Avenue du Général Leclerc', 'commune': 'Vernouillet', 'code_postal': '28500',
+         'numeros': [[1, 48.7210, 1.3600], [5, 48.7205, 1.3612], [20, 48.7190, 1.3640]]},
+    ])
+
+
+def test_commune_inconnue_apres_la_virgule():
+    assert gazetteer().rechercher("12 rue de la gare, Chartres") is None
+
+
+def test_code_postal_hors_zone():
+    assert gazetteer().rechercher("12 rue de la gare, 75010 Paris") is None
+
+
+def test_rue_homonyme_dans_une_autre_ville():
+    assert gazetteer().rechercher("5 avenue du general leclerc, Paris") is None
+
+
+def test_commune_de_la_zone():
+    resultat = gazetteer().rechercher("5 avenue du general leclerc, 28500 Vernouillet")
+    assert resultat['formatted_address'] == '5 Avenue du Général Leclerc, 28500 Vernouillet'
+    assert resultat['numero_exact']
+
+
+def test_sans_commune():
+    resultat = gazetteer().rechercher("12 rue de chartres")
+    assert resultat['formatted_address'] == '12 Rue de Chartres, 28100 Dreux'
+
+
+def test_commune_de_la_zone_apres_la_virgule():
+    resultat = gazetteer().rechercher("au 15 rue saint martin, Dreux")
+    assert resultat['formatted_address'] == '15 Rue Saint-Martin, 28100 Dreux'
@@ -0,0 +1,89 @@
+"""Non-régression de l'analyse rapide (quantités, tailles, adresses)"""
+
+from order_analyzer import SEUIL_CONFIANCE
+from quick_parser import analyser_commande_rapide
+
+
+def articles(transcript):
+    resultat, _, _ = analyser_commande_rapide(transcript)
+    return [(art['nom'], art['quantite']) for art in resultat['articles_detailles']]
+
+
+def confiance(transcript):
+    return analyser_commande_rapide(transcript)[1]
+
+
+def total(transcript):
+    return analyser_commande_rapide(transcript)[0]['prix_total']
+
+
+def test_quantite_en_lettres_avec_taille_apres():
+    assert articles("trois menus wings x10 sur place") == [('Menu Wings x10', 3)]
+
+
+def test_quantite_en_chiffres_avec_taille_apres():
+    assert articles("3 menus wings x10 sur place") == [('Menu Wings x10', 3)]
+
+
+def test_quantite_juste_devant_le_produit_avec_taille_apres():
+    assert articles("un curry et trois wings x10 à emporter") == [('Menu Curry', 1), ('Wings x10', 3)]
+
+
+def test_taille_juste_devant_le_produit():
+    assert articles("deux menus 10 wings à emporter") == [('Menu Wings x10', 2)]
+    assert articles("10 wings en menu à emporter") == [('Menu Wings x10', 1)]
+
+
+def test_quantite_avant_la_formule():
+    assert articles("trois menus tenders sur place") == [('Menu Tenders x7', 3)]
+
+
+def test_taille_en_nombre_nu_apres_le_produit():
+    assert articles("Un menu tenders 14 à emporter") == [('Menu Tenders x14', 1)]
+    assert total("Un menu tenders 14 à emporter") == 14.50
+    assert articles("Un menu wings 10 sur place") == [('Menu Wings x10', 1)]
+    assert total("Un menu wings 10 sur place") == 10.00
+
+
+def test_nombre_nu_sans_taille_correspondante_passe_a_gpt():
+    assert confiance("Un menu wings 4 sur place") < SEUIL_CONFIANCE
+
+
+def test_nombre_nu_du_produit_suivant():
+    assert articles("un menu wings trois menus tenders à emporter") == [('Menu Wings x6', 1), ('Menu Tenders x7', 3)]
+
+
+def test_negation_passe_a_gpt():
+    assert confiance("Pas de wings, juste un menu curry à emporter") < SEUIL_CONFIANCE
+
+
+def test_accompagnement_d_un_menu_passe_a_gpt():
+    assert confiance("Un menu enfant avec les nuggets à emporter") < SEUIL_CONFIANCE
+
+
+def test_article_sous_entendu_passe_a_gpt():
+    assert confiance("Un menu curry pour moi et un pour ma femme à emporter") < SEUIL_CONFIANCE
+    assert confiance("Un menu curry et un autre sur place") < SEUIL_CONFIANCE
+    assert confiance("Un menu curry et un sur place") < SEUIL_CONFIANCE
+
+
+def test_precision_sur_une_partie_passe_a_gpt():
+    assert confiance("Deux menus curry dont un seul à emporter") < SEUIL_CONFIANCE
+
+
+def test_quantite_ou_taille_ambigue_passe_a_gpt():
+    assert confiance("quatre wings à emporter") < SEUIL_CONFIANCE
+
+
+def test_adresse_avec_mots_parasites_passe_a_gpt():
+    assert confiance("un menu curry en livraison au 12 rue de la gare, un, Dreux") < SEUIL_CONFIANCE
+
+
+def test_adresse_sans_type_de_voie_passe_a_gpt():
+    assert confiance("un menu curry en livraison au 4 les tilleuls à Dreux") < SEUIL_CONFIANCE
+
+
+def test_adresse_complete_reste_au_niveau_rapide():
+    resultat, score, _ = analyser_commande_rapide("un menu curry en livraison au 12 rue de la gare à Dreux")
+    assert resultat['adresse_livraison'] == '12 rue de la gare à dreux'
+    assert score >= SEUIL_CONFIANCE